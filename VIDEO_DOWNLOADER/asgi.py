@@ -3,6 +3,11 @@ ASGI config for VIDEO_DOWNLOADER project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The streaming endpoints (``/api/downloads/<id>/events/``) are async views and
+must be served through this application, e.g.::
+
+    uvicorn VIDEO_DOWNLOADER.asgi:application
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -9,8 +9,13 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 app.conf.beat_schedule = {
-    'cleanup-old-downloads-every-3h': {
+    # Nettoyage incrémental : chaque exécution traite un volume borné
+    'cleanup-old-downloads-every-10min': {
         'task': 'downloader.tasks.cleanup_old_downloads',
-        'schedule': crontab(minute=0, hour='*/3'),
+        'schedule': crontab(minute='*/10'),
+    },
+    'enforce-storage-quota-every-5min': {
+        'task': 'downloader.tasks.enforce_storage_quota',
+        'schedule': crontab(minute='*/5'),
     },
 } 
\ No newline at end of file
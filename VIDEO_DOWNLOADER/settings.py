@@ -121,6 +121,10 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Fichiers téléchargés (MEDIA_ROOT/downloads/)
+MEDIA_ROOT = BASE_DIR
+MEDIA_URL = '/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -148,8 +152,112 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Files Celery : chaque type de travail peut être servi par ses propres workers
+# (le routeur envoie les téléchargements avec fusion/extraction audio vers 'postprocess')
+CELERY_TASK_DEFAULT_QUEUE = 'transfer'
+CELERY_TASK_ROUTES = (
+    'downloader.routing.route_download',
+    {
+        'downloader.tasks.download_bulk_videos_task': {'queue': 'metadata'},
+        'downloader.tasks.expand_playlist_task': {'queue': 'metadata'},
+        'downloader.tasks.cleanup_old_downloads': {'queue': 'maintenance'},
+        'downloader.tasks.enforce_storage_quota': {'queue': 'maintenance'},
+        'downloader.tasks.finish_cancelled_downloads': {'queue': 'maintenance'},
+    },
+)
+# Tâches longues : un worker ne réserve pas de messages qu'il ne peut pas traiter
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
 # Autoriser les requêtes CORS depuis le frontend (localhost:5173)
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",
 ]
+
+# Progression des téléchargements : limite la fréquence des écritures en base
+DOWNLOADER_PROGRESS_FLUSH_INTERVAL = 2.0  # secondes entre deux écritures
+DOWNLOADER_PROGRESS_FLUSH_DELTA = 5  # écart de pourcentage forçant une écriture
+
+# Redis partagé (événements de progression, coordination entre workers)
+DOWNLOADER_REDIS_URL = 'redis://localhost:6379/1'
+DOWNLOADER_EVENTS_PUBLISH_INTERVAL = 0.5  # secondes entre deux événements publiés
+DOWNLOADER_EVENTS_HEARTBEAT = 15  # secondes entre deux keep-alive SSE
+
+# Cache partagé entre le serveur web et les workers Celery
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': DOWNLOADER_REDIS_URL,
+    },
+}
+
+# Les tests utilisent un cache en mémoire (pas de serveur Redis nécessaire)
+TEST_RUNNER = 'VIDEO_DOWNLOADER.test_runner.LocMemCacheTestRunner'
+
+# Cache des métadonnées yt-dlp (formats, titre...)
+# La durée doit rester inférieure à la validité des URLs signées des plateformes
+DOWNLOADER_METADATA_CACHE_TTL = 300  # secondes
+DOWNLOADER_METADATA_CACHE_MAX_ENTRIES = 64  # entrées gardées en mémoire par processus
+
+# Single-flight : durée maximale du verrou d'un téléchargement en cours (couvre les retries)
+DOWNLOADER_INFLIGHT_TTL = 2 * 3600  # secondes
+
+# Nettoyage incrémental des téléchargements (voir cleanup_old_downloads)
+DOWNLOADER_CLEANUP_BATCH_SIZE = 500  # lignes supprimées par requête
+DOWNLOADER_CLEANUP_MAX_BATCHES = 10  # lots au maximum par exécution
+DOWNLOADER_CLEANUP_SHARDS_PER_RUN = 16  # sous-dossiers de downloads/ vérifiés par exécution
+DOWNLOADER_CLEANUP_ORPHAN_GRACE = 24 * 3600  # âge minimal (secondes) d'un fichier orphelin supprimé
+
+# Quota de stockage de MEDIA_ROOT/downloads (éviction LRU au-delà du seuil haut)
+DOWNLOADER_STORAGE_BUDGET = 50 * 1024 ** 3  # octets
+DOWNLOADER_STORAGE_HIGH_WATERMARK = 0.9  # déclenche l'éviction
+DOWNLOADER_STORAGE_LOW_WATERMARK = 0.8  # objectif après éviction
+DOWNLOADER_DEFAULT_TTL = 7 * 24 * 3600  # durée de conservation (secondes) d'un téléchargement terminé
+DOWNLOADER_ACCESS_TOUCH_INTERVAL = 300  # secondes minimum entre deux mises à jour du dernier accès
+
+# Service des fichiers : 'nginx' (X-Accel-Redirect), 'apache' (X-Sendfile) ou None (Django)
+DOWNLOADER_SENDFILE_BACKEND = None
+DOWNLOADER_ACCEL_REDIRECT_PREFIX = '/protected/'  # location interne nginx pointant sur MEDIA_ROOT
+
+# Diffusion progressive (downloads/<id>/stream/)
+DOWNLOADER_STREAM_POLL_INTERVAL = 0.5  # secondes entre deux vérifications du fichier en cours d'écriture
+DOWNLOADER_STREAM_IDLE_TIMEOUT = 120  # secondes sans nouvelles données avant d'interrompre le flux
+
+# Annulation : intervalle (secondes) entre deux lectures du drapeau d'annulation par le worker
+DOWNLOADER_CANCEL_CHECK_INTERVAL = 1.0
+
+# Limite de transferts par plateforme (Platform.max_concurrent_downloads) : délai avant nouvel essai, durée des créneaux
+DOWNLOADER_PLATFORM_SLOT_RETRY_DELAY = 15  # secondes
+DOWNLOADER_PLATFORM_SLOT_TTL = 300  # secondes, renouvelé pendant le transfert ; libère le créneau d'un worker arrêté
+
+# Cache des plateformes en mémoire de chaque processus (invalidé localement par les signaux)
+DOWNLOADER_PLATFORM_CACHE_TTL = 60  # secondes, délai maximal de propagation aux autres processus
+
+# Statistiques (stats/) : durée de fraîcheur, puis ancienne valeur servie pendant le recalcul
+DOWNLOADER_STATS_CACHE_TTL = 10  # secondes
+DOWNLOADER_STATS_STALE_TTL = 300  # secondes
+DOWNLOADER_STATS_WAIT = 2  # secondes d'attente du premier calcul lancé par un autre client (sinon 503)
+DOWNLOADER_TIMESERIES_MAX_POINTS = 1000  # points maximum par série (stats/timeseries/)
+
+# Découverte des formats (formats/) : pool de threads, délai et limite par hôte
+DOWNLOADER_FORMATS_WORKERS = 8  # extractions simultanées par processus (réponse 503 au-delà)
+DOWNLOADER_FORMATS_PER_HOST = 2  # extractions simultanées vers un même hôte
+DOWNLOADER_FORMATS_TIMEOUT = 20  # secondes, attente comprise (réponse 504 au-delà)
+DOWNLOADER_FORMATS_SOCKET_TIMEOUT = 10  # secondes, délai réseau de yt-dlp
+
+# ETag des détails et statuts : jeton d'un téléchargement terminé gardé en cache
+DOWNLOADER_VERSION_CACHE_TTL = 60  # secondes
+
+# Santé (health/) : battements des workers Celery dans Redis, réponse mise en cache par processus
+DOWNLOADER_WORKER_HEARTBEAT_INTERVAL = 10  # secondes, un worker est considéré arrêté après 3 intervalles
+DOWNLOADER_HEALTH_CACHE_TTL = 2  # secondes
+
+# Téléchargements en lot (bulk-download/)
+DOWNLOADER_BULK_MAX_URLS = 50000  # URLs maximum par requête
+DOWNLOADER_BULK_BATCH_SIZE = 1000  # lignes insérées et tâches envoyées par lot
+DOWNLOADER_BULK_MAX_BODY_SIZE = 10 * 1024 * 1024  # taille maximum du corps JSON d'un lot (cette vue uniquement)
+
+# Playlists et chaînes (développement en téléchargements enfants)
+DOWNLOADER_PLAYLIST_BATCH_SIZE = 100  # entrées insérées et lancées par lot
+DOWNLOADER_PLAYLIST_MAX_ENTRIES = 10000  # entrées maximum par playlist
+DOWNLOADER_PLAYLIST_REPAIR_AFTER = 600  # secondes sans nouvelle avant de recompter les vidéos d'une playlist (nettoyage)
@@ -0,0 +1,23 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class LocMemCacheTestRunner(DiscoverRunner):
+    """Lance les tests avec un cache en mémoire à la place de Redis
+
+    Le cache est remplacé pour toute la durée des tests, quelle que soit
+    la commande utilisée (``manage.py test``, ``python -m django test``...).
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_override = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+        })
+        self.cache_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_override.disable()
+        super().teardown_test_environment(**kwargs)
@@ -21,6 +21,7 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from django.conf import settings
 from django.conf.urls.static import static
+from downloader.views import prometheus_metrics
 
 # Configuration Swagger
 schema_view = get_schema_view(
@@ -39,6 +40,7 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('downloader.urls')),
+    path('metrics', prometheus_metrics, name='metrics'),
     
     # Documentation Swagger
     path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
@@ -48,4 +50,4 @@ urlpatterns = [
 
 if settings.DEBUG:
     from pathlib import Path
-    urlpatterns += static('/downloads/', document_root=Path(settings.BASE_DIR) / 'downloads')
+    urlpatterns += static('/downloads/', document_root=Path(settings.MEDIA_ROOT) / 'downloads')
@@ -1,15 +1,19 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.urls import path
 from django.shortcuts import render, redirect
 from django import forms
 from django.utils.html import format_html
 from django.conf import settings
-from .models import Platform, VideoDownload, SupportedFormat
-from .tasks import download_video_task
-import yt_dlp
+from django.utils import timezone
+from .models import DownloadRollup, Platform, VideoDownload, SupportedFormat, StoredFile
+from .bulk import create_bulk_downloads
+from .events import TERMINAL_STATUSES
+from .extraction import get_video_info
+from .playlists import children_finished
+from .rollups import record_finished
+from .search import search
+from .versions import invalidate_versions
 import os
-from urllib.parse import urlparse
-import re
 
 class DownloadFromUrlForm(forms.Form):
     url = forms.URLField(label="URL de la vidéo", required=True)
@@ -26,7 +30,7 @@ class DownloadFromUrlForm(forms.Form):
 
 @admin.register(Platform)
 class PlatformAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'display_name', 'is_active', 'base_url', 'created_at')
+    list_display = ('id', 'name', 'display_name', 'is_active', 'base_url', 'max_concurrent_downloads', 'rate_limit_per_minute', 'created_at')
     search_fields = ('name', 'display_name')
     list_filter = ('is_active',)
     ordering = ('name',)
@@ -44,6 +48,13 @@ class VideoDownloadAdmin(admin.ModelAdmin):
     actions = ['mark_as_completed', 'mark_as_failed']
     change_list_template = "admin/downloader/videodownload_changelist.html"
 
+    def get_search_results(self, request, queryset, search_term):
+        """Recherche via l'index plein texte (recherche LIKE si la base n'en dispose pas)"""
+        results = search(queryset, search_term.split()) if search_term else None
+        if results is None:
+            return super().get_search_results(request, queryset, search_term)
+        return results, False
+
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
@@ -61,79 +72,68 @@ class VideoDownloadAdmin(admin.ModelAdmin):
             url = request.POST.get('url')
             audio_only = bool(request.POST.get('audio_only'))
             if url and 'get_formats' in request.POST:
-                # Utiliser yt-dlp pour détecter les formats
+                # Utiliser yt-dlp pour détecter les formats (via le cache partagé)
                 try:
-                    with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-                        info = ydl.extract_info(url, download=False)
-                        formats = info.get('formats', [])
-                        # On ne garde que les formats combinés (vidéo+audio)
-                        qualities = sorted(set(
-                            str(f.get('height', 'audio'))
-                            for f in formats
-                            if (
-                                (f.get('vcodec') and f['vcodec'] != 'none') and
-                                (f.get('acodec') and f['acodec'] != 'none')
-                            )
-                        ))
-                        if not qualities:
-                            qualities = ['best']
+                    info = get_video_info(url)
+                    formats = info.get('formats', [])
+                    # On ne garde que les formats combinés (vidéo+audio)
+                    qualities = sorted(set(
+                        str(f.get('height', 'audio'))
+                        for f in formats
+                        if (
+                            (f.get('vcodec') and f['vcodec'] != 'none') and
+                            (f.get('acodec') and f['acodec'] != 'none')
+                        )
+                    ))
+                    if not qualities:
+                        qualities = ['best']
                 except Exception as e:
                     context['error'] = f"Erreur lors de la détection des formats : {e}"
             elif url and 'download' in request.POST:
-                # Détecter la plateforme à partir de l'URL
-                platform = self.detect_platform(url)
-                if not platform:
-                    context['error'] = "Impossible de détecter la plateforme pour cette URL."
+                # Même chemin que l'API : réutilisation, rattachement, file Celery et ID de tâche
+                quality = request.POST.get('quality', 'best')
+                result = next(create_bulk_downloads(
+                    [url], quality, audio_only,
+                    ip_address=request.META.get('REMOTE_ADDR'),
+                    user_agent=request.META.get('HTTP_USER_AGENT', ''),
+                ))
+                if result['status'] == 'invalid':
+                    context['error'] = result['error']
                 else:
-                    quality = request.POST.get('quality', 'best')
-                    vd = VideoDownload.objects.create(
-                        source_url=url,
-                        platform=platform,
-                        requested_quality=quality,
-                        download_audio_only=audio_only,
-                        status='pending',
-                    )
-                    download_video_task.delay(str(vd.id))
-                    return redirect(f'../{vd.id}/change/')
+                    return redirect(f'../{result["id"]}/change/')
         form = DownloadFromUrlForm(initial={'url': url}, qualities=qualities)
         context['form'] = form
         context['qualities'] = qualities
         return render(request, 'admin/downloader/download_from_url.html', context)
 
-    def detect_platform(self, url):
-        domain = urlparse(url).netloc.lower()
-        platform_patterns = {
-            'youtube': [r'youtube\\.com', r'youtu\\.be', r'youtube-nocookie\\.com'],
-            'facebook': [r'facebook\\.com', r'fb\\.watch', r'fb\\.com'],
-            'instagram': [r'instagram\\.com', r'instagr\\.am'],
-            'tiktok': [r'tiktok\\.com', r'vm\\.tiktok\\.com'],
-            'twitter': [r'twitter\\.com', r'x\\.com', r't\\.co'],
-            'vimeo': [r'vimeo\\.com', r'player\\.vimeo\\.com'],
-            'dailymotion': [r'dailymotion\\.com', r'dai\\.ly'],
-        }
-        from .models import Platform
-        for platform_name, patterns in platform_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, domain):
-                    try:
-                        return Platform.objects.get(name=platform_name, is_active=True)
-                    except Platform.DoesNotExist:
-                        continue
-        return None
-
     def download_link_admin(self, obj):
         if obj.file_path:
-            url = obj.file_path.url if hasattr(obj.file_path, 'url') else obj.download_url
-            return format_html('<a href="{}" download>Télécharger</a>', url)
+            return format_html('<a href="{}" download>Télécharger</a>', obj.download_url)
         return "-"
     download_link_admin.short_description = "Lien de téléchargement"
 
+    def finish_downloads(self, request, queryset, status):
+        """Passe les téléchargements non terminés de la sélection dans un état final
+
+        Les téléchargements déjà terminés sont laissés tels quels : ils
+        sont déjà comptés dans les agrégats horaires sous leur statut.
+        """
+        ids = list(queryset.exclude(status__in=TERMINAL_STATUSES).values_list('id', flat=True))
+        now = timezone.now()
+        VideoDownload.objects.filter(id__in=ids).update(status=status, completed_at=now, updated_at=now)
+        record_finished(ids)
+        children_finished(ids)
+        invalidate_versions(ids)
+        skipped = queryset.count() - len(ids)
+        if skipped:
+            self.message_user(request, f"{skipped} téléchargement(s) déjà terminé(s) ignoré(s)", messages.WARNING)
+
     def mark_as_completed(self, request, queryset):
-        queryset.update(status='completed')
+        self.finish_downloads(request, queryset, 'completed')
     mark_as_completed.short_description = "Marquer comme terminé"
 
     def mark_as_failed(self, request, queryset):
-        queryset.update(status='failed')
+        self.finish_downloads(request, queryset, 'failed')
     mark_as_failed.short_description = "Marquer comme échoué"
 
 @admin.register(SupportedFormat)
@@ -141,4 +141,18 @@ class SupportedFormatAdmin(admin.ModelAdmin):
     list_display = ('id', 'platform', 'format_name', 'mime_type', 'is_video', 'is_audio', 'max_quality')
     search_fields = ('format_name', 'mime_type')
     list_filter = ('platform', 'is_video', 'is_audio')
-    ordering = ('platform', 'format_name') 
\ No newline at end of file
+    ordering = ('platform', 'format_name') 
+
+@admin.register(StoredFile)
+class StoredFileAdmin(admin.ModelAdmin):
+    list_display = ('id', 'path', 'size', 'ref_count', 'created_at')
+    search_fields = ('path',)
+    readonly_fields = ('path', 'size', 'ref_count', 'created_at')
+    ordering = ('-created_at',)
+
+@admin.register(DownloadRollup)
+class DownloadRollupAdmin(admin.ModelAdmin):
+    list_display = ('hour', 'platform', 'status', 'count', 'total_bytes', 'total_duration', 'processing_seconds')
+    list_filter = ('platform', 'status')
+    readonly_fields = ('hour', 'platform', 'status', 'count', 'total_bytes', 'total_duration', 'processing_seconds')
+    ordering = ('-hour',)
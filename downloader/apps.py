@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class DownloaderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'downloader'
+
+    def ready(self):
+        # Invalidation des caches (plateformes, versions), battements des workers Celery
+        from . import signals  # noqa: F401
+        # Index plein texte SQLite recréé si une migration a reconstruit la table
+        from django.db.models.signals import post_migrate
+        from .search import ensure_index
+        post_migrate.connect(ensure_index, sender=self, dispatch_uid='downloader_ensure_search_index')
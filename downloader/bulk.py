@@ -0,0 +1,227 @@
+import logging
+import os
+import uuid
+from collections import Counter
+from celery import group
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .extraction import canonical_video_key, is_playlist_key, normalize_format_key
+from .inflight import ACTIVE_STATUSES, inflight_key
+from .models import StoredFile, VideoDownload
+from .platforms import active_platforms, detect_platform_name
+from .playlists import children_finished
+from .rollups import record_finished
+from .routing import METADATA_QUEUE, queue_for
+from .storage import reuse_fields
+
+logger = logging.getLogger(__name__)
+
+
+def create_bulk_downloads(urls, requested_quality='best', download_audio_only=False,
+                          ip_address=None, user_agent='', batch_size=None):
+    """Crée des téléchargements en lot et produit un résultat par URL, dans l'ordre
+
+    Les URLs sont traitées par lots : validation et détection de la
+    plateforme en mémoire, un ``bulk_create`` et un groupe Celery par
+    lot. Les doublons réutilisent un fichier existant ou suivent un
+    téléchargement identique en cours, comme pour un téléchargement seul ;
+    les playlists et chaînes sont confiées à la tâche de développement.
+    """
+    batch_size = batch_size or getattr(settings, 'DOWNLOADER_BULK_BATCH_SIZE', 1000)
+    options = {
+        'platforms': active_platforms(),
+        'requested_quality': requested_quality,
+        'download_audio_only': download_audio_only,
+        'format_key': normalize_format_key(requested_quality, download_audio_only),
+        'ip_address': ip_address,
+        'user_agent': user_agent,
+    }
+    for start in range(0, len(urls), batch_size):
+        yield from create_batch(urls[start:start + batch_size], **options)
+
+
+def create_batch(urls, platforms, requested_quality, download_audio_only, format_key, ip_address, user_agent,
+                 parent=None):
+    """Crée les téléchargements d'un lot d'URLs (voir ``create_bulk_downloads``)
+
+    ``parent`` est la playlist dont les URLs sont les entrées.
+    """
+    # Import différé : tasks utilise ce module pour développer les playlists
+    from .tasks import download_video_task, expand_playlist_task
+    validate = URLValidator()
+    entries = []
+    downloads = []
+    for url in urls:
+        url = str(url).strip()
+        try:
+            validate(url)
+        except ValidationError:
+            entries.append({'url': url, 'status': 'invalid', 'error': "URL invalide"})
+            continue
+        platform = platforms.get(detect_platform_name(url))
+        if platform is None:
+            entries.append({'url': url, 'status': 'invalid', 'error': "Plateforme non supportée ou inactive"})
+            continue
+        video_key = canonical_video_key(url)
+        download = VideoDownload(
+            source_url=url,
+            platform=platform,
+            parent=parent,
+            is_playlist=is_playlist_key(video_key),
+            requested_quality=requested_quality,
+            download_audio_only=download_audio_only,
+            video_key=video_key,
+            format_key=format_key,
+            ip_address=ip_address,
+            user_agent=user_agent,
+        )
+        downloads.append(download)
+        entries.append({'url': url, 'download': download})
+
+    if downloads:
+        leaders = assign_sources(downloads, format_key)
+        playlists = [download for download in downloads if download.is_playlist]
+        failed_ids = set()
+        if not enqueue_leaders(leaders, download_video_task, queue_for(requested_quality, download_audio_only)):
+            failed_ids.update(download.id for download in leaders)
+        if not enqueue_leaders(playlists, expand_playlist_task, METADATA_QUEUE):
+            failed_ids.update(download.id for download in playlists)
+        if failed_ids:
+            for download in downloads:
+                if download.id in failed_ids or download.coalesced_with_id in failed_ids:
+                    download.status = 'failed'
+        # Fichiers réutilisés et lancements en échec : téléchargements déjà terminés
+        finished_ids = [download.id for download in downloads if download.status in ('completed', 'failed')]
+        record_finished(finished_ids)
+        if parent is not None:
+            children_finished(finished_ids)
+
+    for entry in entries:
+        download = entry.pop('download', None)
+        if download is not None:
+            entry.update(download_result(download))
+        yield entry
+
+
+def reusable_files(video_keys, format_key):
+    """Téléchargements terminés dont le fichier existe encore, par video_key (une requête)"""
+    sources = {}
+    candidates = VideoDownload.objects.filter(
+        video_key__in=video_keys, format_key=format_key, status='completed', stored_file__isnull=False
+    ).select_related('stored_file').order_by('-completed_at')
+    for candidate in candidates:
+        if candidate.video_key in sources:
+            continue
+        if os.path.exists(os.path.join(settings.MEDIA_ROOT, candidate.stored_file.path)):
+            sources[candidate.video_key] = candidate
+    return sources
+
+
+def inflight_leaders(video_keys, format_key):
+    """Téléchargements identiques en cours, par video_key (un aller-retour Redis, une requête)"""
+    keys = {inflight_key(video_key, format_key): video_key for video_key in video_keys}
+    try:
+        claimed = cache.get_many(list(keys))
+    except Exception as e:
+        logger.warning(f"Erreur lors de la lecture des téléchargements en cours: {e}")
+        return {}
+    if not claimed:
+        return {}
+    active = VideoDownload.objects.filter(id__in=list(claimed.values()), status__in=ACTIVE_STATUSES).values(
+        'id', 'status', 'progress_percentage', 'started_at'
+    )
+    by_id = {str(leader['id']): leader for leader in active}
+    return {keys[key]: by_id[leader_id] for key, leader_id in claimed.items() if leader_id in by_id}
+
+
+def assign_sources(downloads, format_key):
+    """Réutilise, rattache ou prépare chaque téléchargement puis insère le lot
+
+    Retourne les nouveaux téléchargements leaders, à lancer. Les playlists
+    ne sont ni réutilisées ni rattachées : elles reçoivent seulement l'ID
+    de leur tâche de développement.
+    """
+    video_keys = {download.video_key for download in downloads if not download.is_playlist}
+    sources = reusable_files(video_keys, format_key)
+    leaders = inflight_leaders(video_keys - set(sources), format_key)
+    new_leaders = {}
+
+    with transaction.atomic():
+        # Une référence par téléchargement qui réutilise un fichier encore référencé
+        counts = Counter(download.video_key for download in downloads if download.video_key in sources)
+        for video_key, count in counts.items():
+            if not StoredFile.objects.filter(pk=sources[video_key].stored_file_id, ref_count__gt=0).update(
+                ref_count=F('ref_count') + count, last_accessed_at=timezone.now()
+            ):
+                del sources[video_key]
+
+        for download in downloads:
+            if download.is_playlist:
+                download.celery_task_id = str(uuid.uuid4())
+            elif download.video_key in sources:
+                for field, value in reuse_fields(sources[download.video_key]).items():
+                    setattr(download, field, value)
+            elif download.video_key in leaders:
+                leader = leaders[download.video_key]
+                download.coalesced_with_id = leader['id']
+                download.status = leader['status']
+                download.progress_percentage = leader['progress_percentage']
+                download.started_at = leader['started_at']
+            elif download.video_key in new_leaders:
+                download.coalesced_with_id = new_leaders[download.video_key].id
+            else:
+                download.celery_task_id = str(uuid.uuid4())
+                new_leaders[download.video_key] = download
+
+        VideoDownload.objects.bulk_create(downloads)
+
+    # Les demandes suivantes pour ces vidéos suivent les nouveaux leaders
+    timeout = getattr(settings, 'DOWNLOADER_INFLIGHT_TTL', 2 * 3600)
+    try:
+        cache.set_many(
+            {inflight_key(video_key, format_key): str(leader.id) for video_key, leader in new_leaders.items()},
+            timeout=timeout
+        )
+    except Exception as e:
+        logger.warning(f"Erreur lors de l'enregistrement des téléchargements en cours: {e}")
+    return list(new_leaders.values())
+
+
+def enqueue_leaders(leaders, task, queue):
+    """Lance les nouveaux téléchargements en un seul groupe Celery de ``task``
+
+    En cas d'échec de l'envoi, les téléchargements (et ceux qui les
+    suivent) sont marqués en échec et False est retourné.
+    """
+    if not leaders:
+        return True
+    try:
+        group(
+            task.signature((str(download.id),), task_id=download.celery_task_id, queue=queue)
+            for download in leaders
+        ).apply_async()
+    except Exception as e:
+        logger.error(f"Erreur lors du lancement des téléchargements en lot: {e}")
+        ids = [download.id for download in leaders]
+        now = timezone.now()
+        VideoDownload.objects.filter(
+            Q(id__in=ids) | Q(coalesced_with_id__in=ids, status__in=ACTIVE_STATUSES)
+        ).update(
+            status='failed', error_message="Erreur lors du lancement du téléchargement",
+            completed_at=now, updated_at=now
+        )
+        return False
+    return True
+
+
+def download_result(download):
+    """Résultat d'une URL acceptée"""
+    result = {'id': str(download.id), 'status': download.status}
+    if download.coalesced_with_id:
+        result['coalesced_with'] = str(download.coalesced_with_id)
+    return result
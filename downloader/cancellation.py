@@ -0,0 +1,134 @@
+import logging
+from celery import current_app
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .models import VideoDownload
+from .events import publish_download
+from .inflight import ACTIVE_STATUSES
+from .playlists import children_finished
+from .rollups import record_finished
+
+logger = logging.getLogger(__name__)
+
+
+def cancel_key(download_id):
+    """Clé du drapeau d'annulation lu par le worker pendant le transfert"""
+    return f'downloader:downloads:{download_id}:cancel'
+
+
+def cancel_requested(download_id):
+    """Indique si l'arrêt du transfert a été demandé (lecture Redis, sans requête SQL)"""
+    try:
+        return bool(cache.get(cancel_key(download_id)))
+    except Exception as e:
+        logger.warning(f"Erreur lors de la lecture du drapeau d'annulation {download_id}: {e}")
+        return False
+
+
+def has_active_followers(download_id):
+    """Indique si des téléchargements rattachés attendent encore ce téléchargement"""
+    return VideoDownload.objects.filter(coalesced_with_id=download_id, status__in=ACTIVE_STATUSES).exists()
+
+
+def stop_task(download_id):
+    """Arrête le transfert d'un téléchargement
+
+    Le drapeau interrompt une tâche en cours au prochain appel du hook de
+    progression ; le revoke empêche une tâche en attente (ou un retry
+    planifié) de démarrer.
+    """
+    stop_tasks([download_id])
+
+
+def stop_tasks(download_ids):
+    """Arrête les transferts de plusieurs téléchargements (un seul revoke)"""
+    if not download_ids:
+        return
+    timeout = getattr(settings, 'DOWNLOADER_INFLIGHT_TTL', 2 * 3600)
+    cache.set_many({cancel_key(download_id): True for download_id in download_ids}, timeout=timeout)
+    task_ids = [
+        task_id for task_id in
+        VideoDownload.objects.filter(pk__in=download_ids).values_list('celery_task_id', flat=True)
+        if task_id
+    ]
+    if task_ids:
+        try:
+            current_app.control.revoke(task_ids)
+        except Exception as e:
+            logger.warning(f"Erreur lors de la révocation des tâches {task_ids}: {e}")
+
+
+def cancel_children(parent_id):
+    """Annule d'un coup les vidéos encore actives d'une playlist
+
+    Un seul UPDATE et un seul revoke, quel que soit le nombre d'entrées ;
+    comme pour un téléchargement seul, un transfert n'est arrêté que si
+    plus aucun téléchargement actif ne l'attend. Les agrégats et les
+    événements de progression sont traités par une tâche de maintenance.
+    Retourne le nombre de vidéos annulées.
+    """
+    # Import différé : tasks utilise ce module pendant les transferts
+    from .tasks import finish_cancelled_downloads
+    children = VideoDownload.objects.filter(parent_id=parent_id, status__in=ACTIVE_STATUSES)
+    rows = list(children.values_list('id', 'coalesced_with_id'))
+    if not rows:
+        return 0
+    ids = [download_id for download_id, _ in rows]
+    now = timezone.now()
+    cancelled = VideoDownload.objects.filter(id__in=ids, status__in=ACTIVE_STATUSES).update(
+        status='cancelled', completed_at=now, updated_at=now
+    )
+
+    transfer_ids = {leader_id or download_id for download_id, leader_id in rows}
+    waiting = VideoDownload.objects.filter(coalesced_with_id__in=transfer_ids, status__in=ACTIVE_STATUSES)
+    stop_tasks(list(
+        VideoDownload.objects.filter(pk__in=transfer_ids, status='cancelled')
+        .exclude(pk__in=waiting.values('coalesced_with_id'))
+        .values_list('id', flat=True)
+    ))
+
+    try:
+        finish_cancelled_downloads.delay([str(download_id) for download_id in ids])
+    except Exception as e:
+        logger.warning(f"Erreur lors du lancement du suivi des annulations de {parent_id}: {e}")
+        finish_cancelled(ids)
+    return cancelled
+
+
+def finish_cancelled(download_ids):
+    """Agrégats horaires et événements de progression de téléchargements annulés en lot"""
+    record_finished(download_ids, status='cancelled')
+    for download in VideoDownload.objects.filter(id__in=download_ids, status='cancelled').iterator():
+        publish_download(download)
+
+
+def cancel(download):
+    """Annule un téléchargement en attente ou en cours
+
+    Le transfert n'est arrêté que si plus aucun téléchargement ne
+    l'attend : un leader annulé continue pour ses téléchargements
+    rattachés, et le dernier rattaché annulé arrête un leader déjà
+    annulé. Une playlist annulée annule ses vidéos encore actives.
+    Retourne False si le téléchargement n'était plus actif.
+    """
+    now = timezone.now()
+    if not VideoDownload.objects.filter(pk=download.pk, status__in=ACTIVE_STATUSES).update(
+        status='cancelled', completed_at=now, updated_at=now
+    ):
+        return False
+    download.status = 'cancelled'
+    download.completed_at = now
+    record_finished([download.pk])
+
+    transfer_id = download.coalesced_with_id or download.pk
+    if not has_active_followers(transfer_id) and \
+            VideoDownload.objects.filter(pk=transfer_id, status='cancelled').exists():
+        stop_task(transfer_id)
+
+    if download.is_playlist:
+        # La tâche de développement s'arrête au lot suivant
+        cancel_children(download.pk)
+    if download.parent_id:
+        children_finished([download.pk])
+    return True
@@ -0,0 +1,55 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+def slot_key(platform_name, index):
+    """Clé d'un créneau de transfert d'une plateforme"""
+    return f'downloader:platform:{platform_name}:slot:{index}'
+
+
+def slot_ttl():
+    """Durée de vie d'un créneau sans renouvellement (secondes)"""
+    return getattr(settings, 'DOWNLOADER_PLATFORM_SLOT_TTL', 300)
+
+
+def acquire_slot(platform_name, limit, download_id):
+    """Réserve l'un des ``limit`` créneaux de transfert de la plateforme
+
+    Les créneaux sont des clés Redis partagées par tous les workers,
+    posées avec ``cache.add`` et une courte expiration renouvelée
+    pendant le transfert (``refresh_slot``) : le créneau d'un worker
+    arrêté brutalement est libéré en DOWNLOADER_PLATFORM_SLOT_TTL
+    secondes. Retourne la clé obtenue, ou None si tous les créneaux
+    sont occupés.
+    """
+    timeout = slot_ttl()
+    for index in range(limit):
+        key = slot_key(platform_name, index)
+        if cache.add(key, str(download_id), timeout=timeout):
+            return key
+        if cache.get(key) == str(download_id):
+            cache.touch(key, timeout)
+            return key
+    return None
+
+
+def refresh_slot(key, download_id):
+    """Prolonge un créneau tant qu'il appartient toujours à ``download_id``"""
+    try:
+        if cache.get(key) == str(download_id):
+            return cache.touch(key, slot_ttl())
+    except Exception as e:
+        logger.warning(f"Erreur lors du renouvellement du créneau {key}: {e}")
+    return False
+
+
+def release_slot(key, download_id):
+    """Libère un créneau s'il appartient toujours à ``download_id``"""
+    try:
+        if cache.get(key) == str(download_id):
+            cache.delete(key)
+    except Exception as e:
+        logger.warning(f"Erreur lors de la libération du créneau {key}: {e}")
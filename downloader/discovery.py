@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import yt_dlp
+from django.conf import settings
+from .extraction import get_video_info
+
+logger = logging.getLogger(__name__)
+
+# Pool borné des extractions lancées par formats/ (créé au premier appel)
+_executor = None
+_executor_lock = threading.Lock()
+
+# Extractions confiées au pool et non terminées (en cours ou abandonnées par leur client)
+_running = 0
+
+# Sémaphores par hôte, propres à chaque boucle asyncio (un processus ASGI = une boucle)
+_host_semaphores = weakref.WeakKeyDictionary()
+
+
+class FormatsTimeout(Exception):
+    """Extraction des formats non terminée dans le délai imparti"""
+
+
+class FormatsBusy(Exception):
+    """Tous les threads d'extraction sont occupés"""
+
+
+def pool_size():
+    """Nombre de threads du pool d'extraction"""
+    return getattr(settings, 'DOWNLOADER_FORMATS_WORKERS', 8)
+
+
+def get_executor():
+    """Pool de threads partagé par les extractions (DOWNLOADER_FORMATS_WORKERS threads)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=pool_size(), thread_name_prefix='downloader-formats')
+    return _executor
+
+
+def submit(url, cancelled):
+    """Confie une extraction au pool, ou lève FormatsBusy si tous ses threads sont pris
+
+    Une extraction n'attend jamais derrière des extractions dont le
+    client est parti : le compteur n'est décrémenté qu'à la fin réelle
+    du travail dans son thread.
+    """
+    global _running
+    with _executor_lock:
+        if _running >= pool_size():
+            raise FormatsBusy()
+        _running += 1
+    try:
+        future = get_executor().submit(extract, url, cancelled)
+    except Exception:
+        finished(None)
+        raise
+    future.add_done_callback(finished)
+    return future
+
+
+def finished(future):
+    """Libère la place d'une extraction terminée (appelé depuis son thread)"""
+    global _running
+    with _executor_lock:
+        _running -= 1
+
+
+def url_host(url):
+    """Hôte d'une URL, sans le préfixe www."""
+    host = (urlparse(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def host_semaphore(host):
+    """Sémaphore limitant les extractions simultanées vers un même hôte"""
+    semaphores = _host_semaphores.setdefault(asyncio.get_running_loop(), {})
+    if host not in semaphores:
+        semaphores[host] = asyncio.Semaphore(getattr(settings, 'DOWNLOADER_FORMATS_PER_HOST', 2))
+    return semaphores[host]
+
+
+def release_when_done(future, loop, semaphore):
+    """Rend la place de l'hôte quand l'extraction se termine réellement, pas quand le client abandonne"""
+    def release(_):
+        try:
+            loop.call_soon_threadsafe(semaphore.release)
+        except RuntimeError:
+            # Boucle fermée : son sémaphore n'est plus utilisé
+            pass
+    future.add_done_callback(release)
+
+
+def extract(url, cancelled):
+    """Extraction exécutée dans le pool ; ignorée si la requête a été abandonnée entre-temps"""
+    if cancelled.is_set():
+        return None
+    return get_video_info(url, {'socket_timeout': getattr(settings, 'DOWNLOADER_FORMATS_SOCKET_TIMEOUT', 10)})
+
+
+async def discover_formats(url):
+    """Informations yt-dlp d'une URL sans bloquer la boucle asyncio
+
+    L'extraction est confiée au pool de threads, au plus
+    DOWNLOADER_FORMATS_PER_HOST à la fois par hôte, et doit aboutir en
+    DOWNLOADER_FORMATS_TIMEOUT secondes attente comprise ; FormatsBusy
+    est levée sans attendre si le pool est plein. Si le délai expire ou
+    si le client se déconnecte, une extraction encore en file n'est pas
+    lancée ; une extraction déjà lancée se termine dans son thread et
+    garde jusque-là sa place dans le pool et auprès de son hôte.
+    """
+    loop = asyncio.get_running_loop()
+    cancelled = threading.Event()
+    semaphore = host_semaphore(url_host(url))
+
+    async def run():
+        await semaphore.acquire()
+        try:
+            future = submit(url, cancelled)
+        except BaseException:
+            semaphore.release()
+            raise
+        release_when_done(future, loop, semaphore)
+        return await asyncio.wrap_future(future)
+
+    try:
+        return await asyncio.wait_for(run(), timeout=getattr(settings, 'DOWNLOADER_FORMATS_TIMEOUT', 20))
+    except asyncio.TimeoutError:
+        raise FormatsTimeout(url)
+    finally:
+        cancelled.set()
+
+
+def format_label(f):
+    """Libellé d'un format (comme ``format`` de yt-dlp, absent des résultats non traités)"""
+    if f.get('format'):
+        return f['format']
+    note = f" ({f['format_note']})" if f.get('format_note') else ''
+    return f"{f.get('format_id')} - {yt_dlp.YoutubeDL.format_resolution(f)}{note}"
+
+
+def list_formats(info):
+    """Formats proposés au client : vidéo+audio (fusionnés au besoin) puis audio seul"""
+    formats = info.get('formats', [])
+    # On cherche tous les formats vidéo (vcodec != 'none')
+    video_formats = [f for f in formats if f.get('vcodec') and f['vcodec'] != 'none']
+    audio_formats = [f for f in formats if f.get('acodec') and f['acodec'] != 'none' and (not f.get('vcodec') or f['vcodec'] == 'none')]
+    result = []
+    for vf in video_formats:
+        # Format combiné (déjà vidéo+audio)
+        if vf.get('acodec') and vf['acodec'] != 'none':
+            result.append({
+                'format_id': vf.get('format_id'),
+                'ext': vf.get('ext'),
+                'height': vf.get('height'),
+                'width': vf.get('width'),
+                'acodec': vf.get('acodec'),
+                'vcodec': vf.get('vcodec'),
+                'format_note': vf.get('format_note'),
+                'filesize': vf.get('filesize'),
+                'tbr': vf.get('tbr'),
+                'fps': vf.get('fps'),
+                'audio_only': False,
+                'video_only': False,
+                'format': format_label(vf),
+                'url': vf.get('url', vf.get('manifest_url')),
+                'merge': False,
+                'yt_dlp_format': vf.get('format_id'),
+            })
+        # Format vidéo seul, on fusionne avec le meilleur audio
+        else:
+            best_audio = None
+            if audio_formats:
+                # On prend le meilleur audio (par tbr ou filesize)
+                best_audio = max(audio_formats, key=lambda af: af.get('tbr') or 0)
+            if best_audio:
+                yt_dlp_format = f"{vf.get('format_id')}+{best_audio.get('format_id')}"
+                result.append({
+                    'format_id': f"{vf.get('format_id')}+{best_audio.get('format_id')}",
+                    'ext': vf.get('ext'),
+                    'height': vf.get('height'),
+                    'width': vf.get('width'),
+                    'acodec': best_audio.get('acodec'),
+                    'vcodec': vf.get('vcodec'),
+                    'format_note': vf.get('format_note'),
+                    'filesize': vf.get('filesize'),
+                    'tbr': vf.get('tbr'),
+                    'fps': vf.get('fps'),
+                    'audio_only': False,
+                    'video_only': False,
+                    'format': format_label(vf),
+                    'url': None,
+                    'merge': True,
+                    'yt_dlp_format': yt_dlp_format,
+                })
+    # Ajout des formats audio seuls
+    for af in audio_formats:
+        result.append({
+            'format_id': af.get('format_id'),
+            'ext': af.get('ext'),
+            'height': None,
+            'width': None,
+            'acodec': af.get('acodec'),
+            'vcodec': af.get('vcodec'),
+            'format_note': af.get('format_note'),
+            'filesize': af.get('filesize'),
+            'tbr': af.get('tbr'),
+            'fps': None,
+            'audio_only': True,
+            'video_only': False,
+            'format': format_label(af),
+            'url': af.get('url', af.get('manifest_url')),
+            'merge': False,
+            'yt_dlp_format': af.get('format_id'),
+        })
+    # On trie par hauteur décroissante (résolution la plus haute en premier, puis audio_only à la fin)
+    return sorted(result, key=lambda x: (x['audio_only'], -(x['height'] or 0) if x['height'] else 0))
@@ -0,0 +1,156 @@
+import json
+import logging
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from .redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+# Durée de conservation du dernier état publié (secondes)
+SNAPSHOT_TTL = 24 * 3600
+
+
+def channel_name(download_id):
+    """Canal Redis sur lequel sont publiés les événements d'un téléchargement"""
+    return f'downloader:downloads:{download_id}:events'
+
+
+def snapshot_key(download_id):
+    """Clé Redis contenant le dernier événement publié"""
+    return f'downloader:downloads:{download_id}:snapshot'
+
+
+def download_payload(download):
+    """Construit l'événement correspondant à l'état d'un VideoDownload"""
+    payload = {
+        'id': str(download.id),
+        'status': download.status,
+        'progress_percentage': download.progress_percentage,
+        'error_message': download.error_message,
+        'started_at': download.started_at,
+        'completed_at': download.completed_at,
+    }
+    if download.coalesced_with_id:
+        payload['coalesced_with'] = str(download.coalesced_with_id)
+    return payload
+
+
+def publish_progress(download_id, payload):
+    """Publie un événement de progression et mémorise le dernier état
+
+    Les erreurs Redis sont journalisées mais jamais propagées : la
+    publication ne doit pas faire échouer un téléchargement.
+    """
+    message = json.dumps(dict(payload, id=str(download_id)), cls=DjangoJSONEncoder)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.set(snapshot_key(download_id), message, ex=SNAPSHOT_TTL)
+        pipe.publish(channel_name(download_id), message)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Erreur lors de la publication de la progression {download_id}: {e}")
+        return False
+    return True
+
+
+def publish_download(download):
+    """Publie l'état courant d'un VideoDownload"""
+    return publish_progress(download.id, download_payload(download))
+
+
+def format_sse(data, event=None):
+    """Formate un message Server-Sent Events"""
+    lines = []
+    if event:
+        lines.append(f'event: {event}')
+    for line in data.splitlines() or ['']:
+        lines.append(f'data: {line}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def is_terminal(message):
+    """Indique si un événement sérialisé correspond à un état final"""
+    try:
+        return json.loads(message).get('status') in TERMINAL_STATUSES
+    except (TypeError, ValueError):
+        return False
+
+
+async def get_snapshot(download_id, client=None):
+    """Dernier événement publié pour un téléchargement, ou None
+
+    ``client`` : client Redis asynchrone de l'appelant, réutilisé (et
+    laissé ouvert) pour ne pas ouvrir une connexion à chaque lecture.
+    """
+    own_client = client is None
+    if own_client:
+        client = get_async_redis()
+    try:
+        return await client.get(snapshot_key(download_id))
+    except Exception as e:
+        logger.warning(f"Erreur lors de la lecture de l'état {download_id}: {e}")
+        return None
+    finally:
+        if own_client:
+            await client.aclose()
+
+
+def relabel(message, download_id):
+    """Réécrit l'ID d'un événement relayé depuis le téléchargement leader"""
+    try:
+        data = json.loads(message)
+    except (TypeError, ValueError):
+        return message
+    data['id'] = str(download_id)
+    return json.dumps(data)
+
+
+def leader_of(message):
+    """ID du téléchargement leader suivi par un téléchargement rattaché"""
+    if not message or is_terminal(message):
+        return None
+    try:
+        return json.loads(message).get('coalesced_with')
+    except (TypeError, ValueError):
+        return None
+
+
+async def stream_events(download_id, initial=None, client=None):
+    """Générateur asynchrone d'événements SSE pour un téléchargement
+
+    L'abonnement au canal est pris avant la lecture de l'état courant
+    afin de ne perdre aucun événement ; le flux se termine dès qu'un
+    état final est reçu. Un téléchargement rattaché à un téléchargement
+    identique en cours relaie les événements de ce dernier. ``client``
+    (client Redis asynchrone déjà ouvert par la vue) sert aussi à
+    l'abonnement et est fermé à la fin du flux.
+    """
+    heartbeat = getattr(settings, 'DOWNLOADER_EVENTS_HEARTBEAT', 15)
+    client = client or get_async_redis()
+    pubsub = client.pubsub()
+    try:
+        snapshot = await client.get(snapshot_key(download_id)) or initial
+        source_id = leader_of(snapshot) or download_id
+
+        await pubsub.subscribe(channel_name(source_id))
+        snapshot = await client.get(snapshot_key(source_id)) or snapshot
+        if snapshot:
+            yield format_sse(relabel(snapshot, download_id), event='progress')
+            if is_terminal(snapshot):
+                return
+
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+            if message is None:
+                # Commentaire SSE pour garder la connexion ouverte
+                yield ': keep-alive\n\n'
+                continue
+            data = message['data']
+            yield format_sse(relabel(data, download_id), event='progress')
+            if is_terminal(data):
+                return
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
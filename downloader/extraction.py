@@ -0,0 +1,228 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from urllib.parse import parse_qs, urlparse, urlunparse
+import yt_dlp
+from yt_dlp.extractor import gen_extractor_classes
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+HITS_KEY = 'downloader:metadata:hits'
+MISSES_KEY = 'downloader:metadata:misses'
+
+# Marge de sécurité avant l'expiration des URLs signées (secondes)
+SIGNED_URL_MARGIN = 60
+
+
+@lru_cache(maxsize=None)
+def _extractor_classes():
+    """Extracteurs yt-dlp (chargés une seule fois par processus)"""
+    return tuple(gen_extractor_classes())
+
+
+@lru_cache(maxsize=1024)
+def _extractors_for_host(host):
+    """Extracteurs dont le motif d'URL mentionne le domaine, dans l'ordre de yt-dlp
+
+    Évite de tester les ~1800 extracteurs pour chaque URL (quelques
+    millisecondes par URL, coûteux pour les imports en lot).
+    """
+    labels = [label for label in host.split(':')[0].split('.') if label]
+    name = labels[-2] if len(labels) >= 2 else host
+    return tuple(ie for ie in _extractor_classes() if name in str(getattr(ie, '_VALID_URL', '') or ''))
+
+
+@lru_cache(maxsize=4096)
+def canonical_video_key(url):
+    """Identifiant canonique d'une vidéo, sans accès réseau
+
+    Utilise l'extracteur yt-dlp correspondant à l'URL pour obtenir l'ID
+    de la vidéo : youtu.be, youtube.com et m.youtube.com donnent la même
+    clé (``youtube:<id>``). À défaut, l'URL normalisée est utilisée.
+    """
+    for ie in _extractors_for_host(urlparse(url.strip()).netloc.lower()):
+        if ie.suitable(url):
+            video_id = ie.get_temp_id(url)
+            if video_id:
+                return f'{ie.ie_key().lower()}:{video_id}'
+            break
+
+    parsed = urlparse(url.strip())
+    normalized = urlunparse((
+        parsed.scheme.lower(), parsed.netloc.lower(), parsed.path.rstrip('/'),
+        parsed.params, parsed.query, '',
+    ))
+    return f'url:{normalized}'
+
+
+# Extracteurs de playlists, chaînes et comptes (youtubetab, vimeochannel, tiktokuser...)
+PLAYLIST_EXTRACTOR_SUFFIXES = ('tab', 'playlist', 'channel', 'user', 'album', 'show', 'series', 'collection')
+
+# Résultats yt-dlp contenant plusieurs vidéos
+PLAYLIST_RESULT_TYPES = ('playlist', 'multi_video')
+
+
+def is_playlist_key(video_key):
+    """Indique si une clé canonique désigne une playlist ou une chaîne plutôt qu'une vidéo"""
+    extractor = (video_key or '').split(':', 1)[0]
+    return extractor != 'url' and extractor.endswith(PLAYLIST_EXTRACTOR_SUFFIXES)
+
+
+GENERIC_QUALITIES = ['best', 'worst', '144p', '240p', '360p', '480p', '720p', '1080p', '1440p', '2160p']
+
+
+def build_format_selector(requested_quality, audio_only=False):
+    """Sélecteur de format yt-dlp correspondant à la qualité demandée"""
+    requested_quality = (requested_quality or 'best').strip()
+    if requested_quality in GENERIC_QUALITIES:
+        if requested_quality == 'best':
+            return 'bestaudio/best' if audio_only else 'best[height<=1080]'
+        if requested_quality == 'worst':
+            return 'worst'
+        # Qualité spécifique (720p, 480p, etc.)
+        height = requested_quality.replace('p', '')
+        return 'bestaudio/best' if audio_only else f'best[height<={height}]'
+    # Cas d'un format_id yt-dlp (ex: '140', '18', 'sb3', etc.)
+    return requested_quality
+
+
+def normalize_format_key(requested_quality, audio_only=False):
+    """Clé de format normalisée : deux demandes équivalentes donnent la même clé"""
+    kind = 'audio' if audio_only else 'video'
+    return f'{kind}:{build_format_selector(requested_quality, audio_only)}'
+
+
+def needs_postprocessing(requested_quality, audio_only=False):
+    """Indique si le fichier final est produit par ffmpeg (fusion de formats ou extraction audio)"""
+    if audio_only:
+        return True
+    selector = build_format_selector(requested_quality)
+    return '+' in selector or ',' in selector
+
+
+def metadata_cache_key(url):
+    """Clé du cache partagé des métadonnées pour une URL"""
+    return f'downloader:metadata:{canonical_video_key(url)}'
+
+
+class LocalInfoCache:
+    """Cache LRU en mémoire, borné en nombre d'entrées, avec expiration"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LocalInfoCache(getattr(settings, 'DOWNLOADER_METADATA_CACHE_MAX_ENTRIES', 64))
+
+
+def _count(key):
+    """Incrémente un compteur partagé du cache"""
+    try:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+    except Exception as e:
+        logger.debug(f"Compteur de cache {key} indisponible: {e}")
+
+
+def get_cache_stats():
+    """Compteurs de succès/échecs du cache des métadonnées"""
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+def cache_timeout(info):
+    """Durée de mise en cache, toujours inférieure à la validité des URLs signées"""
+    timeout = getattr(settings, 'DOWNLOADER_METADATA_CACHE_TTL', 300)
+    now = time.time()
+    for f in info.get('formats') or []:
+        expire = parse_qs(urlparse(f.get('url') or '').query).get('expire')
+        if expire and expire[0].isdigit():
+            timeout = min(timeout, int(expire[0]) - now - SIGNED_URL_MARGIN)
+    return max(int(timeout), 0)
+
+
+def get_video_info(url, ydl_opts=None):
+    """Informations yt-dlp d'une vidéo, via le cache partagé
+
+    Utilisé par ``available_formats``, l'admin et ``download_video_task``
+    pour qu'une même vidéo ne soit extraite qu'une fois tant que le cache
+    est valide. L'extraction est faite sans traitement (``process=False``) :
+    le résultat est passé tel quel à ``process_ie_result`` par la tâche,
+    et une playlist ou une chaîne est retournée sans que ses entrées
+    soient résolues (ni mises en cache). Le dictionnaire retourné est une
+    copie que l'appelant peut modifier.
+    """
+    key = metadata_cache_key(url)
+
+    info = local_cache.get(key)
+    if info is None:
+        try:
+            info = cache.get(key)
+        except Exception as e:
+            logger.warning(f"Cache des métadonnées indisponible: {e}")
+    if info is not None:
+        _count(HITS_KEY)
+        return copy.deepcopy(info)
+
+    _count(MISSES_KEY)
+    options = {'quiet': True, 'extract_flat': 'in_playlist'}
+    options.update(ydl_opts or {})
+    with yt_dlp.YoutubeDL(options) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        # Redirections de l'extracteur (lien court, page intégrant la vidéo...)
+        for _ in range(3):
+            if info.get('_type') not in ('url', 'url_transparent'):
+                break
+            info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+        if info.get('_type') in PLAYLIST_RESULT_TYPES:
+            # Entrées non parcourues : seul le type intéresse l'appelant
+            info.pop('entries', None)
+            return ydl.sanitize_info(info, remove_private_keys=True)
+        info = ydl.sanitize_info(info, remove_private_keys=True)
+
+    timeout = cache_timeout(info)
+    if info.get('_type', 'video') == 'video' and timeout > 0:
+        local_cache.set(key, info, timeout)
+        try:
+            cache.set(key, info, timeout)
+        except Exception as e:
+            logger.warning(f"Cache des métadonnées indisponible: {e}")
+    return copy.deepcopy(info)
@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+import threading
+import time
+from django.conf import settings
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Ensemble trié des workers (score : date du dernier battement)
+WORKERS_KEY = 'downloader:workers'
+
+
+def heartbeat_key(worker_id):
+    """Clé Redis contenant le dernier battement d'un worker"""
+    return f'downloader:workers:{worker_id}:heartbeat'
+
+
+def heartbeat_interval():
+    """Intervalle entre deux battements (secondes)"""
+    return getattr(settings, 'DOWNLOADER_WORKER_HEARTBEAT_INTERVAL', 10)
+
+
+def heartbeat_ttl():
+    """Durée après laquelle un worker sans battement est considéré comme arrêté"""
+    return 3 * heartbeat_interval()
+
+
+def send_heartbeat(worker_id, queues, concurrency, active):
+    """Enregistre l'état d'un worker dans Redis (expire sans nouveau battement)"""
+    now = time.time()
+    payload = {
+        'worker': worker_id,
+        'pid': os.getpid(),
+        'queues': queues,
+        'concurrency': concurrency,
+        'active': active,
+        'free_slots': max(concurrency - active, 0) if concurrency else None,
+        'timestamp': now,
+    }
+    pipe = get_redis().pipeline()
+    pipe.set(heartbeat_key(worker_id), json.dumps(payload), ex=heartbeat_ttl())
+    pipe.zadd(WORKERS_KEY, {worker_id: now})
+    pipe.execute()
+
+
+def remove_heartbeat(worker_id):
+    """Retire un worker arrêté proprement"""
+    pipe = get_redis().pipeline()
+    pipe.delete(heartbeat_key(worker_id))
+    pipe.zrem(WORKERS_KEY, worker_id)
+    pipe.execute()
+
+
+def live_workers():
+    """Derniers battements des workers vivants (deux allers-retours Redis)
+
+    Les workers disparus sans s'être désinscrits sont retirés de l'index.
+    """
+    client = get_redis()
+    min_score = time.time() - heartbeat_ttl()
+    pipe = client.pipeline()
+    pipe.zremrangebyscore(WORKERS_KEY, '-inf', f'({min_score}')
+    pipe.zrange(WORKERS_KEY, 0, -1)
+    _, worker_ids = pipe.execute()
+    if not worker_ids:
+        return []
+    workers = []
+    for raw in client.mget([heartbeat_key(worker_id) for worker_id in worker_ids]):
+        if not raw:
+            continue
+        try:
+            workers.append(json.loads(raw))
+        except ValueError:
+            continue
+    return workers
+
+
+class HeartbeatThread(threading.Thread):
+    """Thread du processus principal d'un worker Celery envoyant ses battements"""
+
+    def __init__(self, consumer):
+        super().__init__(name='downloader-heartbeat', daemon=True)
+        self.consumer = consumer
+        self.stopped = threading.Event()
+
+    @property
+    def worker_id(self):
+        return self.consumer.hostname
+
+    def state(self):
+        """Files consommées, concurrence et nombre de tâches en cours du worker"""
+        from celery.worker import state
+        try:
+            queues = sorted(queue.name for queue in self.consumer.task_consumer.queues)
+        except Exception:
+            queues = []
+        concurrency = getattr(getattr(self.consumer, 'controller', None), 'concurrency', None)
+        return queues, concurrency, len(state.active_requests)
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                send_heartbeat(self.worker_id, *self.state())
+            except Exception as e:
+                logger.warning(f"Erreur lors de l'envoi du battement du worker {self.worker_id}: {e}")
+            self.stopped.wait(heartbeat_interval())
+
+    def stop(self):
+        self.stopped.set()
+        try:
+            remove_heartbeat(self.worker_id)
+        except Exception as e:
+            logger.warning(f"Erreur lors du retrait du worker {self.worker_id}: {e}")
@@ -0,0 +1,50 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('pending', 'processing')
+
+
+def inflight_key(video_key, format_key):
+    """Clé du verrou single-flight d'une vidéo dans un format donné"""
+    return f'downloader:inflight:{video_key}:{format_key}'
+
+
+def claim(video_key, format_key, download_id):
+    """Tente de devenir le téléchargement leader pour cette vidéo et ce format
+
+    Retourne None si ``download_id`` détient le verrou, sinon l'ID du
+    téléchargement leader déjà en cours (stocké dans Redis via le cache).
+    """
+    if not video_key or not format_key:
+        return None
+    key = inflight_key(video_key, format_key)
+    timeout = getattr(settings, 'DOWNLOADER_INFLIGHT_TTL', 2 * 3600)
+    if cache.add(key, str(download_id), timeout=timeout):
+        return None
+    leader_id = cache.get(key)
+    if leader_id is None or leader_id == str(download_id):
+        # Verrou expiré entre-temps : on le reprend
+        cache.set(key, str(download_id), timeout=timeout)
+        return None
+    return leader_id
+
+
+def takeover(video_key, format_key, download_id):
+    """Remplace un leader qui n'est plus actif"""
+    timeout = getattr(settings, 'DOWNLOADER_INFLIGHT_TTL', 2 * 3600)
+    cache.set(inflight_key(video_key, format_key), str(download_id), timeout=timeout)
+
+
+def release(video_key, format_key, download_id):
+    """Libère le verrou s'il appartient toujours à ``download_id``"""
+    if not video_key or not format_key:
+        return
+    key = inflight_key(video_key, format_key)
+    try:
+        if cache.get(key) == str(download_id):
+            cache.delete(key)
+    except Exception as e:
+        logger.warning(f"Erreur lors de la libération du verrou {key}: {e}")
@@ -0,0 +1,52 @@
+import os
+import re
+import shutil
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from downloader.models import StoredFile, VideoDownload
+from downloader.storage import shard_dir
+
+UUID_PREFIX = re.compile(r'^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})_')
+
+
+class Command(BaseCommand):
+    help = "Déplace les fichiers de MEDIA_ROOT/downloads/ vers l'arborescence répartie par ID"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Affiche les déplacements sans les effectuer")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        download_dir = os.path.join(settings.MEDIA_ROOT, 'downloads')
+        if not os.path.isdir(download_dir):
+            self.stdout.write("Aucun dossier de téléchargements à migrer")
+            return
+
+        moved = skipped = 0
+        with os.scandir(download_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                match = UUID_PREFIX.match(entry.name)
+                if not match:
+                    skipped += 1
+                    continue
+
+                old_path = os.path.join('downloads', entry.name)
+                new_path = os.path.join(shard_dir(match.group(1)), entry.name)
+                self.stdout.write(f"{old_path} -> {new_path}")
+                if dry_run:
+                    moved += 1
+                    continue
+
+                os.makedirs(os.path.join(settings.MEDIA_ROOT, os.path.dirname(new_path)), exist_ok=True)
+                with transaction.atomic():
+                    VideoDownload.objects.filter(file_path=old_path).update(file_path=new_path)
+                    StoredFile.objects.filter(path=old_path).update(path=new_path)
+                    shutil.move(entry.path, os.path.join(settings.MEDIA_ROOT, new_path))
+                moved += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{moved} fichier(s) {'à déplacer' if dry_run else 'déplacé(s)'}, {skipped} ignoré(s)"
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from downloader.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recalcule les agrégats horaires (DownloadRollup) à partir des téléchargements en base"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Début de la période (ISO 8601), par défaut le plus ancien téléchargement terminé")
+        parser.add_argument('--until', help="Fin de la période (ISO 8601, exclue)")
+
+    def parse(self, value, option):
+        if value is None:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f"Date invalide pour {option}: {value}")
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def handle(self, *args, **options):
+        created = rebuild_rollups(
+            since=self.parse(options['since'], '--since'),
+            until=self.parse(options['until'], '--until'),
+        )
+        self.stdout.write(self.style.SUCCESS(f"{created} agrégat(s) horaire(s) recalculé(s)"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from downloader.search import install, rebuild
+
+
+class Command(BaseCommand):
+    help = "Recrée et remplit l'index plein texte des téléchargements (titre et URL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help="Alias de la base de données")
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        install(connection)
+        indexed = rebuild(connection)
+        self.stdout.write(self.style.SUCCESS(f"{indexed} téléchargement(s) indexé(s)"))
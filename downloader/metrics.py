@@ -0,0 +1,201 @@
+import logging
+import math
+import re
+from django.conf import settings
+from django.db.models import Count
+from .extraction import get_cache_stats
+from .models import VideoDownload
+from .redis_client import get_broker_redis, get_redis
+from .routing import MAINTENANCE_QUEUE, METADATA_QUEUE, POSTPROCESS_QUEUE, TRANSFER_QUEUE
+from .stats import StatsPending, cached_stats
+from .storage import get_usage
+
+logger = logging.getLogger(__name__)
+
+# Hash Redis partagé par le serveur web et tous les workers
+METRICS_KEY = 'downloader:metrics'
+
+JOBS_BY_STATUS_KEY = 'downloader:stats:jobs_by_status'
+
+QUEUES = [METADATA_QUEUE, TRANSFER_QUEUE, POSTPROCESS_QUEUE, MAINTENANCE_QUEUE]
+
+# Files de priorité créées par kombu à côté de chaque file Redis
+PRIORITY_QUEUE_SEPARATOR = '\x06\x16'
+PRIORITY_STEPS = [3, 6, 9]
+
+# Étiquette des seuils d'histogramme (tri des séries)
+LE_LABEL_RE = re.compile(r',?le="([^"]*)"')
+
+DURATION_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+SPEED_BUCKETS = (64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2)
+FLUSH_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+# Métriques enregistrées par les workers : nom -> (type, aide, seuils des histogrammes)
+METRICS = {
+    'downloader_extraction_duration_seconds': (
+        'histogram', "Durée de l'extraction des métadonnées par plateforme", DURATION_BUCKETS
+    ),
+    'downloader_transfer_duration_seconds': (
+        'histogram', "Durée du transfert (post-traitements compris) par plateforme", DURATION_BUCKETS
+    ),
+    'downloader_transfer_speed_bytes_per_second': (
+        'histogram', "Débit moyen de chaque téléchargement par plateforme", SPEED_BUCKETS
+    ),
+    'downloader_transferred_bytes_total': ('counter', "Octets téléchargés par plateforme", None),
+    'downloader_downloads_finished_total': ('counter', "Téléchargements terminés par plateforme et statut", None),
+    'downloader_retries_total': ('counter', "Nouvelles tentatives par classe d'erreur", None),
+    'downloader_progress_flush_duration_seconds': (
+        'histogram', "Latence des écritures de progression en base", FLUSH_BUCKETS
+    ),
+}
+
+
+def escape_label(value):
+    """Échappe une valeur d'étiquette pour le format texte Prometheus"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def series(name, labels=None):
+    """Nom d'une série avec ses étiquettes (triées), p. ex. ``x_total{platform="youtube"}``"""
+    if not labels:
+        return name
+    body = ','.join(f'{key}="{escape_label(value)}"' for key, value in sorted(labels.items()))
+    return f'{name}{{{body}}}'
+
+
+def format_value(value):
+    """Valeur numérique au format Prometheus"""
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def inc(name, value=1, **labels):
+    """Incrémente un compteur partagé (les erreurs Redis sont ignorées)"""
+    try:
+        get_redis().hincrbyfloat(METRICS_KEY, series(name, labels), value)
+    except Exception as e:
+        logger.debug(f"Métrique {name} indisponible: {e}")
+
+
+def observe(name, value, **labels):
+    """Ajoute une observation à un histogramme partagé (un aller-retour Redis)"""
+    buckets = METRICS[name][2]
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for bound in buckets:
+            if value <= bound:
+                pipe.hincrbyfloat(METRICS_KEY, series(f'{name}_bucket', dict(labels, le=format_value(bound))), 1)
+        pipe.hincrbyfloat(METRICS_KEY, series(f'{name}_bucket', dict(labels, le='+Inf')), 1)
+        pipe.hincrbyfloat(METRICS_KEY, series(f'{name}_sum', labels), value)
+        pipe.hincrbyfloat(METRICS_KEY, series(f'{name}_count', labels), 1)
+        pipe.execute()
+    except Exception as e:
+        logger.debug(f"Métrique {name} indisponible: {e}")
+
+
+def queue_depths():
+    """Messages en attente par file Celery (files de priorité comprises)"""
+    client = get_broker_redis()
+    pipe = client.pipeline(transaction=False)
+    for queue in QUEUES:
+        pipe.llen(queue)
+        for step in PRIORITY_STEPS:
+            pipe.llen(f'{queue}{PRIORITY_QUEUE_SEPARATOR}{step}')
+    lengths = pipe.execute()
+    per_queue = len(PRIORITY_STEPS) + 1
+    return {queue: sum(lengths[i * per_queue:(i + 1) * per_queue]) for i, queue in enumerate(QUEUES)}
+
+
+def jobs_by_status():
+    """Nombre de téléchargements par statut (une requête groupée, mise en cache)"""
+    def compute():
+        counts = dict.fromkeys((choice for choice, _ in VideoDownload.STATUS_CHOICES), 0)
+        for row in VideoDownload.objects.order_by().values('status').annotate(total=Count('id')):
+            counts[row['status']] = row['total']
+        return counts
+    return cached_stats(JOBS_BY_STATUS_KEY, compute)
+
+
+def sample_sort_key(key):
+    """Ordre d'affichage : par série, puis seuils des histogrammes dans l'ordre croissant"""
+    match = LE_LABEL_RE.search(key)
+    if not match:
+        return key, 0.0
+    le = match.group(1)
+    return LE_LABEL_RE.sub('', key), math.inf if le == '+Inf' else float(le)
+
+
+def recorded_lines():
+    """Lignes des métriques enregistrées par les workers, regroupées par métrique"""
+    values = get_redis().hgetall(METRICS_KEY)
+    lines = []
+    for name, (kind, help_text, _) in METRICS.items():
+        samples = sorted(
+            (
+                (key, value) for key, value in values.items()
+                if key.split('{', 1)[0] in (name, f'{name}_bucket', f'{name}_sum', f'{name}_count')
+            ),
+            key=lambda sample: sample_sort_key(sample[0])
+        )
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(f'{key} {format_value(float(value))}' for key, value in samples)
+    return lines
+
+
+def gauge(lines, name, help_text, samples):
+    """Ajoute une jauge calculée au moment de la collecte"""
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} gauge')
+    for labels, value in samples:
+        lines.append(f'{series(name, labels)} {format_value(value)}')
+
+
+def render():
+    """Exposition au format texte Prometheus (0.0.4)
+
+    Les compteurs et histogrammes sont agrégés dans Redis par tous les
+    processus ; les jauges (files, statuts, stockage, cache) sont lues
+    au moment de la collecte. Une source indisponible est omise.
+    """
+    lines = []
+    try:
+        lines.extend(recorded_lines())
+    except Exception as e:
+        logger.warning(f"Métriques des workers indisponibles: {e}")
+
+    try:
+        gauge(lines, 'downloader_queue_depth', "Messages en attente par file Celery",
+              [({'queue': queue}, depth) for queue, depth in queue_depths().items()])
+    except Exception as e:
+        logger.warning(f"Longueur des files Celery indisponible: {e}")
+
+    try:
+        gauge(lines, 'downloader_jobs', "Téléchargements par statut",
+              [({'status': status}, count) for status, count in jobs_by_status().items()])
+    except StatsPending:
+        # Premier calcul en cours dans une autre requête : série absente de ce relevé
+        pass
+
+    gauge(lines, 'downloader_storage_bytes', "Octets stockés dans MEDIA_ROOT/downloads", [(None, get_usage())])
+    gauge(lines, 'downloader_storage_budget_bytes', "Quota de stockage (DOWNLOADER_STORAGE_BUDGET)",
+          [(None, getattr(settings, 'DOWNLOADER_STORAGE_BUDGET', 50 * 1024 ** 3))])
+
+    try:
+        cache_stats = get_cache_stats()
+    except Exception as e:
+        logger.warning(f"Compteurs du cache des métadonnées indisponibles: {e}")
+        return '\n'.join(lines) + '\n'
+    for name, key, help_text in [
+        ('downloader_metadata_cache_hits_total', 'hits', "Métadonnées servies depuis le cache"),
+        ('downloader_metadata_cache_misses_total', 'misses', "Métadonnées extraites faute d'entrée en cache"),
+    ]:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name} {cache_stats[key]}')
+    if cache_stats['hit_ratio'] is not None:
+        gauge(lines, 'downloader_metadata_cache_hit_ratio', "Taux de succès du cache des métadonnées",
+              [(None, cache_stats['hit_ratio'])])
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(help_text='Chemin relatif à MEDIA_ROOT', max_length=500, unique=True)),
+                ('size', models.PositiveBigIntegerField(default=0, help_text='Taille en bytes')),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Fichier stocké',
+                'verbose_name_plural': 'Fichiers stockés',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='videodownload',
+            name='format_key',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='videodownload',
+            name='video_key',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='videodownload',
+            name='stored_file',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='downloads', to='downloader.storedfile'),
+        ),
+        migrations.AddIndex(
+            model_name='videodownload',
+            index=models.Index(fields=['video_key', 'format_key', 'status'], name='downloader__video_k_bd35c0_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0002_result_reuse'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videodownload',
+            name='coalesced_with',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='followers', to='downloader.videodownload'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0003_coalesced_downloads'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='videodownload',
+            index=models.Index(fields=['status', 'expires_at'], name='downloader__status_e6e6ff_idx'),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:01
+
+import os
+from collections import Counter
+from datetime import timedelta
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def file_size_on_disk(path):
+    """Taille d'un fichier relatif à MEDIA_ROOT (None s'il est absent)"""
+    try:
+        return os.path.getsize(os.path.join(settings.MEDIA_ROOT, path))
+    except OSError:
+        return None
+
+
+def init_storage_usage(apps, schema_editor):
+    """Rattache les fichiers existants au suivi du stockage
+
+    Chaque téléchargement terminé qui a un fichier mais pas de StoredFile
+    en reçoit un (taille et nombre de références), ainsi qu'une date
+    d'expiration s'il n'en a pas : sans cela ces fichiers ne seraient
+    jamais évincés ni comptés dans le quota. Le total des octets stockés
+    est ensuite calculé à partir des StoredFile.
+    """
+    VideoDownload = apps.get_model('downloader', 'VideoDownload')
+    StoredFile = apps.get_model('downloader', 'StoredFile')
+    StorageUsage = apps.get_model('downloader', 'StorageUsage')
+    ttl = timedelta(seconds=getattr(settings, 'DOWNLOADER_DEFAULT_TTL', 7 * 24 * 3600))
+    now = django.utils.timezone.now()
+
+    orphans = list(
+        VideoDownload.objects.filter(status='completed', stored_file__isnull=True)
+        .exclude(file_path__isnull=True).exclude(file_path='')
+        .values_list('id', 'file_path', 'file_size', 'completed_at')
+    )
+    references = Counter(path for _, path, _, _ in orphans)
+    stored_files = {}
+    for download_id, path, size, completed_at in orphans:
+        stored = stored_files.get(path)
+        if stored is None:
+            stored, created = StoredFile.objects.get_or_create(path=path, defaults={
+                'size': file_size_on_disk(path) or size or 0,
+                'ref_count': references[path],
+                'last_accessed_at': completed_at or now,
+            })
+            if not created:
+                StoredFile.objects.filter(pk=stored.pk).update(ref_count=models.F('ref_count') + references[path])
+            stored_files[path] = stored
+        VideoDownload.objects.filter(pk=download_id).update(stored_file=stored)
+
+    VideoDownload.objects.filter(status='completed', expires_at__isnull=True, completed_at__isnull=False).update(
+        expires_at=models.F('completed_at') + ttl
+    )
+    VideoDownload.objects.filter(status='completed', expires_at__isnull=True).update(expires_at=now + ttl)
+
+    total = StoredFile.objects.aggregate(total=Sum('size'))['total'] or 0
+    StorageUsage.objects.update_or_create(pk=1, defaults={'total_bytes': total})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0004_cleanup_expires_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_bytes', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Utilisation du stockage',
+                'verbose_name_plural': 'Utilisation du stockage',
+            },
+        ),
+        migrations.AddField(
+            model_name='storedfile',
+            name='last_accessed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='storedfile',
+            index=models.Index(fields=['last_accessed_at'], name='downloader__last_ac_90eb25_idx'),
+        ),
+        migrations.RunPython(init_storage_usage, migrations.RunPython.noop),
+    ]
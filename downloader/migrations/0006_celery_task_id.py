@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0005_storage_quota'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videodownload',
+            name='celery_task_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0006_celery_task_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='platform',
+            name='max_concurrent_downloads',
+            field=models.PositiveIntegerField(blank=True, help_text="Transferts simultanés maximum sur l'ensemble des workers (vide : illimité)", null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0007_platform_concurrency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='platform',
+            name='rate_limit_burst',
+            field=models.PositiveIntegerField(default=5, help_text="Requêtes pouvant partir d'un coup"),
+        ),
+        migrations.AddField(
+            model_name='platform',
+            name='rate_limit_per_minute',
+            field=models.PositiveIntegerField(blank=True, help_text='Requêtes sortantes par minute, tous workers confondus (vide : illimité)', null=True),
+        ),
+    ]
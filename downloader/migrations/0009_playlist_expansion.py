@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0008_platform_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videodownload',
+            name='entry_count',
+            field=models.PositiveIntegerField(default=0, help_text="Nombre d'entrées développées"),
+        ),
+        migrations.AddField(
+            model_name='videodownload',
+            name='expanded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='videodownload',
+            name='is_playlist',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='videodownload',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='downloader.videodownload'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0009_playlist_expansion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DownloadRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(help_text="Début de l'heure de fin des téléchargements")),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_bytes', models.PositiveBigIntegerField(default=0)),
+                ('total_duration', models.PositiveBigIntegerField(default=0, help_text='Durée cumulée des vidéos en secondes')),
+                ('processing_seconds', models.FloatField(default=0, help_text='Temps de traitement cumulé en secondes')),
+                ('platform', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='downloader.platform')),
+            ],
+            options={
+                'verbose_name': 'Agrégat horaire',
+                'verbose_name_plural': 'Agrégats horaires',
+                'ordering': ['-hour'],
+                'constraints': [models.UniqueConstraint(fields=('hour', 'platform', 'status'), name='unique_download_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0010_download_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='videodownload',
+            index=models.Index(fields=['created_at', 'id'], name='downloader__created_b4f583_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='videodownload',
+            index=models.Index(fields=['completed_at', 'id'], name='downloader__complet_18792d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='videodownload',
+            index=models.Index(fields=['file_size', 'id'], name='downloader__file_si_70b43c_idx'),
+        ),
+    ]
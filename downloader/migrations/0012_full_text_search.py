@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from downloader.search import install, rebuild
+    install(schema_editor.connection)
+    rebuild(schema_editor.connection)
+
+
+def remove_search_index(apps, schema_editor):
+    from downloader.search import uninstall
+    uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0011_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, remove_search_index),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:58
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_existing_children(apps, schema_editor):
+    VideoDownload = apps.get_model('downloader', 'VideoDownload')
+    playlists = VideoDownload.objects.filter(is_playlist=True, status__in=['pending', 'processing'])
+    for parent_id in playlists.values_list('id', flat=True).iterator():
+        counts = VideoDownload.objects.filter(parent_id=parent_id).aggregate(
+            finished=Count('id', filter=Q(status__in=['completed', 'failed', 'cancelled'])),
+            completed=Count('id', filter=Q(status='completed')),
+        )
+        VideoDownload.objects.filter(id=parent_id).update(
+            finished_count=counts['finished'], completed_count=counts['completed']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0012_full_text_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videodownload',
+            name='completed_count',
+            field=models.PositiveIntegerField(default=0, help_text='Vidéos de la playlist téléchargées'),
+        ),
+        migrations.AddField(
+            model_name='videodownload',
+            name='finished_count',
+            field=models.PositiveIntegerField(default=0, help_text='Vidéos de la playlist dans un état final'),
+        ),
+        migrations.RunPython(count_existing_children, migrations.RunPython.noop),
+    ]
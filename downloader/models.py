@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import URLValidator
+from django.urls import reverse
+from django.utils import timezone
 import uuid
 import os
 
@@ -22,6 +24,13 @@ class Platform(models.Model):
     display_name = models.CharField(max_length=100)
     is_active = models.BooleanField(default=True)
     base_url = models.URLField(blank=True, null=True)
+    max_concurrent_downloads = models.PositiveIntegerField(
+        blank=True, null=True, help_text="Transferts simultanés maximum sur l'ensemble des workers (vide : illimité)"
+    )
+    rate_limit_per_minute = models.PositiveIntegerField(
+        blank=True, null=True, help_text="Requêtes sortantes par minute, tous workers confondus (vide : illimité)"
+    )
+    rate_limit_burst = models.PositiveIntegerField(default=5, help_text="Requêtes pouvant partir d'un coup")
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -33,6 +42,74 @@ class Platform(models.Model):
         return self.display_name
 
 
+class StoredFile(models.Model):
+    """Fichier téléchargé, partagé entre plusieurs téléchargements identiques
+
+    Le compteur de références empêche le nettoyage de supprimer un fichier
+    encore utilisé par un autre téléchargement.
+    """
+    path = models.CharField(max_length=500, unique=True, help_text="Chemin relatif à MEDIA_ROOT")
+    size = models.PositiveBigIntegerField(default=0, help_text="Taille en bytes")
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = "Fichier stocké"
+        verbose_name_plural = "Fichiers stockés"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['last_accessed_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.path} ({self.ref_count} réf.)"
+
+
+class StorageUsage(models.Model):
+    """Total des octets stockés dans MEDIA_ROOT/downloads (ligne unique)
+
+    Mis à jour à chaque ajout ou suppression de fichier pour que la
+    vérification du quota n'ait jamais besoin d'un Sum() sur la table.
+    """
+    total_bytes = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Utilisation du stockage"
+        verbose_name_plural = "Utilisation du stockage"
+    
+    def __str__(self):
+        return f"{round(self.total_bytes / (1024 ** 3), 2)} GB"
+
+
+class DownloadRollup(models.Model):
+    """Téléchargements terminés agrégés par heure, plateforme et statut
+
+    Alimentée à chaque fin de téléchargement (voir rollups.py) : les
+    statistiques par plateforme et par période ne lisent que cette table,
+    dont la taille ne dépend pas de l'historique des téléchargements.
+    """
+    hour = models.DateTimeField(help_text="Début de l'heure de fin des téléchargements")
+    platform = models.ForeignKey(Platform, on_delete=models.CASCADE)
+    status = models.CharField(max_length=20)
+    count = models.PositiveIntegerField(default=0)
+    total_bytes = models.PositiveBigIntegerField(default=0)
+    total_duration = models.PositiveBigIntegerField(default=0, help_text="Durée cumulée des vidéos en secondes")
+    processing_seconds = models.FloatField(default=0, help_text="Temps de traitement cumulé en secondes")
+
+    class Meta:
+        verbose_name = "Agrégat horaire"
+        verbose_name_plural = "Agrégats horaires"
+        ordering = ['-hour']
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'platform', 'status'], name='unique_download_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} {self.platform_id} {self.status}: {self.count}"
+
+
 class VideoDownload(models.Model):
     """Modèle principal pour les téléchargements de vidéos"""
     STATUS_CHOICES = [
@@ -73,16 +150,41 @@ class VideoDownload(models.Model):
     requested_quality = models.CharField(max_length=50, default='best')
     download_audio_only = models.BooleanField(default=False)
     
+    # Clés de réutilisation : ID canonique de la vidéo et sélecteur de format normalisé
+    video_key = models.CharField(max_length=255, blank=True, null=True)
+    format_key = models.CharField(max_length=100, blank=True, null=True)
+    
     # Statut et progression
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     progress_percentage = models.PositiveSmallIntegerField(default=0)
     error_message = models.TextField(blank=True, null=True)
     
+    # Tâche Celery chargée du téléchargement (pour l'annulation)
+    celery_task_id = models.CharField(max_length=255, blank=True, null=True)
+    
     # Fichier téléchargé
     file_path = models.FileField(upload_to='downloads/', blank=True, null=True)
     file_size = models.PositiveBigIntegerField(blank=True, null=True, help_text="Taille en bytes")
     actual_quality = models.CharField(max_length=20, blank=True, null=True)
+    stored_file = models.ForeignKey(
+        StoredFile, on_delete=models.SET_NULL, blank=True, null=True, related_name='downloads'
+    )
     
+    # Téléchargement identique en cours dont on suit la progression (single-flight)
+    coalesced_with = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, blank=True, null=True, related_name='followers'
+    )
+
+    # Playlist ou chaîne : développée en téléchargements enfants dont elle agrège la progression
+    parent = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, blank=True, null=True, related_name='children'
+    )
+    is_playlist = models.BooleanField(default=False)
+    entry_count = models.PositiveIntegerField(default=0, help_text="Nombre d'entrées développées")
+    expanded_at = models.DateTimeField(blank=True, null=True)
+    finished_count = models.PositiveIntegerField(default=0, help_text="Vidéos de la playlist dans un état final")
+    completed_count = models.PositiveIntegerField(default=0, help_text="Vidéos de la playlist téléchargées")
+
     # Métadonnées
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True, null=True)
@@ -103,6 +205,12 @@ class VideoDownload(models.Model):
         indexes = [
             models.Index(fields=['status', 'created_at']),
             models.Index(fields=['platform', 'created_at']),
+            models.Index(fields=['video_key', 'format_key', 'status']),
+            models.Index(fields=['status', 'expires_at']),
+            # Pagination par curseur (tri, id)
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['completed_at', 'id']),
+            models.Index(fields=['file_size', 'id']),
         ]
     
     def __str__(self):
@@ -119,7 +227,7 @@ class VideoDownload(models.Model):
     def download_url(self):
         """URL de téléchargement du fichier"""
         if self.file_path:
-            return self.file_path.url
+            return reverse('download-file', args=[self.id])
         return None
     
     def get_filename(self):
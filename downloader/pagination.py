@@ -0,0 +1,135 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def encode_cursor(value, pk):
+    """Curseur opaque contenant la position (valeur du tri, id) de la dernière ligne"""
+    raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value, str(pk)])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Position (valeur du tri, id) contenue dans un curseur"""
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, pk
+    except (binascii.Error, TypeError, ValueError):
+        raise NotFound('Curseur invalide')
+
+
+class KeysetPagination(BasePagination):
+    """Pagination par curseur sur (champ de tri, id), sans COUNT ni OFFSET
+
+    Chaque page filtre les lignes situées après la dernière ligne de la
+    page précédente : son coût ne dépend que de la taille de la page,
+    quelle que soit sa profondeur. Les valeurs NULL (champs non
+    renseignés) sont placées en fin de liste dans les deux sens de tri :
+    les lignes renseignées puis les lignes NULL (triées par id) sont
+    parcourues comme deux segments, chacun par un simple parcours de
+    l'index (champ, id).
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    ordering_fields = ['created_at']
+    default_ordering = '-created_at'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, request):
+        """Champ et sens du tri (premier champ autorisé de ``ordering``)"""
+        ordering = request.query_params.get(self.ordering_query_param, '').split(',')[0].strip()
+        if ordering.lstrip('-') not in self.ordering_fields:
+            ordering = self.default_ordering
+        return ordering.lstrip('-'), ordering.startswith('-')
+
+    def seek(self, value, pk):
+        """Lignes situées après (value, pk) dans l'ordre du tri
+
+        Écrit ``champ <= v AND (champ < v OR id < pk)`` plutôt que
+        ``champ < v OR (champ = v AND id < pk)`` : la première borne
+        permet à la base de démarrer le parcours de l'index à la position
+        du curseur au lieu de lire toutes les lignes précédentes.
+        """
+        after, bound = ('lt', 'lte') if self.descending else ('gt', 'gte')
+        return Q(**{f'{self.field}__{bound}': value}) & (
+            Q(**{f'{self.field}__{after}': value}) | Q(**{f'pk__{after}': pk})
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request)
+        model_field = queryset.model._meta.get_field(self.field)
+        sign = '-' if self.descending else ''
+        limit = self.page_size + 1
+
+        value = pk = None
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, pk = decode_cursor(cursor)
+            try:
+                pk = queryset.model._meta.pk.to_python(pk)
+                if value is not None:
+                    value = model_field.to_python(value)
+            except ValidationError:
+                raise NotFound('Curseur invalide')
+
+        rows = []
+        # Segment des valeurs renseignées (absent si le curseur est déjà dans les NULL)
+        if not cursor or value is not None:
+            head = queryset.order_by(f'{sign}{self.field}', f'{sign}pk')
+            if model_field.null:
+                head = head.filter(**{f'{self.field}__isnull': False})
+            if cursor:
+                head = head.filter(self.seek(value, pk))
+            rows = list(head[:limit])
+
+        # Segment des valeurs NULL, lu seulement si la page n'est pas remplie
+        if model_field.null and len(rows) < limit:
+            tail = queryset.filter(**{f'{self.field}__isnull': True}).order_by(f'{sign}pk')
+            if cursor and value is None:
+                tail = tail.filter(**{f'pk__{"lt" if self.descending else "gt"}': pk})
+            rows += list(tail[:limit - len(rows)])
+
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(getattr(last, self.field), last.pk))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,73 @@
+import threading
+import time
+from urllib.parse import urlparse
+from django.conf import settings
+from .models import Platform
+
+# Domaines reconnus par plateforme (le domaine lui-même et ses sous-domaines)
+PLATFORM_DOMAINS = {
+    'youtube': ['youtube.com', 'youtu.be', 'youtube-nocookie.com'],
+    'facebook': ['facebook.com', 'fb.watch', 'fb.com'],
+    'instagram': ['instagram.com', 'instagr.am'],
+    'tiktok': ['tiktok.com'],
+    'twitter': ['twitter.com', 'x.com', 't.co'],
+    'vimeo': ['vimeo.com'],
+    'dailymotion': ['dailymotion.com', 'dai.ly'],
+}
+
+DOMAIN_PLATFORMS = {domain: name for name, domains in PLATFORM_DOMAINS.items() for domain in domains}
+
+# Plateformes en mémoire du processus, vidées par les signaux de Platform (voir signals.py)
+_platforms = None
+_platforms_loaded_at = 0.0
+_platforms_lock = threading.Lock()
+
+
+def detect_platform_name(url):
+    """Nom de la plateforme d'une URL, en mémoire (suffixes de domaine), ou None"""
+    try:
+        host = (urlparse(url).hostname or '').lower()
+    except ValueError:
+        return None
+    labels = host.split('.')
+    # Du domaine complet vers le domaine parent : m.youtube.com -> youtube.com
+    for index in range(len(labels) - 1):
+        name = DOMAIN_PLATFORMS.get('.'.join(labels[index:]))
+        if name:
+            return name
+    return None
+
+
+def get_platforms():
+    """Toutes les plateformes indexées par nom, chargées une fois par processus
+
+    Le cache est vidé à chaque enregistrement ou suppression d'une
+    Platform dans ce processus ; DOWNLOADER_PLATFORM_CACHE_TTL borne le
+    délai avant que les autres processus (workers) voient la modification.
+    """
+    global _platforms, _platforms_loaded_at
+    ttl = getattr(settings, 'DOWNLOADER_PLATFORM_CACHE_TTL', 60)
+    platforms = _platforms
+    if platforms is not None and time.monotonic() - _platforms_loaded_at < ttl:
+        return platforms
+    with _platforms_lock:
+        if _platforms is None or time.monotonic() - _platforms_loaded_at >= ttl:
+            _platforms = {platform.name: platform for platform in Platform.objects.all()}
+            _platforms_loaded_at = time.monotonic()
+        return _platforms
+
+
+def invalidate_platforms(**kwargs):
+    """Vide le cache des plateformes (récepteur des signaux post_save/post_delete)"""
+    global _platforms
+    _platforms = None
+
+
+def detect_platform(url):
+    """Platform d'une URL (active ou non), ou None, sans requête une fois le cache chargé"""
+    return get_platforms().get(detect_platform_name(url))
+
+
+def active_platforms():
+    """Plateformes actives indexées par nom"""
+    return {name: platform for name, platform in get_platforms().items() if platform.is_active}
@@ -0,0 +1,150 @@
+import logging
+from datetime import timedelta
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from .events import TERMINAL_STATUSES, publish_download
+from .inflight import ACTIVE_STATUSES
+from .models import VideoDownload
+from .storage import default_expiry
+
+logger = logging.getLogger(__name__)
+
+
+def entry_url(entry):
+    """URL d'une entrée de playlist extraite à plat (``extract_flat``), ou None"""
+    if not isinstance(entry, dict):
+        return None
+    url = entry.get('webpage_url') or entry.get('url')
+    if not url or not url.startswith(('http://', 'https://')):
+        return None
+    return url
+
+
+def iter_entry_urls(info):
+    """URLs des entrées d'une playlist, au fil des pages extraites par yt-dlp
+
+    Avec ``lazy_playlist`` les entrées sont un générateur : chaque page
+    n'est demandée à la plateforme qu'au moment où elle est parcourue.
+    """
+    seen = set()
+    for entry in info.get('entries') or []:
+        url = entry_url(entry)
+        if url and url not in seen:
+            seen.add(url)
+            yield url
+
+
+def count_children(parent_id):
+    """Décompte des vidéos d'une playlist par agrégation (réparation des compteurs)"""
+    return VideoDownload.objects.filter(parent_id=parent_id).aggregate(
+        total=Count('id'),
+        finished=Count('id', filter=Q(status__in=TERMINAL_STATUSES)),
+        completed=Count('id', filter=Q(status='completed')),
+    )
+
+
+def repair_parent_counts(parent_id):
+    """Recalcule les compteurs d'une playlist à partir de ses enfants et les enregistre"""
+    counts = count_children(parent_id)
+    VideoDownload.objects.filter(id=parent_id).update(
+        finished_count=counts['finished'], completed_count=counts['completed']
+    )
+    return counts
+
+
+def update_parent_progress(parent_id):
+    """Met à jour l'état d'une playlist à partir de ses compteurs
+
+    La progression vient de ``finished_count`` / ``entry_count``, sans
+    parcourir les enfants. Quand les compteurs indiquent une playlist
+    développée et entièrement terminée, ils sont vérifiés (et réparés)
+    par une agrégation avant de conclure : ``completed`` si au moins une
+    vidéo a été téléchargée, ``failed`` sinon. Une playlist annulée
+    n'est plus mise à jour.
+    """
+    parent = VideoDownload.objects.filter(id=parent_id, status__in=ACTIVE_STATUSES).first()
+    if parent is None:
+        return None
+
+    total, finished, completed = parent.entry_count, parent.finished_count, parent.completed_count
+    if parent.expanded_at and finished >= total:
+        counts = repair_parent_counts(parent_id)
+        total, finished, completed = counts['total'], counts['finished'], counts['completed']
+
+    fields = {'progress_percentage': min(finished * 100 // total, 99) if total else 0}
+    if parent.expanded_at and finished == total:
+        now = timezone.now()
+        fields['completed_at'] = now
+        if completed:
+            fields.update(status='completed', progress_percentage=100, expires_at=default_expiry(now))
+        else:
+            fields.update(
+                status='failed',
+                error_message=parent.error_message or "Aucune vidéo de la playlist n'a pu être téléchargée"
+            )
+
+    if not VideoDownload.objects.filter(id=parent_id, status__in=ACTIVE_STATUSES).update(
+        updated_at=timezone.now(), **fields
+    ):
+        return None
+    for field, value in fields.items():
+        setattr(parent, field, value)
+    publish_download(parent)
+
+    # Playlist imbriquée (onglet d'une chaîne...) : la playlist englobante suit
+    if parent.status in TERMINAL_STATUSES and parent.parent_id:
+        children_finished([parent.id])
+    return parent
+
+
+def children_finished(download_ids, status=None):
+    """Compte dans leur playlist des téléchargements qui viennent de se terminer
+
+    À appeler une seule fois par téléchargement, au moment de son passage
+    à un état final (comme ``rollups.record_finished``) ; ``status``
+    restreint le décompte aux téléchargements effectivement passés dans
+    cet état. Les compteurs sont incrémentés avec F(), puis l'état des
+    playlists concernées est mis à jour.
+    """
+    ids = [download_id for download_id in download_ids if download_id]
+    if not ids:
+        return
+    children = VideoDownload.objects.filter(id__in=ids, parent__isnull=False, status__in=TERMINAL_STATUSES)
+    if status:
+        children = children.filter(status=status)
+    try:
+        groups = list(children.order_by().values('parent_id').annotate(
+            finished=Count('id'), completed=Count('id', filter=Q(status='completed'))
+        ))
+    except Exception as e:
+        logger.warning(f"Erreur lors du décompte des vidéos terminées: {e}")
+        return
+    for group in groups:
+        try:
+            VideoDownload.objects.filter(id=group['parent_id']).update(
+                finished_count=F('finished_count') + group['finished'],
+                completed_count=F('completed_count') + group['completed'],
+            )
+            update_parent_progress(group['parent_id'])
+        except Exception as e:
+            logger.warning(f"Erreur lors de la mise à jour de la playlist {group['parent_id']}: {e}")
+
+
+def repair_stalled_playlists(idle_seconds, limit):
+    """Répare les compteurs des playlists développées sans nouvelle depuis ``idle_seconds``
+
+    Filet de sécurité si une fin de vidéo n'a pas été comptée (worker
+    arrêté entre les deux écritures...). Retourne le nombre de playlists
+    vérifiées.
+    """
+    stalled = list(VideoDownload.objects.filter(
+        is_playlist=True, status__in=ACTIVE_STATUSES, expanded_at__isnull=False,
+        updated_at__lt=timezone.now() - timedelta(seconds=idle_seconds),
+    ).order_by('updated_at').values_list('id', flat=True)[:limit])
+    for parent_id in stalled:
+        try:
+            repair_parent_counts(parent_id)
+            update_parent_progress(parent_id)
+        except Exception as e:
+            logger.warning(f"Erreur lors de la réparation de la playlist {parent_id}: {e}")
+    return len(stalled)
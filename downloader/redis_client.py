@@ -0,0 +1,26 @@
+import redis
+import redis.asyncio
+from functools import lru_cache
+from django.conf import settings
+
+
+def get_redis_url():
+    """URL Redis partagée entre le serveur web et les workers"""
+    return getattr(settings, 'DOWNLOADER_REDIS_URL', 'redis://localhost:6379/1')
+
+
+@lru_cache(maxsize=None)
+def get_redis():
+    """Client Redis synchrone (un pool de connexions par processus)"""
+    return redis.Redis.from_url(get_redis_url(), decode_responses=True)
+
+
+def get_async_redis():
+    """Client Redis asynchrone, à fermer par l'appelant (aclose)"""
+    return redis.asyncio.Redis.from_url(get_redis_url(), decode_responses=True)
+
+
+@lru_cache(maxsize=None)
+def get_broker_redis():
+    """Client Redis du broker Celery (lecture de la longueur des files)"""
+    return redis.Redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
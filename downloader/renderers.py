@@ -0,0 +1,14 @@
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+class NDJSONRenderer(BaseRenderer):
+    """JSON délimité par des retours à la ligne (un objet par ligne)"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        items = data if isinstance(data, list) else [data]
+        return ''.join(json.dumps(item, cls=DjangoJSONEncoder) + '\n' for item in items).encode(self.charset)
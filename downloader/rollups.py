@@ -0,0 +1,115 @@
+import logging
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Min, Sum
+from django.db.models.functions import TruncHour
+from .events import TERMINAL_STATUSES
+from .models import DownloadRollup, VideoDownload
+from .platforms import get_platforms
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def rollup_groups(queryset):
+    """Agrège des téléchargements terminés par heure de fin, plateforme et statut
+
+    Les playlists sont exclues : seules leurs vidéos sont comptées.
+    """
+    processing = ExpressionWrapper(F('completed_at') - F('started_at'), output_field=DurationField())
+    return queryset.filter(
+        status__in=TERMINAL_STATUSES, completed_at__isnull=False, is_playlist=False
+    ).annotate(hour=TruncHour('completed_at')).order_by().values('hour', 'platform_id', 'status').annotate(
+        downloads=Count('id'),
+        bytes=Sum('file_size'),
+        duration=Sum('duration'),
+        processing=Sum(processing),
+    )
+
+
+def rollup_fields(group):
+    """Valeurs d'un agrégat horaire à partir d'un groupe de ``rollup_groups``"""
+    return {
+        'count': group['downloads'],
+        'total_bytes': group['bytes'] or 0,
+        'total_duration': group['duration'] or 0,
+        'processing_seconds': group['processing'].total_seconds() if group['processing'] else 0,
+    }
+
+
+def add_to_rollup(group):
+    """Ajoute un groupe de téléchargements à son agrégat horaire (créé au besoin)"""
+    key = {'hour': group['hour'], 'platform_id': group['platform_id'], 'status': group['status']}
+    fields = rollup_fields(group)
+    increments = {field: F(field) + value for field, value in fields.items()}
+    if DownloadRollup.objects.filter(**key).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            DownloadRollup.objects.create(**key, **fields)
+    except IntegrityError:
+        # Créé entre-temps par un autre worker
+        DownloadRollup.objects.filter(**key).update(**increments)
+
+
+def record_finished(download_ids, status=None):
+    """Ajoute aux agrégats horaires (et aux métriques) des téléchargements qui viennent de se terminer
+
+    À appeler une seule fois par téléchargement, au moment de son passage
+    à un état final ; ``status`` restreint l'ajout aux téléchargements
+    effectivement passés dans cet état. Les erreurs sont journalisées
+    sans faire échouer le téléchargement.
+    """
+    ids = [download_id for download_id in download_ids if download_id]
+    if not ids:
+        return
+    downloads = VideoDownload.objects.filter(id__in=ids)
+    if status:
+        downloads = downloads.filter(status=status)
+    try:
+        platforms = {platform.pk: platform.name for platform in get_platforms().values()}
+        for group in rollup_groups(downloads):
+            add_to_rollup(group)
+            metrics.inc(
+                'downloader_downloads_finished_total', group['downloads'],
+                platform=platforms.get(group['platform_id'], 'unknown'), status=group['status']
+            )
+    except Exception as e:
+        logger.warning(f"Erreur lors de la mise à jour des agrégats horaires: {e}")
+
+
+def rebuild_rollups(since=None, until=None):
+    """Recalcule les agrégats horaires d'une période à partir des téléchargements
+
+    Sans ``since``, la période commence à l'heure du plus ancien
+    téléchargement terminé encore en base : les agrégats plus anciens,
+    dont les téléchargements ont été nettoyés, sont conservés. Retourne
+    le nombre d'agrégats créés.
+    """
+    downloads = VideoDownload.objects.all()
+    if since is None:
+        oldest = downloads.filter(status__in=TERMINAL_STATUSES, is_playlist=False).aggregate(
+            oldest=Min('completed_at')
+        )['oldest']
+        if oldest is None:
+            return 0
+        since = oldest
+    since = since.replace(minute=0, second=0, microsecond=0)
+
+    rollups = DownloadRollup.objects.filter(hour__gte=since)
+    downloads = downloads.filter(completed_at__gte=since)
+    if until is not None:
+        until = until.replace(minute=0, second=0, microsecond=0)
+        rollups = rollups.filter(hour__lt=until)
+        downloads = downloads.filter(completed_at__lt=until)
+
+    with transaction.atomic():
+        rollups.delete()
+        created = DownloadRollup.objects.bulk_create(
+            (
+                DownloadRollup(hour=group['hour'], platform_id=group['platform_id'], status=group['status'],
+                               **rollup_fields(group))
+                for group in rollup_groups(downloads).iterator()
+            ),
+            batch_size=1000,
+        )
+    return len(created)
@@ -0,0 +1,29 @@
+from .extraction import needs_postprocessing
+from .models import VideoDownload
+
+METADATA_QUEUE = 'metadata'
+TRANSFER_QUEUE = 'transfer'
+POSTPROCESS_QUEUE = 'postprocess'
+MAINTENANCE_QUEUE = 'maintenance'
+
+
+def queue_for(requested_quality, audio_only=False):
+    """File Celery d'un téléchargement selon le format demandé"""
+    return POSTPROCESS_QUEUE if needs_postprocessing(requested_quality, audio_only) else TRANSFER_QUEUE
+
+
+def route_download(name, args, kwargs, options, task=None, **kw):
+    """Routeur Celery des téléchargements (voir CELERY_TASK_ROUTES)
+
+    Les téléchargements qui passent par ffmpeg (fusion, extraction audio)
+    vont dans la file ``postprocess``, les autres dans ``transfer``.
+    """
+    if name != 'downloader.tasks.download_video_task' or options.get('queue'):
+        return None
+    download_id = args[0] if args else (kwargs or {}).get('download_id')
+    download = VideoDownload.objects.filter(id=download_id).values(
+        'requested_quality', 'download_audio_only'
+    ).first()
+    if download is None:
+        return {'queue': TRANSFER_QUEUE}
+    return {'queue': queue_for(download['requested_quality'], download['download_audio_only'])}
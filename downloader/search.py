@@ -0,0 +1,158 @@
+import logging
+import re
+from django.db import connections
+from rest_framework.filters import SearchFilter
+
+logger = logging.getLogger(__name__)
+
+# Index plein texte SQLite (FTS5), tenu à jour par des triggers
+FTS_TABLE = 'downloader_videodownload_fts'
+FTS_TRIGGERS = ['downloader_videodownload_fts_insert', 'downloader_videodownload_fts_update',
+                'downloader_videodownload_fts_delete']
+
+# Vecteur PostgreSQL : l'expression doit être identique dans l'index et dans les requêtes
+PG_VECTOR = "to_tsvector('simple', coalesce({table}title, '') || ' ' || {table}source_url)"
+
+SQLITE_INSTALL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        download_id, title, source_url, tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS downloader_videodownload_fts_insert
+    AFTER INSERT ON downloader_videodownload BEGIN
+        INSERT INTO {FTS_TABLE}(download_id, title, source_url) VALUES (new.id, new.title, new.source_url);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS downloader_videodownload_fts_update
+    AFTER UPDATE OF title, source_url ON downloader_videodownload
+    WHEN old.title IS NOT new.title OR old.source_url IS NOT new.source_url BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid IN (
+            SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH 'download_id:"' || old.id || '"'
+        );
+        INSERT INTO {FTS_TABLE}(download_id, title, source_url) VALUES (new.id, new.title, new.source_url);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS downloader_videodownload_fts_delete
+    AFTER DELETE ON downloader_videodownload BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid IN (
+            SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH 'download_id:"' || old.id || '"'
+        );
+    END""",
+]
+
+POSTGRES_INSTALL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS downloader_videodownload_search_idx ON downloader_videodownload USING gin (({PG_VECTOR.format(table='')}))",
+    "CREATE INDEX IF NOT EXISTS downloader_videodownload_title_trgm_idx "
+    "ON downloader_videodownload USING gin (title gin_trgm_ops)",
+]
+
+
+def install(connection):
+    """Crée l'index plein texte de la base (sans effet s'il existe déjà)"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for statement in SQLITE_INSTALL:
+                cursor.execute(statement)
+        elif connection.vendor == 'postgresql':
+            for statement in POSTGRES_INSTALL:
+                cursor.execute(statement)
+
+
+def uninstall(connection):
+    """Supprime l'index plein texte"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for trigger in FTS_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS downloader_videodownload_search_idx')
+            cursor.execute('DROP INDEX IF EXISTS downloader_videodownload_title_trgm_idx')
+
+
+def rebuild(connection):
+    """Réindexe tous les téléchargements (SQLite ; les index PostgreSQL sont calculés par la base)"""
+    if connection.vendor != 'sqlite':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE}(download_id, title, source_url) '
+            'SELECT id, title, source_url FROM downloader_videodownload'
+        )
+        return cursor.rowcount
+
+
+def ensure_index(sender=None, using='default', **kwargs):
+    """Recrée l'index SQLite après une migration qui a reconstruit la table (triggers supprimés)"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    tables = connection.introspection.table_names()
+    if 'downloader_videodownload' not in tables:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)", FTS_TRIGGERS
+        )
+        installed = cursor.fetchone()[0] == len(FTS_TRIGGERS) and FTS_TABLE in tables
+    if not installed:
+        logger.warning("Index plein texte absent ou incomplet : reconstruction")
+        install(connection)
+        rebuild(connection)
+
+
+def search_tokens(terms):
+    """Mots des termes recherchés (les caractères spéciaux des syntaxes de requête sont écartés)"""
+    return [tokens for tokens in (re.findall(r'\w+', term) for term in terms) if tokens]
+
+
+def search(queryset, terms):
+    """Téléchargements correspondant aux termes (tous requis), annotés par ``search_rank``
+
+    Chaque terme est recherché comme préfixe de mot dans le titre ou
+    l'URL. Retourne None sans mot exploitable ou si la base (ni SQLite ni
+    PostgreSQL) ne dispose pas d'index plein texte.
+    """
+    tokens = search_tokens(terms)
+    vendor = connections[queryset.db].vendor
+    if not tokens or vendor not in ('sqlite', 'postgresql'):
+        return None
+
+    if vendor == 'sqlite':
+        match = ' AND '.join('{title source_url} : "%s"*' % ' '.join(words) for words in tokens)
+        return queryset.extra(
+            select={'search_rank': f'-{FTS_TABLE}.rank'},
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.download_id = downloader_videodownload.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        )
+
+    vector = PG_VECTOR.format(table='downloader_videodownload.')
+    tsquery = ' & '.join(f'{word}:*' for words in tokens for word in words)
+    titles = ' '.join(' '.join(words) for words in tokens)
+    like = ' AND '.join(['downloader_videodownload.title ILIKE %s'] * len(terms))
+    return queryset.extra(
+        select={'search_rank': f"ts_rank({vector}, to_tsquery('simple', %s)) "
+                               "+ similarity(coalesce(downloader_videodownload.title, ''), %s)"},
+        select_params=[tsquery, titles],
+        where=[f"({vector} @@ to_tsquery('simple', %s) OR ({like}))"],
+        params=[tsquery] + [f'%{term}%' for term in terms],
+    )
+
+
+class FullTextSearchFilter(SearchFilter):
+    """Recherche plein texte classée par pertinence (``search_fields`` en l'absence d'index)
+
+    Sans paramètre ``ordering``, les résultats les plus pertinents sont
+    listés en premier. À placer après ``OrderingFilter``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        results = search(queryset, terms)
+        if results is None:
+            return super().filter_queryset(request, queryset, view)
+        if not request.query_params.get('ordering'):
+            results = results.order_by('-search_rank', '-created_at')
+        return results
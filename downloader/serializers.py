@@ -1,11 +1,16 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from .models import (
     Platform, VideoDownload, SupportedFormat
 )
-import re
-from urllib.parse import urlparse
+from .extraction import canonical_video_key, is_playlist_key, normalize_format_key
+from .storage import acquire_file, find_reusable_download, reuse_fields
+from .events import publish_download
+from .platforms import detect_platform
+from . import inflight
 
 
 class PlatformSerializer(serializers.ModelSerializer):
@@ -13,7 +18,8 @@ class PlatformSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Platform
-        fields = ['id', 'name', 'display_name', 'is_active', 'base_url', 'created_at']
+        fields = ['id', 'name', 'display_name', 'is_active', 'base_url', 'max_concurrent_downloads',
+                  'rate_limit_per_minute', 'rate_limit_burst', 'created_at']
         read_only_fields = ['id', 'created_at']
 
 
@@ -49,7 +55,7 @@ class VideoDownloadCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("URL invalide")
         
         # Détection de la plateforme
-        platform = self.detect_platform(value)
+        platform = detect_platform(value)
         if not platform:
             raise serializers.ValidationError(
                 "Plateforme non supportée. Plateformes supportées : YouTube, Facebook, Instagram, TikTok, Twitter, Vimeo, Dailymotion"
@@ -61,34 +67,10 @@ class VideoDownloadCreateSerializer(serializers.ModelSerializer):
         
         return value
     
-    def detect_platform(self, url):
-        """Détecte la plateforme à partir de l'URL"""
-        domain = urlparse(url).netloc.lower()
-        
-        platform_patterns = {
-            'youtube': [r'youtube\.com', r'youtu\.be', r'youtube-nocookie\.com'],
-            'facebook': [r'facebook\.com', r'fb\.watch', r'fb\.com'],
-            'instagram': [r'instagram\.com', r'instagr\.am'],
-            'tiktok': [r'tiktok\.com', r'vm\.tiktok\.com'],
-            'twitter': [r'twitter\.com', r'x\.com', r't\.co'],
-            'vimeo': [r'vimeo\.com', r'player\.vimeo\.com'],
-            'dailymotion': [r'dailymotion\.com', r'dai\.ly'],
-        }
-        
-        for platform_name, patterns in platform_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, domain):
-                    try:
-                        return Platform.objects.get(name=platform_name, is_active=True)
-                    except Platform.DoesNotExist:
-                        continue
-        
-        return None
-    
     def create(self, validated_data):
         """Crée un nouveau téléchargement avec la plateforme détectée"""
         source_url = validated_data['source_url']
-        platform = self.detect_platform(source_url)
+        platform = detect_platform(source_url)
         
         # Ajouter les métadonnées de la requête
         request = self.context.get('request')
@@ -97,7 +79,46 @@ class VideoDownloadCreateSerializer(serializers.ModelSerializer):
             validated_data['user_agent'] = request.META.get('HTTP_USER_AGENT', '')
         
         validated_data['platform'] = platform
-        return super().create(validated_data)
+        validated_data['video_key'] = canonical_video_key(source_url)
+        validated_data['format_key'] = normalize_format_key(
+            validated_data.get('requested_quality', 'best'),
+            validated_data.get('download_audio_only', False)
+        )
+        
+        # Playlist ou chaîne : développée en téléchargements enfants, jamais réutilisée
+        if is_playlist_key(validated_data['video_key']):
+            validated_data['is_playlist'] = True
+            return super().create(validated_data)
+        
+        # Réutilise le fichier d'un téléchargement identique déjà terminé
+        with transaction.atomic():
+            source = find_reusable_download(validated_data['video_key'], validated_data['format_key'])
+            if source and acquire_file(source.stored_file_id):
+                validated_data.update(reuse_fields(source))
+            instance = super().create(validated_data)
+        
+        if instance.status != 'completed':
+            self.attach_to_inflight(instance)
+        return instance
+    
+    def attach_to_inflight(self, instance):
+        """Rattache le téléchargement à un téléchargement identique déjà en cours"""
+        leader_id = inflight.claim(instance.video_key, instance.format_key, instance.id)
+        if leader_id is None:
+            return
+        
+        leader = VideoDownload.objects.filter(id=leader_id, status__in=inflight.ACTIVE_STATUSES).first()
+        if leader is None:
+            # Le leader est terminé ou a échoué : ce téléchargement prend sa place
+            inflight.takeover(instance.video_key, instance.format_key, instance.id)
+            return
+        
+        instance.coalesced_with = leader
+        instance.status = leader.status
+        instance.progress_percentage = leader.progress_percentage
+        instance.started_at = leader.started_at
+        instance.save(update_fields=['coalesced_with', 'status', 'progress_percentage', 'started_at', 'updated_at'])
+        publish_download(instance)
     
     def get_client_ip(self, request):
         """Récupère l'IP du client"""
@@ -128,13 +149,15 @@ class VideoDownloadSerializer(serializers.ModelSerializer):
             'download_audio_only', 'status', 'status_display',
             'progress_percentage', 'error_message', 'file_path',
             'file_size', 'file_size_mb', 'actual_quality',
-            'download_url', 'filename', 'created_at', 'updated_at',
+            'download_url', 'filename', 'parent', 'is_playlist',
+            'entry_count', 'expanded_at', 'created_at', 'updated_at',
             'started_at', 'completed_at', 'expires_at'
         ]
         read_only_fields = [
             'id', 'platform', 'title', 'description', 'duration',
             'thumbnail_url', 'status', 'progress_percentage',
             'error_message', 'file_path', 'file_size', 'actual_quality',
+            'parent', 'is_playlist', 'entry_count', 'expanded_at',
             'created_at', 'updated_at', 'started_at', 'completed_at'
         ]
     
@@ -199,9 +222,7 @@ class URLValidationSerializer(serializers.Serializer):
     
     def validate_url(self, value):
         """Valide l'URL et retourne les informations de la plateforme"""
-        # Réutilise la logique de détection de plateforme
-        create_serializer = VideoDownloadCreateSerializer()
-        platform = create_serializer.detect_platform(value)
+        platform = detect_platform(value)
         
         if not platform:
             raise serializers.ValidationError(
@@ -218,8 +239,7 @@ class URLValidationSerializer(serializers.Serializer):
     def to_representation(self, instance):
         """Retourne les informations de validation"""
         url = instance.get('url')
-        create_serializer = VideoDownloadCreateSerializer()
-        platform = create_serializer.detect_platform(url)
+        platform = detect_platform(url)
         
         return {
             'url': url,
@@ -233,32 +253,29 @@ class URLValidationSerializer(serializers.Serializer):
 
 class BulkDownloadSerializer(serializers.Serializer):
     """Serializer pour les téléchargements en lot"""
+    # Chaque URL est validée individuellement (voir bulk.create_bulk_downloads) :
+    # une URL invalide est signalée dans les résultats sans rejeter le lot
     urls = serializers.ListField(
-        child=serializers.URLField(),
+        child=serializers.CharField(max_length=2000),
         min_length=1,
-        max_length=10,  # Limite à 10 URLs par lot
-        help_text="Liste des URLs à télécharger (max 10)"
+        max_length=getattr(settings, 'DOWNLOADER_BULK_MAX_URLS', 50000),
+        help_text="Liste des URLs à télécharger"
     )
     requested_quality = serializers.ChoiceField(
         choices=VideoDownload.QUALITY_CHOICES,
         default='best'
     )
     download_audio_only = serializers.BooleanField(default=False)
-    
-    def validate_urls(self, value):
-        """Valide chaque URL dans la liste"""
-        create_serializer = VideoDownloadCreateSerializer()
-        valid_urls = []
-        
-        for url in value:
-            try:
-                platform = create_serializer.detect_platform(url)
-                if platform and platform.is_active:
-                    valid_urls.append(url)
-            except:
-                continue
-        
-        if not valid_urls:
-            raise serializers.ValidationError("Aucune URL valide trouvée")
-        
-        return valid_urls
\ No newline at end of file
+
+
+class DownloadStatsAggregatedSerializer(serializers.Serializer):
+    """Serializer pour les statistiques agrégées de téléchargement"""
+    total_downloads = serializers.IntegerField()
+    successful_downloads = serializers.IntegerField()
+    failed_downloads = serializers.IntegerField()
+    success_rate = serializers.FloatField()
+    total_size_gb = serializers.FloatField()
+    most_popular_platform = serializers.CharField()
+    avg_file_size_mb = serializers.FloatField()
+    downloads_last_24h = serializers.IntegerField()
+    downloads_last_week = serializers.IntegerField()
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date
+from .events import TERMINAL_STATUSES, get_snapshot
+from .extraction import needs_postprocessing
+from .models import VideoDownload
+from .redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range_header(header, size):
+    """Analyse un en-tête Range à plage unique
+
+    Retourne ``(début, fin)`` inclusifs, None si l'en-tête est absent ou
+    non géré (plages multiples : fichier complet), et lève ValueError si
+    la plage ne peut pas être satisfaite.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffixe : les N derniers octets
+        length = int(end)
+        if length == 0:
+            raise ValueError("Plage vide")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("Plage hors du fichier")
+    return start, end
+
+
+def iter_file_range(path, start, end, chunk_size=CHUNK_SIZE):
+    """Lit les octets ``start`` à ``end`` (inclus) d'un fichier par blocs"""
+    remaining = end - start + 1
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request, relative_path, filename):
+    """Réponse servant un fichier de MEDIA_ROOT
+
+    Selon DOWNLOADER_SENDFILE_BACKEND, le transfert est délégué au proxy
+    (``nginx`` : X-Accel-Redirect, ``apache`` : X-Sendfile), qui gère
+    aussi les requêtes Range. Sinon le fichier est servi par Django :
+    FileResponse (sendfile via wsgi.file_wrapper) pour le fichier complet,
+    réponse 206 pour une plage.
+    """
+    full_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    backend = getattr(settings, 'DOWNLOADER_SENDFILE_BACKEND', None)
+
+    if backend == 'nginx':
+        prefix = getattr(settings, 'DOWNLOADER_ACCEL_REDIRECT_PREFIX', '/protected/')
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(relative_path)
+    elif backend == 'apache':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = os.path.abspath(full_path)
+    else:
+        size = os.path.getsize(full_path)
+        try:
+            byte_range = parse_range_header(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        if byte_range is None:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                iter_file_range(full_path, start, end), status=206, content_type=content_type
+            )
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Accept-Ranges'] = 'bytes'
+        response['Last-Modified'] = http_date(os.path.getmtime(full_path))
+
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def partial_file_key(download_id):
+    """Clé du cache contenant le fichier en cours d'écriture par le worker"""
+    return f'downloader:downloads:{download_id}:partial_file'
+
+
+def set_partial_file(download_id, tmpfilename, filename):
+    """Mémorise (relativement à MEDIA_ROOT) les fichiers d'un téléchargement en cours"""
+    paths = {
+        'tmpfilename': os.path.relpath(tmpfilename, settings.MEDIA_ROOT) if tmpfilename else None,
+        'filename': os.path.relpath(filename, settings.MEDIA_ROOT) if filename else None,
+    }
+    try:
+        cache.set(partial_file_key(download_id), paths, timeout=getattr(settings, 'DOWNLOADER_INFLIGHT_TTL', 2 * 3600))
+    except Exception as e:
+        logger.warning(f"Erreur lors de l'enregistrement du fichier partiel {download_id}: {e}")
+
+
+def is_streamable(download):
+    """Indique si le fichier peut être diffusé pendant son écriture
+
+    Seuls les formats à fichier unique s'y prêtent : un format fusionné
+    (``merge``) ou converti n'existe qu'après le post-traitement.
+    """
+    return not needs_postprocessing(download.requested_quality, download.download_audio_only)
+
+
+async def current_status(download_id, client=None):
+    """Statut d'un téléchargement : dernier événement publié, sinon la base"""
+    snapshot = await get_snapshot(download_id, client=client)
+    if snapshot:
+        try:
+            return json.loads(snapshot).get('status')
+        except (TypeError, ValueError):
+            pass
+    return await VideoDownload.objects.filter(id=download_id).values_list('status', flat=True).afirst()
+
+
+def open_partial_file(paths):
+    """Ouvre le fichier en cours d'écriture, ou le fichier final s'il a déjà été renommé"""
+    for name in ('tmpfilename', 'filename'):
+        if not (paths or {}).get(name):
+            continue
+        try:
+            return open(os.path.join(settings.MEDIA_ROOT, paths[name]), 'rb')
+        except FileNotFoundError:
+            continue
+    return None
+
+
+async def tail_download(download_id, chunk_size=CHUNK_SIZE):
+    """Générateur asynchrone des octets d'un fichier en cours de téléchargement
+
+    Le descripteur reste valide quand yt-dlp renomme ``.part`` en fichier
+    final. Un bloc n'est lu que lorsque le précédent a été envoyé, ce qui
+    laisse le serveur ASGI réguler le débit sur celui du client. Le flux
+    se termine une fois le fichier lu en entier après la fin de la tâche.
+    Un seul client Redis est ouvert pour toute la durée du flux.
+    """
+    poll_interval = getattr(settings, 'DOWNLOADER_STREAM_POLL_INTERVAL', 0.5)
+    idle_timeout = getattr(settings, 'DOWNLOADER_STREAM_IDLE_TIMEOUT', 120)
+    f = None
+    finished = False
+    idle = 0.0
+    client = get_async_redis()
+    try:
+        while True:
+            if f is None:
+                f = open_partial_file(await cache.aget(partial_file_key(download_id)))
+            if f is not None:
+                chunk = await asyncio.to_thread(f.read, chunk_size)
+                if chunk:
+                    idle = 0.0
+                    yield chunk
+                    continue
+            if finished:
+                return
+
+            status = await current_status(download_id, client=client)
+            if status == 'completed':
+                if f is None:
+                    file_path = await VideoDownload.objects.filter(id=download_id).values_list('file_path', flat=True).afirst()
+                    f = open_partial_file({'filename': file_path})
+                # Dernière lecture jusqu'à la fin du fichier
+                finished = True
+                continue
+            if status in TERMINAL_STATUSES or status is None:
+                return
+
+            await asyncio.sleep(poll_interval)
+            idle += poll_interval
+            if idle >= idle_timeout:
+                logger.warning(f"Diffusion progressive de {download_id} interrompue : aucune donnée depuis {idle_timeout}s")
+                return
+    finally:
+        if f is not None:
+            f.close()
+        await client.aclose()
@@ -0,0 +1,41 @@
+from celery.signals import worker_ready, worker_shutdown
+from django.db.models.signals import post_delete, post_save
+from django.db import transaction
+from django.dispatch import receiver
+from .heartbeats import HeartbeatThread
+from .models import Platform, VideoDownload
+from .platforms import invalidate_platforms
+from .versions import invalidate_versions
+
+# Thread des battements du worker Celery courant
+_heartbeat = None
+
+
+@receiver([post_save, post_delete], sender=Platform, dispatch_uid='downloader_invalidate_platforms')
+def platform_changed(sender, **kwargs):
+    """Une plateforme ajoutée, modifiée ou supprimée invalide le cache des plateformes"""
+    invalidate_platforms()
+
+
+@receiver(post_save, sender=VideoDownload, dispatch_uid='downloader_invalidate_version')
+def download_changed(sender, instance, **kwargs):
+    """Un téléchargement enregistré invalide son jeton de version (ETag) en cache"""
+    transaction.on_commit(lambda: invalidate_versions([instance.pk]))
+
+
+@worker_ready.connect(dispatch_uid='downloader_start_heartbeat')
+def start_heartbeat(sender=None, **kwargs):
+    """Démarre les battements du worker (lus par health/)"""
+    global _heartbeat
+    if _heartbeat is None:
+        _heartbeat = HeartbeatThread(sender)
+        _heartbeat.start()
+
+
+@worker_shutdown.connect(dispatch_uid='downloader_stop_heartbeat')
+def stop_heartbeat(sender=None, **kwargs):
+    """Retire le worker des battements lors d'un arrêt propre"""
+    global _heartbeat
+    if _heartbeat is not None:
+        _heartbeat.stop()
+        _heartbeat = None
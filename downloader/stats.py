@@ -0,0 +1,196 @@
+import logging
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from .models import DownloadRollup, VideoDownload
+from .platforms import get_platforms
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_STATS_KEY = 'downloader:stats:downloads'
+PLATFORM_STATS_KEY = 'downloader:stats:platforms'
+
+# Intervalle de lecture du cache pendant l'attente d'un recalcul (secondes)
+STATS_WAIT_POLL = 0.05
+
+
+def recompute_lock_key(key):
+    """Verrou empêchant plusieurs recalculs simultanés d'une même statistique"""
+    return f'{key}:recompute'
+
+
+class StatsPending(Exception):
+    """Statistique absente du cache et recalculée par un autre client"""
+
+
+def wait_for_recompute(key, lock_key, wait):
+    """Attend la valeur recalculée par le détenteur du verrou
+
+    Retourne ``(entrée, verrou pris)`` : l'entrée dès qu'elle apparaît, ou
+    le verrou si son détenteur l'a libéré (ou perdu) sans rien écrire.
+    """
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(STATS_WAIT_POLL)
+        entry = cache.get(key)
+        if entry:
+            return entry, False
+        if cache.add(lock_key, 1, timeout=60):
+            return None, True
+    return None, False
+
+
+def cached_stats(key, compute, ttl=None):
+    """Statistiques servies depuis le cache, recalculées par un seul client à la fois
+
+    La valeur est conservée au-delà de sa fraîcheur (DOWNLOADER_STATS_STALE_TTL) :
+    quand elle a expiré, le client qui obtient le verrou la recalcule
+    pendant que les autres reçoivent encore l'ancienne valeur, au lieu
+    de lancer tous ensemble la même agrégation. Sans valeur en cache,
+    les autres clients attendent le recalcul (DOWNLOADER_STATS_WAIT
+    secondes au plus) puis lèvent StatsPending.
+    """
+    ttl = ttl or getattr(settings, 'DOWNLOADER_STATS_CACHE_TTL', 10)
+    stale_ttl = getattr(settings, 'DOWNLOADER_STATS_STALE_TTL', 300)
+    try:
+        entry = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Erreur lors de la lecture des statistiques {key}: {e}")
+        return compute()
+
+    if entry and entry['fresh_until'] > time.time():
+        return entry['value']
+
+    lock_key = recompute_lock_key(key)
+    try:
+        acquired = cache.add(lock_key, 1, timeout=60)
+        if not acquired and not entry:
+            # Cache froid : un seul client calcule, les autres attendent sa valeur
+            entry, acquired = wait_for_recompute(key, lock_key, getattr(settings, 'DOWNLOADER_STATS_WAIT', 2))
+    except Exception as e:
+        logger.warning(f"Erreur lors de la prise du verrou {lock_key}: {e}")
+        acquired = True
+    if not acquired:
+        if entry:
+            # Un autre client recalcule : l'ancienne valeur est servie en attendant
+            return entry['value']
+        raise StatsPending(key)
+
+    try:
+        value = compute()
+        try:
+            cache.set(key, {'value': value, 'fresh_until': time.time() + ttl}, timeout=ttl + stale_ttl)
+        except Exception as e:
+            logger.warning(f"Erreur lors de l'enregistrement des statistiques {key}: {e}")
+    finally:
+        try:
+            cache.delete(lock_key)
+        except Exception as e:
+            logger.warning(f"Erreur lors de la libération du verrou {lock_key}: {e}")
+    return value
+
+
+def compute_download_stats():
+    """Statistiques globales des téléchargements, en une seule requête d'agrégation
+
+    Le décompte par plateforme (plateforme la plus populaire) est fait
+    dans la même requête avec un COUNT filtré par plateforme connue.
+    """
+    now = timezone.now()
+    completed = Q(status='completed')
+    platforms = get_platforms()
+    aggregates = {
+        'total': Count('id'),
+        'successful': Count('id', filter=completed),
+        'failed': Count('id', filter=Q(status='failed')),
+        'total_size': Sum('file_size', filter=completed),
+        'avg_size': Avg('file_size', filter=completed & Q(file_size__isnull=False)),
+        'last_24h': Count('id', filter=Q(created_at__gte=now - timedelta(days=1))),
+        'last_week': Count('id', filter=Q(created_at__gte=now - timedelta(days=7))),
+    }
+    for platform in platforms.values():
+        aggregates[f'platform_{platform.pk}'] = Count('id', filter=Q(platform_id=platform.pk))
+    row = VideoDownload.objects.aggregate(**aggregates)
+
+    total = row['total']
+    popular = max(platforms.values(), key=lambda platform: row[f'platform_{platform.pk}'], default=None)
+    if popular is None or not row[f'platform_{popular.pk}']:
+        popular = None
+
+    return {
+        'total_downloads': total,
+        'successful_downloads': row['successful'],
+        'failed_downloads': row['failed'],
+        'success_rate': round(row['successful'] / total * 100, 2) if total else 0,
+        'total_size_gb': round((row['total_size'] or 0) / (1024 ** 3), 2),
+        'most_popular_platform': popular.display_name if popular else 'Aucune',
+        'avg_file_size_mb': round((row['avg_size'] or 0) / (1024 ** 2), 2),
+        'downloads_last_24h': row['last_24h'],
+        'downloads_last_week': row['last_week'],
+    }
+
+
+def compute_platform_stats():
+    """Statistiques par plateforme, lues dans les agrégats horaires (téléchargements terminés)"""
+    completed = Q(status='completed')
+    rows = {
+        row['platform_id']: row
+        for row in DownloadRollup.objects.order_by().values('platform_id').annotate(
+            total=Sum('count'),
+            successful=Sum('count', filter=completed),
+            completed_bytes=Sum('total_bytes', filter=completed),
+        )
+    }
+    stats = []
+    for platform in get_platforms().values():
+        row = rows.get(platform.pk, {})
+        total = row.get('total') or 0
+        successful = row.get('successful') or 0
+        stats.append({
+            'platform_name': platform.display_name,
+            'total_downloads': total,
+            'success_rate': round(successful / total * 100, 2) if total else 0,
+            'avg_file_size_mb': round((row.get('completed_bytes') or 0) / successful / (1024 ** 2), 2) if successful else 0,
+        })
+    return stats
+
+
+def timeseries(since, until, interval='hour', platform=None):
+    """Téléchargements terminés par heure ou par jour, lus dans les agrégats horaires"""
+    rollups = DownloadRollup.objects.filter(hour__gte=since, hour__lt=until)
+    if platform:
+        rollups = rollups.filter(platform__name=platform)
+    rows = rollups.annotate(period=Trunc('hour', interval)).order_by('period').values('period').annotate(
+        total=Sum('count'),
+        completed=Sum('count', filter=Q(status='completed')),
+        failed=Sum('count', filter=Q(status='failed')),
+        cancelled=Sum('count', filter=Q(status='cancelled')),
+        total_bytes=Sum('total_bytes'),
+        processing_seconds=Sum('processing_seconds'),
+    )
+    return [
+        {
+            'period': row['period'],
+            'total_downloads': row['total'],
+            'successful_downloads': row['completed'] or 0,
+            'failed_downloads': row['failed'] or 0,
+            'cancelled_downloads': row['cancelled'] or 0,
+            'total_size_gb': round((row['total_bytes'] or 0) / (1024 ** 3), 2),
+            'avg_processing_seconds': round((row['processing_seconds'] or 0) / row['total'], 2) if row['total'] else 0,
+        }
+        for row in rows
+    ]
+
+
+def download_stats():
+    """Statistiques globales (cache de DOWNLOADER_STATS_CACHE_TTL secondes)"""
+    return cached_stats(DOWNLOAD_STATS_KEY, compute_download_stats)
+
+
+def platform_stats():
+    """Statistiques par plateforme (cache de DOWNLOADER_STATS_CACHE_TTL secondes)"""
+    return cached_stats(PLATFORM_STATS_KEY, compute_platform_stats)
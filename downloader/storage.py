@@ -0,0 +1,254 @@
+import logging
+import os
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from datetime import timedelta
+from .models import StorageUsage, StoredFile, VideoDownload
+from .versions import invalidate_versions
+
+logger = logging.getLogger(__name__)
+
+
+def shard_dir(download_id):
+    """Sous-dossier (relatif à MEDIA_ROOT) d'un téléchargement
+
+    Les fichiers sont répartis sur deux niveaux (``downloads/ab/cd/``)
+    à partir de l'ID pour qu'aucun dossier ne grossisse sans limite.
+    """
+    key = str(download_id).replace('-', '')
+    return os.path.join('downloads', key[:2], key[2:4])
+
+
+def register_file(path, size, references=1):
+    """Enregistre un fichier téléchargé et ajoute des références
+
+    ``path`` est relatif à MEDIA_ROOT. Retourne l'objet StoredFile.
+    """
+    with transaction.atomic():
+        stored, created = StoredFile.objects.get_or_create(path=path, defaults={'size': size})
+        StoredFile.objects.filter(pk=stored.pk).update(
+            ref_count=F('ref_count') + references, size=size, last_accessed_at=timezone.now()
+        )
+        adjust_usage(size if created else size - stored.size)
+    stored.refresh_from_db()
+    return stored
+
+
+def adjust_usage(delta):
+    """Met à jour le total des octets stockés"""
+    if not delta:
+        return
+    if not StorageUsage.objects.filter(pk=1).update(total_bytes=Greatest(F('total_bytes') + delta, 0)):
+        StorageUsage.objects.get_or_create(pk=1, defaults={'total_bytes': max(delta, 0)})
+
+
+def get_usage():
+    """Total des octets stockés (sans agrégation sur la table des fichiers)"""
+    usage = StorageUsage.objects.filter(pk=1).values_list('total_bytes', flat=True).first()
+    return usage or 0
+
+
+def default_expiry(now=None):
+    """Date d'expiration appliquée à un téléchargement terminé"""
+    ttl = getattr(settings, 'DOWNLOADER_DEFAULT_TTL', 7 * 24 * 3600)
+    return (now or timezone.now()) + timedelta(seconds=ttl)
+
+
+def touch_file(stored_file_id):
+    """Enregistre un accès au fichier (au plus une écriture par intervalle)"""
+    if not stored_file_id:
+        return
+    now = timezone.now()
+    interval = getattr(settings, 'DOWNLOADER_ACCESS_TOUCH_INTERVAL', 300)
+    StoredFile.objects.filter(
+        pk=stored_file_id, last_accessed_at__lt=now - timedelta(seconds=interval)
+    ).update(last_accessed_at=now)
+
+
+def add_references(stored_file_id, count):
+    """Ajoute ``count`` références à un fichier stocké"""
+    StoredFile.objects.filter(pk=stored_file_id).update(ref_count=F('ref_count') + count)
+
+
+def acquire_file(stored_file_id):
+    """Ajoute une référence à un fichier existant encore référencé
+
+    Retourne False si le fichier vient d'être libéré et ne doit plus être utilisé.
+    """
+    return StoredFile.objects.filter(pk=stored_file_id, ref_count__gt=0).update(
+        ref_count=F('ref_count') + 1, last_accessed_at=timezone.now()
+    ) == 1
+
+
+def release_file(download):
+    """Retire la référence d'un téléchargement à son fichier
+
+    Le fichier physique n'est supprimé que lorsque plus aucun
+    téléchargement ne le référence. Les anciens téléchargements sans
+    StoredFile gardent le comportement précédent (suppression directe).
+    """
+    if download.stored_file_id is None:
+        if download.file_path:
+            download.file_path.delete(save=False)
+        return
+
+    with transaction.atomic():
+        StoredFile.objects.filter(pk=download.stored_file_id, ref_count__gt=0).update(
+            ref_count=F('ref_count') - 1
+        )
+        stored = StoredFile.objects.select_for_update().filter(pk=download.stored_file_id).first()
+        if stored is None or stored.ref_count > 0:
+            return
+        stored.delete()
+        adjust_usage(-stored.size)
+
+    remove_media_file(stored.path)
+
+
+def remove_media_file(path):
+    """Supprime un fichier relatif à MEDIA_ROOT, sans erreur s'il n'existe plus"""
+    try:
+        os.remove(os.path.join(settings.MEDIA_ROOT, path))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Erreur lors de la suppression du fichier {path}: {e}")
+
+
+def remove_partial_files(download_id):
+    """Supprime les fichiers laissés par un téléchargement interrompu (``.part``, fragments...)"""
+    directory = os.path.join(settings.MEDIA_ROOT, shard_dir(download_id))
+    prefix = f'{download_id}_'
+    try:
+        with os.scandir(directory) as entries:
+            names = [entry.name for entry in entries if entry.is_file() and entry.name.startswith(prefix)]
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        remove_media_file(os.path.join(shard_dir(download_id), name))
+    return len(names)
+
+
+def release_references(stored_file_ids):
+    """Version groupée de ``release_file`` pour une liste d'IDs de StoredFile
+
+    Une référence est retirée par occurrence, avec une requête par nombre
+    d'occurrences distinct ; les fichiers devenus inutilisés sont supprimés.
+    Retourne le nombre de fichiers supprimés.
+    """
+    by_count = defaultdict(list)
+    for pk, count in Counter(pk for pk in stored_file_ids if pk).items():
+        by_count[count].append(pk)
+    if not by_count:
+        return 0
+
+    with transaction.atomic():
+        for count, pks in by_count.items():
+            StoredFile.objects.filter(pk__in=pks).update(ref_count=Greatest(F('ref_count') - count, 0))
+        all_pks = [pk for pks in by_count.values() for pk in pks]
+        unused = list(StoredFile.objects.filter(pk__in=all_pks, ref_count=0).values_list('pk', 'path', 'size'))
+        StoredFile.objects.filter(pk__in=[pk for pk, _, _ in unused]).delete()
+        adjust_usage(-sum(size for _, _, size in unused))
+
+    for _, path, _ in unused:
+        remove_media_file(path)
+    return len(unused)
+
+
+def evict_least_recently_used(bytes_to_free, batch_size=100):
+    """Supprime les fichiers les moins récemment utilisés et leurs téléchargements
+
+    S'arrête dès que ``bytes_to_free`` octets ont été libérés. Un fichier
+    n'est supprimé que s'il n'a pas changé depuis sa sélection (référence
+    ajoutée ou accès entre-temps : il est conservé), ligne verrouillée
+    jusqu'à la fin de la suppression. Retourne le nombre d'octets libérés.
+    """
+    freed = 0
+    skipped = set()
+    while freed < bytes_to_free:
+        batch = list(
+            StoredFile.objects.exclude(pk__in=skipped).order_by('last_accessed_at')
+            .values_list('pk', 'path', 'size', 'ref_count', 'last_accessed_at')[:batch_size]
+        )
+        if not batch:
+            break
+        selected = []
+        planned = freed
+        for row in batch:
+            selected.append(row)
+            planned += row[2]
+            if planned >= bytes_to_free:
+                break
+
+        unchanged = Q()
+        for pk, _, _, ref_count, accessed in selected:
+            unchanged |= Q(pk=pk, ref_count=ref_count, last_accessed_at=accessed)
+        with transaction.atomic():
+            evicted = list(StoredFile.objects.select_for_update().filter(unchanged).values_list('pk', 'path', 'size'))
+            pks = [pk for pk, _, _ in evicted]
+            download_ids = list(VideoDownload.objects.filter(stored_file_id__in=pks).values_list('id', flat=True))
+            VideoDownload.objects.filter(coalesced_with_id__in=download_ids).update(
+                coalesced_with=None, updated_at=timezone.now()
+            )
+            VideoDownload.objects.filter(pk__in=download_ids).delete()
+            StoredFile.objects.filter(pk__in=pks).delete()
+            adjust_usage(-sum(size for _, _, size in evicted))
+        invalidate_versions(download_ids)
+        skipped.update(row[0] for row in selected if row[0] not in pks)
+        freed += sum(size for _, _, size in evicted)
+
+        for _, path, _ in evicted:
+            remove_media_file(path)
+            logger.info(f"Fichier évincé (quota de stockage): {path}")
+    return freed
+
+
+def referenced_paths(paths):
+    """Sous-ensemble des chemins (relatifs à MEDIA_ROOT) encore référencés en base"""
+    paths = list(paths)
+    found = set(StoredFile.objects.filter(path__in=paths).values_list('path', flat=True))
+    # Anciens téléchargements sans StoredFile : vérifiés uniquement pour les candidats restants
+    remaining = [path for path in paths if path not in found]
+    if remaining:
+        found.update(VideoDownload.objects.filter(file_path__in=remaining).values_list('file_path', flat=True))
+    return found
+
+
+def find_reusable_download(video_key, format_key):
+    """Téléchargement terminé dont le fichier peut être réutilisé, ou None"""
+    if not video_key or not format_key:
+        return None
+    candidates = VideoDownload.objects.filter(
+        video_key=video_key,
+        format_key=format_key,
+        status='completed',
+        stored_file__isnull=False,
+    ).select_related('stored_file').order_by('-completed_at')
+    for candidate in candidates[:5]:
+        if os.path.exists(os.path.join(settings.MEDIA_ROOT, candidate.stored_file.path)):
+            return candidate
+    return None
+
+
+def reuse_fields(source):
+    """Champs à copier pour terminer immédiatement un téléchargement identique"""
+    now = timezone.now()
+    return {
+        'title': source.title,
+        'description': source.description,
+        'duration': source.duration,
+        'thumbnail_url': source.thumbnail_url,
+        'file_path': source.file_path.name,
+        'file_size': source.file_size,
+        'actual_quality': source.actual_quality,
+        'stored_file': source.stored_file,
+        'status': 'completed',
+        'progress_percentage': 100,
+        'started_at': now,
+        'completed_at': now,
+        'expires_at': default_expiry(now),
+    }
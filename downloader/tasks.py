@@ -1,16 +1,40 @@
 import os
+import time
 import yt_dlp
 import logging
 from celery import Celery, shared_task
 from django.conf import settings
 from django.utils import timezone
+from django.core.cache import cache
 from django.core.files.base import ContentFile
+from django.db.models import F, Q
+from itertools import islice
 from datetime import datetime, timedelta
 from .models import VideoDownload, Platform
+from .events import publish_progress, publish_download
+from .extraction import PLAYLIST_RESULT_TYPES, build_format_selector, get_video_info, normalize_format_key
+from .storage import (
+    add_references, default_expiry, evict_least_recently_used, get_usage, referenced_paths,
+    register_file, release_file, release_references, remove_media_file, remove_partial_files,
+    reuse_fields, shard_dir
+)
+from .cancellation import cancel_requested, finish_cancelled, has_active_followers
+from .concurrency import acquire_slot, refresh_slot, release_slot, slot_ttl
+from .throttling import take_token
+from .serving import set_partial_file
+from .bulk import create_batch
+from .platforms import active_platforms
+from .playlists import children_finished, iter_entry_urls, repair_stalled_playlists, update_parent_progress
+from .rollups import record_finished
+from .versions import invalidate_versions
+from . import inflight, metrics
 
 # Configuration du logger
 logger = logging.getLogger(__name__)
 
+# Position du nettoyage des fichiers orphelins (sous-dossier suivant à traiter)
+CLEANUP_CURSOR_KEY = 'downloader:cleanup:orphan_cursor'
+
 # Configuration Celery
 # app = Celery('video_downloader')
 # app.config_from_object('django.conf:settings', namespace='CELERY')
@@ -18,69 +42,302 @@ logger = logging.getLogger(__name__)
 
 
 class VideoDownloadProgress:
-    """Classe pour suivre la progression du téléchargement"""
+    """Classe pour suivre la progression du téléchargement
+
+    Le dernier état connu est gardé en mémoire et n'est écrit en base
+    (via ``update()``, sans relire la ligne) que lorsque l'intervalle
+    ou l'écart de pourcentage configuré est atteint.
+    """
     
-    def __init__(self, download_id):
+    def __init__(self, download_id, flush_interval=None, flush_delta=None, platform=None, slot=None):
         self.download_id = download_id
+        self.platform = platform
+        self.slot = slot
+        self.last_slot_refresh = time.monotonic()
+        self.fragment_index = None
         self.start_time = None
+        if flush_interval is None:
+            flush_interval = getattr(settings, 'DOWNLOADER_PROGRESS_FLUSH_INTERVAL', 2.0)
+        if flush_delta is None:
+            flush_delta = getattr(settings, 'DOWNLOADER_PROGRESS_FLUSH_DELTA', 5)
+        self.flush_interval = flush_interval
+        self.flush_delta = flush_delta
+        self.publish_interval = getattr(settings, 'DOWNLOADER_EVENTS_PUBLISH_INTERVAL', 0.5)
+        self.cancel_check_interval = getattr(settings, 'DOWNLOADER_CANCEL_CHECK_INTERVAL', 1.0)
+        self.last_cancel_check = None
+        self.state = {}
+        self.transfer = {}
+        self.dirty = False
+        self.last_flush = None
+        self.last_publish = None
+        self.flushed_percentage = None
+        self.final_path = None
+        self.partial_file = None
     
     def progress_hook(self, d):
         """Hook de progression pour yt-dlp"""
+        # Hors du try : l'exception doit remonter jusqu'à yt-dlp pour interrompre le transfert
+        self.check_cancelled()
+        self.throttle_fragment(d)
+        self.refresh_slot()
         try:
-            download = VideoDownload.objects.get(id=self.download_id)
-            
             if d['status'] == 'downloading':
                 if self.start_time is None:
                     self.start_time = timezone.now()
-                    download.started_at = self.start_time
+                    self.state['started_at'] = self.start_time
                 
                 # Calcul du pourcentage
                 if 'total_bytes' in d and d['total_bytes']:
                     downloaded = d.get('downloaded_bytes', 0)
                     progress = int((downloaded / d['total_bytes']) * 100)
-                    download.progress_percentage = min(progress, 99)  # Max 99% pendant le téléchargement
+                    self.state['progress_percentage'] = min(progress, 99)  # Max 99% pendant le téléchargement
                 elif '_percent_str' in d:
                     # Extraction du pourcentage depuis la chaîne
                     percent_str = d['_percent_str'].strip().replace('%', '')
                     try:
                         progress = float(percent_str)
-                        download.progress_percentage = int(min(progress, 99))
-                    except:
+                        self.state['progress_percentage'] = int(min(progress, 99))
+                    except ValueError:
                         pass
                 
-                download.status = 'processing'
-                download.save(update_fields=['status', 'progress_percentage', 'started_at'])
+                self.state['status'] = 'processing'
+                self.transfer = {
+                    'downloaded_bytes': d.get('downloaded_bytes'),
+                    'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+                    'speed': d.get('speed'),
+                    'eta': d.get('eta'),
+                }
+                self.dirty = True
+                self.remember_partial_file(d)
+                self.publish()
+                self.flush()
             
             elif d['status'] == 'finished':
-                download.progress_percentage = 99  # On ne met plus 100 ici
-                download.save(update_fields=['progress_percentage'])
+                self.state['progress_percentage'] = 99  # On ne met plus 100 ici
+                self.dirty = True
+                self.publish(force=True)
+                self.flush(force=True)
                 
         except Exception as e:
             logger.error(f"Erreur dans progress_hook: {e}")
+    
+    def check_cancelled(self):
+        """Interrompt le transfert si son annulation a été demandée (vérifié au plus une fois par intervalle)"""
+        now = time.monotonic()
+        if self.last_cancel_check is not None and now - self.last_cancel_check < self.cancel_check_interval:
+            return
+        self.last_cancel_check = now
+        if cancel_requested(self.download_id):
+            raise yt_dlp.utils.DownloadCancelled(f"Téléchargement {self.download_id} annulé")
+    
+    def refresh_slot(self):
+        """Renouvelle le créneau de la plateforme (au plus trois fois par durée de vie)"""
+        if not self.slot:
+            return
+        now = time.monotonic()
+        if now - self.last_slot_refresh < slot_ttl() / 3:
+            return
+        self.last_slot_refresh = now
+        refresh_slot(self.slot, self.download_id)
+    
+    def throttle_fragment(self, d):
+        """Attend un jeton de la plateforme avant chaque nouveau fragment (HLS/DASH)"""
+        index = d.get('fragment_index')
+        if index is None or index == self.fragment_index:
+            return
+        self.fragment_index = index
+        wait = take_token(self.platform)
+        while wait > 0:
+            time.sleep(min(wait, 1.0))
+            self.check_cancelled()
+            wait = take_token(self.platform)
+    
+    def remember_partial_file(self, d):
+        """Mémorise le fichier en cours d'écriture (diffusion progressive)"""
+        partial_file = (d.get('tmpfilename'), d.get('filename'))
+        if partial_file == self.partial_file or not d.get('filename'):
+            return
+        self.partial_file = partial_file
+        set_partial_file(self.download_id, *partial_file)
+    
+    def postprocessor_hook(self, d):
+        """Hook des post-traitements : chemin du fichier une fois déplacé (MoveFiles)"""
+        self.refresh_slot()
+        if d.get('status') == 'finished' and d.get('postprocessor') == 'MoveFiles':
+            self.final_path = (d.get('info_dict') or {}).get('filepath') or self.final_path
+    
+    def post_hook(self, filepath):
+        """Hook appelé par yt-dlp avec le chemin final, après tous les post-traitements"""
+        self.final_path = filepath
+    
+    def output_path(self, info=None):
+        """Chemin final du fichier téléchargé, sans parcourir le dossier"""
+        if self.final_path:
+            return self.final_path
+        # Repli : chemin indiqué dans le résultat de process_ie_result
+        for requested in (info or {}).get('requested_downloads') or []:
+            if requested.get('filepath'):
+                return requested['filepath']
+        return (info or {}).get('filepath')
+    
+    def publish(self, force=False):
+        """Publie l'état courant sur Redis (plus fréquemment qu'en base)"""
+        now = time.monotonic()
+        if not force and self.last_publish is not None and now - self.last_publish < self.publish_interval:
+            return False
+        self.last_publish = now
+        return publish_progress(self.download_id, dict(self.state, **self.transfer))
+    
+    def should_flush(self):
+        """Indique si l'état en mémoire doit être écrit en base"""
+        if self.last_flush is None:
+            return True
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            return True
+        percentage = self.state.get('progress_percentage')
+        if percentage is not None and self.flushed_percentage is not None:
+            return percentage - self.flushed_percentage >= self.flush_delta
+        return False
+    
+    def flush(self, force=False):
+        """Écrit le dernier état connu en base si nécessaire"""
+        if not self.dirty or not (force or self.should_flush()):
+            return False
+        
+        # Les téléchargements rattachés (single-flight) suivent la même progression ;
+        # un téléchargement annulé n'est plus mis à jour
+        started = time.monotonic()
+        VideoDownload.objects.filter(
+            Q(id=self.download_id, status__in=inflight.ACTIVE_STATUSES) |
+            Q(coalesced_with_id=self.download_id, status__in=inflight.ACTIVE_STATUSES)
+        ).update(updated_at=timezone.now(), **self.state)
+        self.dirty = False
+        self.last_flush = time.monotonic()
+        metrics.observe('downloader_progress_flush_duration_seconds', self.last_flush - started)
+        self.flushed_percentage = self.state.get('progress_percentage', self.flushed_percentage)
+        return True
+
+
+def apply_video_metadata(download, info):
+    """Copie les métadonnées yt-dlp sur l'objet VideoDownload (sans sauvegarder)"""
+    thumbnail = info.get('thumbnail')
+    if not thumbnail and info.get('thumbnails'):
+        thumbnail = info['thumbnails'][-1].get('url')
+    
+    download.title = (info.get('title') or download.title or '')[:500]  # Limite à 500 caractères
+    download.description = (info.get('description') or download.description or '')[:1000]
+    download.duration = info.get('duration') or download.duration
+    download.thumbnail_url = thumbnail or download.thumbnail_url or ''
+
+
+def complete_followers(download):
+    """Termine les téléchargements rattachés avec le fichier du leader"""
+    followers = VideoDownload.objects.filter(coalesced_with=download, status__in=inflight.ACTIVE_STATUSES)
+    follower_ids = list(followers.values_list('id', flat=True))
+    if not follower_ids:
+        return 0
+    
+    fields = reuse_fields(download)
+    fields.pop('started_at')
+    completed = VideoDownload.objects.filter(
+        id__in=follower_ids, status__in=inflight.ACTIVE_STATUSES
+    ).update(updated_at=timezone.now(), **fields)
+    if download.stored_file_id and completed:
+        add_references(download.stored_file_id, completed)
+    record_finished(follower_ids, status='completed')
+    
+    for follower_id in follower_ids:
+        publish_progress(follower_id, {
+            'status': 'completed',
+            'progress_percentage': 100,
+            'completed_at': fields['completed_at'],
+        })
+    children_finished(follower_ids, status='completed')
+    return completed
+
+
+def fail_followers(download):
+    """Fait échouer les téléchargements rattachés à un leader en échec définitif"""
+    followers = VideoDownload.objects.filter(coalesced_with=download, status__in=inflight.ACTIVE_STATUSES)
+    follower_ids = list(followers.values_list('id', flat=True))
+    if not follower_ids:
+        return 0
+    
+    now = timezone.now()
+    failed = VideoDownload.objects.filter(
+        id__in=follower_ids, status__in=inflight.ACTIVE_STATUSES
+    ).update(status='failed', error_message=download.error_message, completed_at=now, updated_at=now)
+    record_finished(follower_ids, status='failed')
+    for follower_id in follower_ids:
+        publish_progress(follower_id, {
+            'status': 'failed',
+            'error_message': download.error_message,
+            'completed_at': now,
+        })
+    children_finished(follower_ids, status='failed')
+    return failed
+
+
+def defer_download(download_id, countdown):
+    """Renvoie le téléchargement dans la file après ``countdown`` secondes
+
+    Nouvel envoi plutôt que retry : l'attente ne consomme pas les tentatives.
+    """
+    result = download_video_task.apply_async(args=[download_id], countdown=countdown)
+    VideoDownload.objects.filter(id=download_id).update(celery_task_id=result.id)
+    return f"Téléchargement {download_id} reporté"
 
 
 @shared_task(bind=True, max_retries=3)
 def download_video_task(self, download_id):
     """Tâche Celery pour télécharger une vidéo"""
     logger.info(f"Début du téléchargement pour l'ID: {download_id}")
+    progress_tracker = None
+    slot = None
     
     try:
-        download = VideoDownload.objects.get(id=download_id)
-        download.status = 'processing'
-        download.started_at = timezone.now()
+        download = VideoDownload.objects.select_related('platform').get(id=download_id)
+        if download.status == 'cancelled' and not has_active_followers(download.id):
+            logger.info(f"Téléchargement {download_id} annulé avant son démarrage")
+            inflight.release(download.video_key, download.format_key, download.id)
+            return f"Téléchargement {download_id} annulé"
+        
+        # Limite de transferts simultanés de la plateforme (tous workers confondus)
+        limit = download.platform.max_concurrent_downloads if download.platform else None
+        if limit:
+            slot = acquire_slot(download.platform.name, limit, download_id)
+            if slot is None:
+                delay = getattr(settings, 'DOWNLOADER_PLATFORM_SLOT_RETRY_DELAY', 15)
+                logger.info(f"Limite de {limit} transferts atteinte pour {download.platform.name}, {download_id} reporté de {delay}s")
+                return defer_download(download_id, delay)
+        
+        # Limite de débit de la plateforme : le job est reporté plutôt qu'exposé à des 429
+        wait = take_token(download.platform)
+        if wait > 0:
+            logger.info(f"Limite de débit atteinte pour {download.platform.name}, {download_id} reporté de {wait:.1f}s")
+            return defer_download(download_id, wait)
+        
+        download.celery_task_id = self.request.id
+        if download.status != 'cancelled':
+            download.status = 'processing'
+            download.started_at = timezone.now()
         download.save()
+        publish_download(download)
         
         # Configuration yt-dlp
-        progress_tracker = VideoDownloadProgress(download_id)
+        progress_tracker = VideoDownloadProgress(download_id, platform=download.platform, slot=slot)
+        platform_name = download.platform.name if download.platform else 'unknown'
         
-        # Dossier de téléchargement
-        download_dir = os.path.join(settings.MEDIA_ROOT, 'downloads')
+        # Dossier de téléchargement (réparti en sous-dossiers selon l'ID)
+        download_dir = os.path.join(settings.MEDIA_ROOT, shard_dir(download_id))
         os.makedirs(download_dir, exist_ok=True)
         
         # Configuration des options yt-dlp
         ydl_opts = {
             'outtmpl': os.path.join(download_dir, f'{download_id}_%(title)s.%(ext)s'),
             'progress_hooks': [progress_tracker.progress_hook],
+            'postprocessor_hooks': [progress_tracker.postprocessor_hook],
+            'post_hooks': [progress_tracker.post_hook],
             'no_warnings': False,
             'extractaudio': download.download_audio_only,
             'audioformat': 'mp3' if download.download_audio_only else None,
@@ -89,64 +346,84 @@ def download_video_task(self, download_id):
         }
         
         # Configuration de la qualité
-        generic_qualities = ['best', 'worst', '144p', '240p', '360p', '480p', '720p', '1080p', '1440p', '2160p']
-        if download.requested_quality in generic_qualities:
-            if download.requested_quality == 'best':
-                if download.download_audio_only:
-                    ydl_opts['format'] = 'bestaudio/best'
-                else:
-                    ydl_opts['format'] = 'best[height<=1080]'
-            elif download.requested_quality == 'worst':
-                ydl_opts['format'] = 'worst'
-            else:
-                # Qualité spécifique (720p, 480p, etc.)
-                height = download.requested_quality.replace('p', '')
-                if download.download_audio_only:
-                    ydl_opts['format'] = 'bestaudio/best'
-                else:
-                    ydl_opts['format'] = f'best[height<={height}]'
-        else:
-            # Cas d'un format_id yt-dlp (ex: '140', '18', 'sb3', etc.)
-            ydl_opts['format'] = download.requested_quality
+        ydl_opts['format'] = build_format_selector(download.requested_quality, download.download_audio_only)
         
         # Téléchargement avec yt-dlp
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             try:
-                # Extraction des informations
-                info = ydl.extract_info(download.source_url, download=False)
+                # Extraction unique des informations (partagées avec l'API via le cache)
+                started = time.monotonic()
+                info = get_video_info(download.source_url)
+                metrics.observe('downloader_extraction_duration_seconds', time.monotonic() - started, platform=platform_name)
                 
-                # Mise à jour des métadonnées
-                download.title = info.get('title', '')[:500]  # Limite à 500 caractères
-                download.description = info.get('description', '')[:1000] if info.get('description') else ''
-                download.duration = info.get('duration')
-                download.thumbnail_url = info.get('thumbnail', '')
-                download.save()
+                if info.get('_type') in PLAYLIST_RESULT_TYPES:
+                    # Playlist non reconnue à la création : confiée à la tâche de développement
+                    download.is_playlist = True
+                    download.save(update_fields=['is_playlist', 'updated_at'])
+                    inflight.release(download.video_key, download.format_key, download.id)
+                    # Les demandes rattachées attendaient une vidéo : elles sont à renvoyer
+                    download.error_message = "Playlist : renvoyez la demande pour la développer"
+                    fail_followers(download)
+                    result = expand_playlist_task.delay(download_id)
+                    VideoDownload.objects.filter(id=download_id).update(celery_task_id=result.id)
+                    return f"Playlist {download_id} confiée au développement"
                 
-                # Téléchargement effectif
-                ydl.download([download.source_url])
+                # Mise à jour des métadonnées (sans écraser une annulation entre-temps)
+                apply_video_metadata(download, info)
+                download.save(update_fields=['title', 'description', 'duration', 'thumbnail_url', 'updated_at'])
                 
-                # Recherche du fichier téléchargé
-                downloaded_file = None
-                for file in os.listdir(download_dir):
-                    if file.startswith(str(download_id)):
-                        downloaded_file = os.path.join(download_dir, file)
-                        break
+                # Téléchargement effectif à partir des informations déjà extraites
+                started = time.monotonic()
+                info = ydl.process_ie_result(info, download=True)
+                transfer_seconds = time.monotonic() - started
+                metrics.observe('downloader_transfer_duration_seconds', transfer_seconds, platform=platform_name)
+                
+                # Chemin final fourni par yt-dlp (après post-traitements et déplacement)
+                downloaded_file = progress_tracker.output_path(info)
                 
                 if downloaded_file and os.path.exists(downloaded_file):
                     # Mise à jour de l'objet download
                     file_size = os.path.getsize(downloaded_file)
                     relative_path = os.path.relpath(downloaded_file, settings.MEDIA_ROOT)
+                    metrics.inc('downloader_transferred_bytes_total', file_size, platform=platform_name)
+                    if transfer_seconds > 0:
+                        metrics.observe(
+                            'downloader_transfer_speed_bytes_per_second', file_size / transfer_seconds, platform=platform_name
+                        )
                     
+                    apply_video_metadata(download, info)
                     download.file_path = relative_path
                     download.file_size = file_size
+                    download.stored_file = register_file(relative_path, file_size)
                     download.actual_quality = info.get('height', download.requested_quality)
+                    
+                    if VideoDownload.objects.filter(id=download_id, status='cancelled').exists():
+                        # Leader annulé pendant le transfert, poursuivi pour ses téléchargements rattachés
+                        inflight.release(download.video_key, download.format_key, download.id)
+                        complete_followers(download)
+                        release_file(download)
+                        logger.info(f"Téléchargement {download_id} annulé, fichier remis aux téléchargements rattachés")
+                        return f"Téléchargement {download_id} annulé"
+                    
                     download.progress_percentage = 100  # On met 100% ici, à la toute fin
                     download.status = 'completed'
                     download.completed_at = timezone.now()
+                    download.expires_at = default_expiry(download.completed_at)
                     download.save()
+                    record_finished([download.id])
+                    
+                    # Les téléchargements rattachés reçoivent le même fichier
+                    inflight.release(download.video_key, download.format_key, download.id)
+                    complete_followers(download)
+                    publish_download(download)
+                    children_finished([download.id])
                     
                     logger.info(f"Téléchargement terminé avec succès: {download_id}")
                     
+                    # Éviction anticipée si le quota de stockage est dépassé
+                    if storage_over_high_watermark():
+                        enforce_storage_quota.delay()
+                    
                 else:
                     raise Exception("Fichier téléchargé non trouvé")
                     
@@ -159,25 +436,58 @@ def download_video_task(self, download_id):
         return f"VideoDownload {download_id} non trouvé"
         
     except Exception as e:
+        # Dernière écriture de la progression en attente avant l'échec
+        if progress_tracker is not None:
+            try:
+                progress_tracker.flush(force=True)
+            except Exception as flush_error:
+                logger.warning(f"Erreur lors de l'écriture de la progression {download_id}: {flush_error}")
+        
+        # Téléchargement annulé : ni échec ni retry, les fichiers partiels sont supprimés
+        download = VideoDownload.objects.filter(id=download_id, status='cancelled').first()
+        if download is not None:
+            logger.info(f"Téléchargement {download_id} interrompu après annulation")
+            remove_partial_files(download_id)
+            inflight.release(download.video_key, download.format_key, download.id)
+            download.error_message = str(e)[:500]
+            fail_followers(download)
+            return f"Téléchargement {download_id} annulé"
+        
         logger.error(f"Erreur lors du téléchargement {download_id}: {e}")
         
+        # Retry logic : le téléchargement reste actif (et leader) jusqu'à la dernière tentative
+        if self.request.retries < self.max_retries:
+            logger.info(f"Retry {self.request.retries + 1}/{self.max_retries} pour {download_id}")
+            metrics.inc('downloader_retries_total', error=type(e).__name__)
+            if VideoDownload.objects.filter(id=download_id, status__in=inflight.ACTIVE_STATUSES).update(
+                status='pending', error_message=str(e)[:500], updated_at=timezone.now()
+            ):
+                download = VideoDownload.objects.filter(id=download_id).first()
+                if download is not None:
+                    publish_download(download)
+            raise self.retry(countdown=60 * (self.request.retries + 1), exc=e)
+        
+        # Échec définitif : les téléchargements rattachés échouent aussi
         try:
             download = VideoDownload.objects.get(id=download_id)
             download.status = 'failed'
             download.error_message = str(e)[:500]
             download.completed_at = timezone.now()
             download.save()
-            
+            publish_download(download)
+            record_finished([download.id], status='failed')
+            inflight.release(download.video_key, download.format_key, download.id)
+            fail_followers(download)
+            children_finished([download.id], status='failed')
         except VideoDownload.DoesNotExist:
             pass
         
-        # Retry logic
-        if self.request.retries < self.max_retries:
-            logger.info(f"Retry {self.request.retries + 1}/{self.max_retries} pour {download_id}")
-            raise self.retry(countdown=60 * (self.request.retries + 1), exc=e)
-        
         return f"Échec définitif du téléchargement {download_id}: {e}"
     
+    finally:
+        if slot:
+            release_slot(slot, download_id)
+    
     return f"Téléchargement terminé: {download_id}"
 
 
@@ -191,6 +501,7 @@ def download_bulk_videos_task(download_ids):
         try:
             # Lancer chaque téléchargement individuellement
             result = download_video_task.delay(download_id)
+            VideoDownload.objects.filter(id=download_id).update(celery_task_id=result.id)
             results.append({
                 'download_id': download_id,
                 'task_id': result.id,
@@ -208,57 +519,264 @@ def download_bulk_videos_task(download_ids):
     return results
 
 
+@shared_task
+def finish_cancelled_downloads(download_ids):
+    """Agrégats et événements des vidéos d'une playlist annulée (voir ``cancel_children``)"""
+    finish_cancelled(download_ids)
+    return f"{len(download_ids)} annulation(s) traitée(s)"
+
+
+@shared_task(bind=True, max_retries=3)
+def expand_playlist_task(self, download_id):
+    """Développe une playlist ou une chaîne en téléchargements enfants
+
+    Les entrées sont extraites à plat, page par page (``extract_flat``,
+    ``lazy_playlist``), sans résoudre chaque vidéo. Chaque lot de
+    DOWNLOADER_PLAYLIST_BATCH_SIZE entrées est inséré et lancé aussitôt :
+    les premières vidéos se téléchargent pendant que les pages suivantes
+    sont parcourues. La playlist agrège ensuite l'état de ses enfants.
+    """
+    logger.info(f"Début du développement de la playlist {download_id}")
+    try:
+        parent = VideoDownload.objects.get(id=download_id)
+    except VideoDownload.DoesNotExist:
+        logger.error(f"VideoDownload {download_id} non trouvé")
+        return f"VideoDownload {download_id} non trouvé"
+    if parent.status not in inflight.ACTIVE_STATUSES or parent.expanded_at:
+        return f"Playlist {download_id} déjà traitée"
+
+    parent.status = 'processing'
+    parent.started_at = parent.started_at or timezone.now()
+    parent.celery_task_id = self.request.id
+    parent.save(update_fields=['status', 'started_at', 'celery_task_id', 'updated_at'])
+    publish_download(parent)
+
+    batch_size = getattr(settings, 'DOWNLOADER_PLAYLIST_BATCH_SIZE', 100)
+    max_entries = getattr(settings, 'DOWNLOADER_PLAYLIST_MAX_ENTRIES', 10000)
+    options = {
+        'platforms': active_platforms(),
+        'requested_quality': parent.requested_quality,
+        'download_audio_only': parent.download_audio_only,
+        'format_key': parent.format_key or normalize_format_key(parent.requested_quality, parent.download_audio_only),
+        'ip_address': parent.ip_address,
+        'user_agent': parent.user_agent,
+    }
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+    }
+    created = parent.entry_count
+    error = None
+
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(parent.source_url, download=False, process=False)
+            # Redirections de l'extracteur (chaîne vers son onglet de vidéos...)
+            for _ in range(3):
+                if info.get('_type') not in ('url', 'url_transparent'):
+                    break
+                info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+
+            if info.get('title'):
+                parent.title = info['title'][:500]
+                parent.save(update_fields=['title', 'updated_at'])
+
+            # Après une reprise, les entrées déjà créées sont ignorées
+            urls = islice(iter_entry_urls(info), created, max_entries)
+            while True:
+                batch = list(islice(urls, batch_size))
+                if not batch:
+                    break
+                if VideoDownload.objects.filter(id=download_id, status='cancelled').exists():
+                    logger.info(f"Développement de la playlist {download_id} interrompu après annulation")
+                    break
+
+                count = sum(1 for result in create_batch(batch, parent=parent, **options) if 'id' in result)
+                VideoDownload.objects.filter(id=download_id).update(
+                    entry_count=F('entry_count') + count, updated_at=timezone.now()
+                )
+                created += count
+                update_parent_progress(download_id)
+
+    except Exception as e:
+        logger.error(f"Erreur lors du développement de la playlist {download_id}: {e}")
+        if not created and self.request.retries < self.max_retries:
+            raise self.retry(countdown=60 * (self.request.retries + 1), exc=e)
+        error = str(e)[:500]
+
+    # Playlist entièrement développée : elle se termine avec ses derniers enfants
+    fields = {'expanded_at': timezone.now()}
+    if error:
+        fields['error_message'] = error
+    VideoDownload.objects.filter(id=download_id).update(updated_at=timezone.now(), **fields)
+    update_parent_progress(download_id)
+
+    logger.info(f"Playlist {download_id} développée: {created} vidéos")
+    return f"Playlist {download_id} développée: {created} vidéos"
+
+
+def delete_downloads_in_batches(queryset, batch_size, max_batches):
+    """Supprime les téléchargements d'un queryset par lots de clés primaires
+
+    Chaque lot est lu avec ``values()`` (sans instancier les objets), ses
+    fichiers sont libérés en une fois puis les lignes sont supprimées avec
+    un seul DELETE. Retourne le nombre de lignes supprimées.
+    """
+    deleted = 0
+    for _ in range(max_batches):
+        rows = list(queryset.values('id', 'stored_file_id', 'file_path')[:batch_size])
+        if not rows:
+            break
+        
+        ids = [row['id'] for row in rows]
+        VideoDownload.objects.filter(coalesced_with_id__in=ids).update(coalesced_with=None, updated_at=timezone.now())
+        VideoDownload.objects.filter(pk__in=ids).delete()
+        invalidate_versions(ids)
+        deleted += len(ids)
+        
+        # Fichiers physiques : comptage de références, ou suppression directe
+        # pour les anciens téléchargements sans StoredFile
+        release_references([row['stored_file_id'] for row in rows])
+        for row in rows:
+            if not row['stored_file_id'] and row['file_path']:
+                remove_media_file(row['file_path'])
+        
+        if len(rows) < batch_size:
+            break
+    return deleted
+
+
+def shard_names():
+    """Noms des sous-dossiers de premier niveau de downloads/ (00 à ff)"""
+    return [f'{i:02x}' for i in range(256)]
+
+
+def cleanup_orphan_files(shards, grace_seconds, batch_size):
+    """Supprime les fichiers non référencés de quelques sous-dossiers de downloads/
+
+    Les fichiers sont vérifiés par lots contre la base ; les fichiers
+    récents (téléchargements en cours, .part...) sont ignorés.
+    """
+    download_dir = os.path.join(settings.MEDIA_ROOT, 'downloads')
+    media_root = settings.MEDIA_ROOT or '.'
+    min_mtime = time.time() - grace_seconds
+    removed = 0
+    
+    def purge(candidates):
+        referenced = referenced_paths(candidates)
+        count = 0
+        for path in candidates:
+            if path not in referenced:
+                remove_media_file(path)
+                logger.info(f"Fichier orphelin supprimé: {path}")
+                count += 1
+        return count
+    
+    for shard in shards:
+        # Le pseudo-dossier '' correspond aux fichiers à la racine (ancienne arborescence)
+        root_dir = os.path.join(download_dir, shard) if shard else download_dir
+        if not os.path.isdir(root_dir):
+            continue
+        candidates = []
+        for root, dirs, files in os.walk(root_dir):
+            if not shard:
+                dirs[:] = []
+            for filename in files:
+                full_path = os.path.join(root, filename)
+                try:
+                    if os.path.getmtime(full_path) > min_mtime:
+                        continue
+                except OSError:
+                    continue
+                candidates.append(os.path.relpath(full_path, media_root))
+                if len(candidates) >= batch_size:
+                    removed += purge(candidates)
+                    candidates = []
+        if candidates:
+            removed += purge(candidates)
+    return removed
+
+
 @shared_task
 def cleanup_old_downloads():
-    """Tâche de nettoyage des anciens téléchargements et des fichiers orphelins"""
+    """Tâche de nettoyage des anciens téléchargements et des fichiers orphelins
+
+    Le travail est borné à chaque exécution (lots de
+    DOWNLOADER_CLEANUP_BATCH_SIZE lignes, quelques sous-dossiers de
+    downloads/) et reprend au curseur suivant lors de l'exécution
+    suivante, planifiée fréquemment.
+    """
     logger.info("Début du nettoyage des anciens téléchargements")
+    batch_size = getattr(settings, 'DOWNLOADER_CLEANUP_BATCH_SIZE', 500)
+    max_batches = getattr(settings, 'DOWNLOADER_CLEANUP_MAX_BATCHES', 10)
+    now = timezone.now()
     
-    # Supprimer les téléchargements expirés
+    # Supprimer les téléchargements expirés (les plus anciens d'abord)
     expired_downloads = VideoDownload.objects.filter(
-        expires_at__lt=timezone.now(),
-        status='completed'
-    )
-    
-    deleted_count = 0
-    for download in expired_downloads:
-        try:
-            # Supprimer le fichier physique
-            if download.file_path:
-                download.file_path.delete()
-            
-            # Supprimer l'objet
-            download.delete()
-            deleted_count += 1
-            
-        except Exception as e:
-            logger.error(f"Erreur lors de la suppression de {download.id}: {e}")
+        status='completed',
+        expires_at__lt=now
+    ).order_by('expires_at')
+    deleted_count = delete_downloads_in_batches(expired_downloads, batch_size, max_batches)
     
     # Supprimer les téléchargements échoués anciens (plus de 7 jours)
     old_failed = VideoDownload.objects.filter(
         status='failed',
-        created_at__lt=timezone.now() - timedelta(days=7)
-    )
-    
-    failed_deleted = old_failed.count()
-    old_failed.delete()
+        created_at__lt=now - timedelta(days=7)
+    ).order_by('created_at')
+    failed_deleted = delete_downloads_in_batches(old_failed, batch_size, max_batches)
     
     logger.info(f"Nettoyage terminé: {deleted_count} téléchargements expirés, {failed_deleted} échecs anciens supprimés")
     
-    # Nettoyage des fichiers orphelins dans le dossier downloads
-    download_dir = os.path.join(settings.MEDIA_ROOT, 'downloads')
-    if os.path.exists(download_dir):
-        all_files = set(os.listdir(download_dir))
-        referenced_files = set()
-        for vd in VideoDownload.objects.exclude(file_path__isnull=True).exclude(file_path__exact=''):
-            referenced_files.add(os.path.basename(vd.file_path.name if hasattr(vd.file_path, 'name') else vd.file_path))
-        orphan_files = all_files - referenced_files
-        for filename in orphan_files:
-            try:
-                file_path = os.path.join(download_dir, filename)
-                os.remove(file_path)
-                logger.info(f"Fichier orphelin supprimé: {filename}")
-            except Exception as e:
-                logger.warning(f"Erreur lors de la suppression du fichier orphelin {filename}: {e}")
+    # Compteurs des playlists sans nouvelle depuis longtemps : vérifiés par agrégation
+    repaired = repair_stalled_playlists(getattr(settings, 'DOWNLOADER_PLAYLIST_REPAIR_AFTER', 600), batch_size)
+    if repaired:
+        logger.info(f"{repaired} playlist(s) en attente vérifiée(s)")
+    
+    # Nettoyage des fichiers orphelins : quelques sous-dossiers par exécution, à partir du curseur
+    shards = [''] + shard_names()
+    cursor = cache.get(CLEANUP_CURSOR_KEY) or 0
+    per_run = getattr(settings, 'DOWNLOADER_CLEANUP_SHARDS_PER_RUN', 16)
+    selected = [shards[(cursor + i) % len(shards)] for i in range(min(per_run, len(shards)))]
+    orphans_deleted = cleanup_orphan_files(
+        selected,
+        getattr(settings, 'DOWNLOADER_CLEANUP_ORPHAN_GRACE', 24 * 3600),
+        batch_size
+    )
+    cache.set(CLEANUP_CURSOR_KEY, (cursor + len(selected)) % len(shards), timeout=None)
+    
+    logger.info(f"Nettoyage terminé ({orphans_deleted} fichiers orphelins supprimés)")
+    return f"Supprimé: {deleted_count + failed_deleted} éléments"
+
 
-    logger.info("Nettoyage terminé")
-    return f"Supprimé: {deleted_count + failed_deleted} éléments"
\ No newline at end of file
+def storage_budget():
+    """Seuils haut et bas (en octets) du quota de MEDIA_ROOT/downloads"""
+    budget = getattr(settings, 'DOWNLOADER_STORAGE_BUDGET', 50 * 1024 ** 3)
+    high = int(budget * getattr(settings, 'DOWNLOADER_STORAGE_HIGH_WATERMARK', 0.9))
+    low = int(budget * getattr(settings, 'DOWNLOADER_STORAGE_LOW_WATERMARK', 0.8))
+    return high, low
+
+
+def storage_over_high_watermark():
+    """Indique si l'utilisation du stockage dépasse le seuil haut"""
+    high, _ = storage_budget()
+    return get_usage() > high
+
+
+@shared_task
+def enforce_storage_quota():
+    """Évince les fichiers les moins récemment utilisés au-delà du quota
+
+    Dès que l'utilisation dépasse le seuil haut, les fichiers sont
+    supprimés (avec leurs téléchargements) jusqu'à revenir au seuil bas.
+    """
+    high, low = storage_budget()
+    usage = get_usage()
+    if usage <= high:
+        return f"Quota respecté: {usage} octets"
+    
+    freed = evict_least_recently_used(usage - low)
+    logger.info(f"Quota de stockage dépassé: {freed} octets libérés")
+    return f"Libéré: {freed} octets"
@@ -1,7 +1,55 @@
 from rest_framework.test import APITestCase
+from django.test import Client, TestCase
+from rest_framework.throttling import ScopedRateThrottle
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
-from .models import Platform, VideoDownload
+from .models import Platform, StoredFile, VideoDownload
+from .tasks import (
+    VideoDownloadProgress, cleanup_old_downloads, download_video_task, enforce_storage_quota,
+    expand_playlist_task, finish_cancelled_downloads
+)
+from .events import format_sse, is_terminal, publish_progress
+from .extraction import (
+    LocalInfoCache, cache_timeout, canonical_video_key, get_cache_stats, get_video_info, local_cache
+)
+from django.core.cache import cache
+from .cancellation import cancel, cancel_key
+from .concurrency import acquire_slot, refresh_slot, slot_key
+from .routing import queue_for, route_download
+from .inflight import inflight_key
+from . import inflight
+from celery.exceptions import Retry
+from .throttling import take_token
+from .serving import partial_file_key, tail_download
+from .playlists import children_finished, repair_stalled_playlists
+from .platforms import active_platforms, detect_platform
+from .stats import DOWNLOAD_STATS_KEY, compute_download_stats, recompute_lock_key
+from .rollups import rebuild_rollups, record_finished
+from .models import DownloadRollup
+from . import discovery, heartbeats, metrics, search, views
+from .storage import (
+    acquire_file, evict_least_recently_used, get_usage, register_file, release_file, shard_dir
+)
+from django.core.management import call_command
+from io import StringIO
+from unittest import mock
+from django.test import override_settings
+from django.apps import apps as django_apps
+from django.conf import settings
+from asgiref.sync import async_to_sync
+import asyncio
+import importlib
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from django.utils import timezone
 
 # Create your tests here.
 
@@ -83,3 +131,1731 @@ class DownloaderAPITests(APITestCase):
         }
         response = self.client.post(url, data, format='json')
         self.assertIn(response.status_code, [status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST])
+
+
+class VideoDownloadProgressTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(
+            name='youtube', display_name='YouTube', is_active=True
+        )
+
+    def setUp(self):
+        self.download = VideoDownload.objects.create(
+            source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            platform=self.platform
+        )
+
+    def hook_data(self, downloaded, total=1000):
+        return {'status': 'downloading', 'downloaded_bytes': downloaded, 'total_bytes': total}
+
+    def test_progress_writes_are_coalesced(self):
+        tracker = VideoDownloadProgress(self.download.id, flush_interval=3600, flush_delta=10)
+        with CaptureQueriesContext(connection) as ctx:
+            for downloaded in range(0, 1000, 10):
+                tracker.progress_hook(self.hook_data(downloaded))
+        # Une écriture initiale puis une tous les 10 points de pourcentage
+        self.assertEqual(len(ctx.captured_queries), 10)
+        self.assertTrue(all(q['sql'].startswith('UPDATE') for q in ctx.captured_queries))
+
+    def test_finished_forces_final_flush(self):
+        tracker = VideoDownloadProgress(self.download.id, flush_interval=3600, flush_delta=50)
+        tracker.progress_hook(self.hook_data(0))
+        tracker.progress_hook(self.hook_data(300))
+        self.download.refresh_from_db()
+        self.assertEqual(self.download.progress_percentage, 0)
+
+        tracker.progress_hook({'status': 'finished'})
+        self.download.refresh_from_db()
+        self.assertEqual(self.download.progress_percentage, 99)
+        self.assertEqual(self.download.status, 'processing')
+        self.assertIsNotNone(self.download.started_at)
+
+    def test_flush_without_changes_is_noop(self):
+        tracker = VideoDownloadProgress(self.download.id)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertFalse(tracker.flush(force=True))
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+
+class ProgressEventsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(
+            name='youtube', display_name='YouTube', is_active=True
+        )
+
+    def test_format_sse(self):
+        self.assertEqual(format_sse('{"a": 1}', event='progress'), 'event: progress\ndata: {"a": 1}\n\n')
+
+    def test_is_terminal(self):
+        self.assertTrue(is_terminal(json.dumps({'status': 'completed'})))
+        self.assertFalse(is_terminal(json.dumps({'status': 'processing'})))
+        self.assertFalse(is_terminal('invalid'))
+
+    @mock.patch('downloader.events.get_redis')
+    def test_publish_progress_sets_snapshot_and_publishes(self, get_redis):
+        pipe = get_redis.return_value.pipeline.return_value
+        self.assertTrue(publish_progress('abc', {'status': 'processing', 'progress_percentage': 42}))
+        key, message = pipe.set.call_args[0]
+        self.assertEqual(key, 'downloader:downloads:abc:snapshot')
+        self.assertEqual(json.loads(message)['progress_percentage'], 42)
+        pipe.publish.assert_called_once_with('downloader:downloads:abc:events', message)
+
+    @mock.patch('downloader.events.get_redis')
+    def test_publish_progress_swallows_redis_errors(self, get_redis):
+        get_redis.return_value.pipeline.side_effect = ConnectionError('down')
+        self.assertFalse(publish_progress('abc', {'status': 'processing'}))
+
+    async def test_events_share_one_redis_client(self):
+        snapshot = json.dumps({'id': 'abc', 'status': 'completed'})
+        client = mock.Mock(get=mock.AsyncMock(return_value=snapshot), aclose=mock.AsyncMock())
+        client.pubsub.return_value = mock.Mock(subscribe=mock.AsyncMock(), aclose=mock.AsyncMock())
+        url = reverse('download-events', args=['00000000-0000-0000-0000-000000000000'])
+        with mock.patch('downloader.views.get_async_redis', return_value=client) as get_async_redis, \
+                mock.patch('downloader.events.get_async_redis') as other_clients:
+            response = await self.async_client.get(url)
+            content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertIn(b'"completed"', content)
+        # L'état courant est lu avec le client du flux, fermé une seule fois
+        get_async_redis.assert_called_once_with()
+        other_clients.assert_not_called()
+        client.aclose.assert_awaited_once()
+
+    @mock.patch('downloader.views.get_snapshot', new_callable=mock.AsyncMock, return_value=None)
+    def test_events_unknown_download(self, get_snapshot):
+        url = reverse('download-events', args=['00000000-0000-0000-0000-000000000000'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+
+class DownloadVideoTaskTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(
+            name='youtube', display_name='YouTube', is_active=True
+        )
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.ydls = []
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.download = VideoDownload.objects.create(
+            source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            platform=self.platform
+        )
+
+    def fake_youtube_dl(self, ydl_opts):
+        """YoutubeDL factice qui écrit le fichier attendu sans accès réseau"""
+        ydl = mock.MagicMock()
+        ydl.__enter__.return_value = ydl
+        ydl.sanitize_info.side_effect = lambda info, **kwargs: info
+        ydl.extract_info.return_value = {
+            'id': 'dQw4w9WgXcQ', 'title': 'Never Gonna Give You Up', 'duration': 212,
+            'thumbnails': [{'url': 'https://i.ytimg.com/vi/dQw4w9WgXcQ/hq.jpg'}],
+        }
+
+        def process_ie_result(info, download=True):
+            filename = ydl_opts['outtmpl'].replace('%(title)s', 'video').replace('%(ext)s', 'mp4')
+            # Fichier intermédiaire qui ne doit pas être pris pour le résultat
+            with open(filename + '.part', 'wb') as f:
+                f.write(b'0')
+            for progress_hook in ydl_opts.get('progress_hooks', []):
+                progress_hook({
+                    'status': 'downloading', 'downloaded_bytes': 1, 'total_bytes': 128,
+                    'tmpfilename': filename + '.part', 'filename': filename,
+                })
+            with open(filename, 'wb') as f:
+                f.write(b'0' * 128)
+            for post_hook in ydl_opts.get('post_hooks', []):
+                post_hook(filename)
+            return dict(info, height=720, ext='mp4')
+
+        ydl.process_ie_result.side_effect = process_ie_result
+        self.ydls.append(ydl)
+        return ydl
+
+    def run_task(self, download):
+        with override_settings(MEDIA_ROOT=self.media_root.name), \
+                mock.patch('yt_dlp.YoutubeDL', side_effect=self.fake_youtube_dl):
+            download_video_task(str(download.id))
+
+    def test_single_pass_extraction(self):
+        self.run_task(self.download)
+
+        extract_calls = [c for ydl in self.ydls for c in ydl.extract_info.call_args_list]
+        self.assertEqual(len(extract_calls), 1)
+        self.assertEqual(sum(ydl.process_ie_result.call_count for ydl in self.ydls), 1)
+        self.assertFalse(any(ydl.download.called for ydl in self.ydls))
+
+        self.download.refresh_from_db()
+        self.assertEqual(self.download.status, 'completed')
+        self.assertEqual(self.download.title, 'Never Gonna Give You Up')
+        self.assertEqual(self.download.thumbnail_url, 'https://i.ytimg.com/vi/dQw4w9WgXcQ/hq.jpg')
+        self.assertEqual(self.download.file_size, 128)
+        self.assertTrue(self.download.file_path.name.startswith(shard_dir(self.download.id)))
+        self.assertIsNotNone(self.download.expires_at)
+        self.assertEqual(get_usage(), 128)
+
+    def test_followers_receive_leader_file(self):
+        follower = VideoDownload.objects.create(
+            source_url='https://youtu.be/dQw4w9WgXcQ',
+            platform=self.platform,
+            coalesced_with=self.download
+        )
+        self.run_task(self.download)
+
+        follower.refresh_from_db()
+        self.download.refresh_from_db()
+        self.assertEqual(follower.status, 'completed')
+        self.assertEqual(follower.file_path.name, self.download.file_path.name)
+        self.assertEqual(follower.stored_file.ref_count, 2)
+
+    def test_progress_is_mirrored_to_followers(self):
+        follower = VideoDownload.objects.create(
+            source_url='https://youtu.be/dQw4w9WgXcQ',
+            platform=self.platform,
+            coalesced_with=self.download
+        )
+        tracker = VideoDownloadProgress(self.download.id)
+        tracker.progress_hook({'status': 'downloading', 'downloaded_bytes': 420, 'total_bytes': 1000})
+        follower.refresh_from_db()
+        self.assertEqual(follower.progress_percentage, 42)
+
+    def test_metadata_cache_shared_between_jobs(self):
+        other = VideoDownload.objects.create(
+            source_url='https://youtu.be/dQw4w9WgXcQ',
+            platform=self.platform
+        )
+        self.run_task(self.download)
+        self.run_task(other)
+
+        extract_calls = [c for ydl in self.ydls for c in ydl.extract_info.call_args_list]
+        self.assertEqual(len(extract_calls), 1)
+        self.assertEqual(get_cache_stats()['hits'], 1)
+        self.assertEqual(get_cache_stats()['misses'], 1)
+
+    def test_cancel_flag_aborts_transfer(self):
+        def cancel_during_transfer(download_id):
+            # Annulation demandée par l'API pendant le transfert
+            cancel(VideoDownload.objects.get(id=download_id))
+            return cache.get(cancel_key(download_id))
+
+        with mock.patch('downloader.tasks.cancel_requested', cancel_during_transfer), \
+                mock.patch.object(download_video_task, 'retry') as retry:
+            self.run_task(self.download)
+        retry.assert_not_called()
+
+        self.download.refresh_from_db()
+        self.assertEqual(self.download.status, 'cancelled')
+        download_dir = os.path.join(self.media_root.name, shard_dir(self.download.id))
+        self.assertEqual(os.listdir(download_dir), [])
+
+    def test_retry_keeps_leader_active_until_last_attempt(self):
+        VideoDownload.objects.filter(pk=self.download.pk).update(video_key='youtube:dQw4w9WgXcQ', format_key='best')
+        self.download.refresh_from_db()
+        inflight.claim(self.download.video_key, self.download.format_key, self.download.id)
+        follower = VideoDownload.objects.create(
+            source_url='https://youtu.be/dQw4w9WgXcQ', platform=self.platform, coalesced_with=self.download
+        )
+
+        def failing_youtube_dl(ydl_opts):
+            ydl = self.fake_youtube_dl(ydl_opts)
+            ydl.process_ie_result.side_effect = Exception('HTTP Error 503')
+            return ydl
+
+        with override_settings(MEDIA_ROOT=self.media_root.name), \
+                mock.patch('yt_dlp.YoutubeDL', side_effect=failing_youtube_dl):
+            with mock.patch.object(download_video_task, 'retry', side_effect=Retry()):
+                with self.assertRaises(Retry):
+                    download_video_task(str(self.download.id))
+            # Entre deux tentatives : ni état final ni perte du verrou single-flight
+            self.download.refresh_from_db()
+            follower.refresh_from_db()
+            self.assertEqual(self.download.status, 'pending')
+            self.assertEqual(follower.status, 'pending')
+            self.assertEqual(cache.get(inflight_key(self.download.video_key, 'best')), str(self.download.id))
+            self.assertFalse(DownloadRollup.objects.exists())
+
+            with mock.patch.object(download_video_task, 'max_retries', 0):
+                download_video_task(str(self.download.id))
+        self.download.refresh_from_db()
+        follower.refresh_from_db()
+        self.assertEqual(self.download.status, 'failed')
+        self.assertEqual(follower.status, 'failed')
+        self.assertIsNone(cache.get(inflight_key(self.download.video_key, 'best')))
+
+    def test_cancelled_leader_completes_followers(self):
+        follower = VideoDownload.objects.create(
+            source_url='https://youtu.be/dQw4w9WgXcQ',
+            platform=self.platform,
+            coalesced_with=self.download
+        )
+        original_flush = VideoDownloadProgress.flush
+
+        def cancel_during_transfer(tracker, force=False):
+            VideoDownload.objects.filter(pk=self.download.pk).update(status='cancelled')
+            return original_flush(tracker, force)
+
+        with mock.patch.object(VideoDownloadProgress, 'flush', cancel_during_transfer):
+            self.run_task(self.download)
+
+        follower.refresh_from_db()
+        self.download.refresh_from_db()
+        self.assertEqual(self.download.status, 'cancelled')
+        self.assertEqual(follower.status, 'completed')
+        self.assertEqual(follower.stored_file.ref_count, 1)
+
+    def test_platform_limit_defers_task(self):
+        Platform.objects.filter(pk=self.platform.pk).update(max_concurrent_downloads=1)
+        cache.add(slot_key('youtube', 0), 'other-download')
+        with mock.patch.object(download_video_task, 'apply_async', **{'return_value.id': 'task-2'}) as apply_async:
+            self.run_task(self.download)
+        self.assertEqual(apply_async.call_args.kwargs['args'], [str(self.download.id)])
+        self.download.refresh_from_db()
+        self.assertEqual(self.download.status, 'pending')
+        self.assertEqual(self.download.celery_task_id, 'task-2')
+
+    def test_platform_slot_released_after_transfer(self):
+        Platform.objects.filter(pk=self.platform.pk).update(max_concurrent_downloads=1)
+        self.run_task(self.download)
+        self.download.refresh_from_db()
+        self.assertEqual(self.download.status, 'completed')
+        self.assertIsNone(cache.get(slot_key('youtube', 0)))
+
+    def test_platform_slot_expires_unless_refreshed(self):
+        with mock.patch('downloader.concurrency.cache.add', return_value=True) as add:
+            acquire_slot('youtube', 1, self.download.id)
+        self.assertEqual(add.call_args.kwargs['timeout'], 300)
+
+        key = acquire_slot('youtube', 1, self.download.id)
+        tracker = VideoDownloadProgress(self.download.id, platform=self.platform, slot=key)
+        with mock.patch('downloader.tasks.refresh_slot') as refresh:
+            tracker.progress_hook({'status': 'downloading'})
+            refresh.assert_not_called()
+            tracker.last_slot_refresh -= 101
+            tracker.progress_hook({'status': 'downloading'})
+            refresh.assert_called_once_with(key, self.download.id)
+        self.assertTrue(refresh_slot(key, self.download.id))
+        self.assertFalse(refresh_slot(key, 'other-download'))
+
+    def test_rate_limited_job_is_deferred(self):
+        with mock.patch('downloader.tasks.take_token', return_value=12.0), \
+                mock.patch.object(download_video_task, 'apply_async', **{'return_value.id': 'task-2'}) as apply_async:
+            self.run_task(self.download)
+        self.assertEqual(apply_async.call_args.kwargs['countdown'], 12.0)
+        self.download.refresh_from_db()
+        self.assertEqual(self.download.status, 'pending')
+
+    def test_fragments_wait_for_tokens(self):
+        tracker = VideoDownloadProgress(self.download.id, platform=self.platform)
+        with mock.patch('downloader.tasks.take_token', side_effect=[0, 0.5, 0]) as take_token, \
+                mock.patch('downloader.tasks.time.sleep') as sleep:
+            for index in (1, 1, 2):
+                tracker.progress_hook({'status': 'downloading', 'fragment_index': index, 'fragment_count': 10})
+        self.assertEqual(take_token.call_count, 3)
+        sleep.assert_called_once_with(0.5)
+
+    def test_rate_limiter_fails_open(self):
+        self.platform.rate_limit_per_minute = 30
+        with mock.patch('downloader.throttling.get_redis', side_effect=ConnectionError):
+            self.assertEqual(take_token(self.platform), 0)
+        self.assertEqual(take_token(Platform(name='vimeo')), 0)
+
+    def test_downloads_routed_by_postprocessing(self):
+        merged = VideoDownload.objects.create(
+            source_url='https://youtu.be/dQw4w9WgXcQ',
+            platform=self.platform,
+            requested_quality='137+140'
+        )
+        route = lambda download: route_download('downloader.tasks.download_video_task', [str(download.id)], {}, {})
+        self.assertEqual(route(self.download), {'queue': 'transfer'})
+        self.assertEqual(route(merged), {'queue': 'postprocess'})
+
+
+class SingleFlightTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(
+            name='youtube', display_name='YouTube', is_active=True
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch('downloader.views.download_video_task.delay', **{'return_value.id': 'task-id'})
+    def test_identical_requests_share_one_task(self, delay):
+        data = {'source_url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ', 'requested_quality': 'best'}
+        first = self.client.post(reverse('download-create'), data)
+        data['source_url'] = 'https://m.youtube.com/watch?v=dQw4w9WgXcQ'
+        second = self.client.post(reverse('download-create'), data)
+
+        self.assertEqual(delay.call_count, 1)
+        follower = VideoDownload.objects.get(id=second.data['id'])
+        self.assertEqual(str(follower.coalesced_with_id), first.data['id'])
+
+    @mock.patch('downloader.views.download_video_task.delay', **{'return_value.id': 'task-id'})
+    def test_finished_leader_is_replaced(self, delay):
+        data = {'source_url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ', 'requested_quality': 'best'}
+        first = self.client.post(reverse('download-create'), data)
+        VideoDownload.objects.filter(id=first.data['id']).update(status='failed')
+        second = self.client.post(reverse('download-create'), data)
+
+        self.assertEqual(delay.call_count, 2)
+        self.assertIsNone(VideoDownload.objects.get(id=second.data['id']).coalesced_with_id)
+
+
+class MigrateDownloadLayoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(
+            name='youtube', display_name='YouTube', is_active=True
+        )
+
+    def test_flat_files_are_moved_to_shards(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            download = VideoDownload.objects.create(
+                source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+                platform=self.platform,
+                status='completed'
+            )
+            old_path = f'downloads/{download.id}_video.mp4'
+            os.makedirs(os.path.join(media_root, 'downloads'))
+            with open(os.path.join(media_root, old_path), 'wb') as f:
+                f.write(b'0' * 16)
+            VideoDownload.objects.filter(pk=download.pk).update(
+                file_path=old_path, stored_file=register_file(old_path, 16)
+            )
+
+            call_command('migrate_download_layout', stdout=StringIO())
+
+            download.refresh_from_db()
+            new_path = os.path.join(shard_dir(download.id), f'{download.id}_video.mp4')
+            self.assertEqual(download.file_path.name, new_path)
+            self.assertEqual(download.stored_file.path, new_path)
+            self.assertTrue(os.path.exists(os.path.join(media_root, new_path)))
+
+
+class CleanupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(
+            name='youtube', display_name='YouTube', is_active=True
+        )
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            DOWNLOADER_CLEANUP_BATCH_SIZE=2,
+            DOWNLOADER_CLEANUP_SHARDS_PER_RUN=257,
+            DOWNLOADER_CLEANUP_ORPHAN_GRACE=3600,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write_file(self, relative_path, age=0):
+        full_path = os.path.join(self.media_root, relative_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as f:
+            f.write(b'0' * 8)
+        mtime = time.time() - age
+        os.utime(full_path, (mtime, mtime))
+        return full_path
+
+    def test_expired_downloads_removed_in_batches(self):
+        shared_path = 'downloads/ab/cd/shared.mp4'
+        shared_file = self.write_file(shared_path, age=7200)
+        stored = register_file(shared_path, 8, references=5)
+        expired = timezone.now() - timedelta(hours=1)
+        for _ in range(5):
+            VideoDownload.objects.create(
+                source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+                platform=self.platform,
+                status='completed',
+                file_path=shared_path,
+                stored_file=stored,
+                expires_at=expired
+            )
+        kept = VideoDownload.objects.create(
+            source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            platform=self.platform,
+            status='completed',
+            expires_at=timezone.now() + timedelta(days=1)
+        )
+
+        cleanup_old_downloads()
+
+        self.assertEqual(list(VideoDownload.objects.values_list('id', flat=True)), [kept.id])
+        self.assertFalse(os.path.exists(shared_file))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_only_old_orphans_are_removed(self):
+        orphan = self.write_file('downloads/12/34/orphan.mp4', age=7200)
+        legacy_orphan = self.write_file('downloads/legacy.mp4', age=7200)
+        in_progress = self.write_file('downloads/12/34/current.mp4.part')
+        referenced = self.write_file('downloads/12/34/kept.mp4', age=7200)
+        VideoDownload.objects.create(
+            source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            platform=self.platform,
+            status='completed',
+            file_path='downloads/12/34/kept.mp4'
+        )
+
+        cleanup_old_downloads()
+
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(legacy_orphan))
+        self.assertTrue(os.path.exists(in_progress))
+        self.assertTrue(os.path.exists(referenced))
+
+
+@override_settings(
+    DOWNLOADER_STORAGE_BUDGET=1000,
+    DOWNLOADER_STORAGE_HIGH_WATERMARK=0.9,
+    DOWNLOADER_STORAGE_LOW_WATERMARK=0.5,
+)
+class StorageQuotaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(
+            name='youtube', display_name='YouTube', is_active=True
+        )
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def add_file(self, name, size, accessed_hours_ago):
+        stored = register_file(f'downloads/{name}', size)
+        StoredFile.objects.filter(pk=stored.pk).update(
+            last_accessed_at=timezone.now() - timedelta(hours=accessed_hours_ago)
+        )
+        VideoDownload.objects.create(
+            source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            platform=self.platform,
+            status='completed',
+            file_path=stored.path,
+            stored_file=stored
+        )
+        return stored
+
+    def test_usage_is_tracked_without_aggregation(self):
+        self.add_file('a.mp4', 300, 1)
+        stored = self.add_file('b.mp4', 200, 1)
+        self.assertEqual(get_usage(), 500)
+        release_file(VideoDownload.objects.get(stored_file=stored))
+        self.assertEqual(get_usage(), 300)
+
+    def test_migration_backfills_existing_files(self):
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'downloads'))
+        with open(os.path.join(settings.MEDIA_ROOT, 'downloads', 'legacy.mp4'), 'wb') as f:
+            f.write(b'x' * 120)
+        completed_at = timezone.now() - timedelta(days=1)
+        legacy = [
+            VideoDownload.objects.create(
+                source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ', platform=self.platform,
+                status='completed', file_path='downloads/legacy.mp4', completed_at=completed_at
+            )
+            for _ in range(2)
+        ]
+        VideoDownload.objects.create(
+            source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ', platform=self.platform,
+            status='completed', file_path='downloads/missing.mp4', file_size=80
+        )
+
+        migration = importlib.import_module('downloader.migrations.0005_storage_quota')
+        migration.init_storage_usage(django_apps, None)
+
+        stored = StoredFile.objects.get(path='downloads/legacy.mp4')
+        self.assertEqual((stored.size, stored.ref_count), (120, 2))
+        self.assertEqual(StoredFile.objects.get(path='downloads/missing.mp4').size, 80)
+        self.assertEqual(get_usage(), 200)
+        legacy[0].refresh_from_db()
+        self.assertEqual(legacy[0].stored_file, stored)
+        self.assertEqual(legacy[0].expires_at, completed_at + timedelta(seconds=settings.DOWNLOADER_DEFAULT_TTL))
+        self.assertFalse(VideoDownload.objects.filter(expires_at__isnull=True).exists())
+
+    def test_least_recently_used_files_are_evicted(self):
+        oldest = self.add_file('old.mp4', 400, 48)
+        middle = self.add_file('middle.mp4', 300, 24)
+        recent = self.add_file('recent.mp4', 300, 1)
+
+        enforce_storage_quota()
+
+        remaining = set(StoredFile.objects.values_list('pk', flat=True))
+        self.assertEqual(remaining, {recent.pk})
+        self.assertFalse(VideoDownload.objects.filter(stored_file_id__in=[oldest.pk, middle.pk]).exists())
+        self.assertEqual(get_usage(), 300)
+
+    def test_file_reused_during_eviction_is_kept(self):
+        oldest = self.add_file('old.mp4', 400, 48)
+        middle = self.add_file('middle.mp4', 300, 24)
+        real_atomic = transaction.atomic
+        reused = []
+
+        def reuse_before_delete(*args, **kwargs):
+            # Un téléchargement identique réutilise le fichier entre sélection et suppression
+            if not reused:
+                reused.append(acquire_file(oldest.pk))
+            return real_atomic(*args, **kwargs)
+
+        with mock.patch('django.db.transaction.atomic', side_effect=reuse_before_delete):
+            freed = evict_least_recently_used(400)
+        self.assertEqual(reused, [True])
+        self.assertEqual(freed, 300)
+        self.assertTrue(StoredFile.objects.filter(pk=oldest.pk, ref_count=2).exists())
+        self.assertTrue(VideoDownload.objects.filter(stored_file=oldest).exists())
+        self.assertFalse(StoredFile.objects.filter(pk=middle.pk).exists())
+
+    def test_no_eviction_below_high_watermark(self):
+        self.add_file('a.mp4', 800, 48)
+        enforce_storage_quota()
+        self.assertEqual(StoredFile.objects.count(), 1)
+
+
+class MetadataCacheTests(TestCase):
+    def test_canonical_key_ignores_url_variants(self):
+        keys = {
+            canonical_video_key(url) for url in [
+                'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+                'https://youtu.be/dQw4w9WgXcQ',
+                'https://m.youtube.com/watch?v=dQw4w9WgXcQ&t=42',
+            ]
+        }
+        self.assertEqual(keys, {'youtube:dQw4w9WgXcQ'})
+
+    def test_cache_timeout_below_signed_url_lifetime(self):
+        expire = int(time.time()) + 120
+        info = {'formats': [{'url': f'https://cdn.example.com/v.mp4?expire={expire}&sig=x'}]}
+        with override_settings(DOWNLOADER_METADATA_CACHE_TTL=300):
+            self.assertLessEqual(cache_timeout(info), 60)
+            self.assertEqual(cache_timeout({'formats': []}), 300)
+
+    @mock.patch('downloader.extraction.yt_dlp.YoutubeDL')
+    def test_playlist_entries_are_not_resolved(self, youtube_dl):
+        def entries():
+            raise AssertionError("entrée résolue")
+            yield
+        ydl = youtube_dl.return_value.__enter__.return_value
+        ydl.extract_info.return_value = {'_type': 'playlist', 'id': 'PL1', 'entries': entries()}
+        ydl.sanitize_info.side_effect = lambda info, **kwargs: info
+
+        info = get_video_info('https://www.youtube.com/playlist?list=PL1')
+        self.assertEqual(info, {'_type': 'playlist', 'id': 'PL1'})
+        self.assertIs(ydl.extract_info.call_args.kwargs['process'], False)
+        ydl.process_ie_result.assert_not_called()
+        # Les playlists ne sont pas mises en cache
+        get_video_info('https://www.youtube.com/playlist?list=PL1')
+        self.assertEqual(ydl.extract_info.call_count, 2)
+
+    def test_local_cache_is_size_bounded(self):
+        local = LocalInfoCache(max_entries=2)
+        for key in ('a', 'b', 'c'):
+            local.set(key, {'id': key}, timeout=60)
+        self.assertIsNone(local.get('a'))
+        self.assertEqual(local.get('c'), {'id': 'c'})
+
+
+class ResultReuseTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(
+            name='youtube', display_name='YouTube', is_active=True
+        )
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        os.makedirs(os.path.join(self.media_root, 'downloads'))
+        self.relative_path = 'downloads/source_video.mp4'
+        with open(os.path.join(self.media_root, self.relative_path), 'wb') as f:
+            f.write(b'0' * 64)
+        self.source = VideoDownload.objects.create(
+            source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            platform=self.platform,
+            title='Never Gonna Give You Up',
+            video_key='youtube:dQw4w9WgXcQ',
+            format_key='video:best[height<=1080]',
+            status='completed',
+            file_path=self.relative_path,
+            file_size=64,
+            stored_file=register_file(self.relative_path, 64),
+        )
+
+    @mock.patch('downloader.views.download_video_task.delay', **{'return_value.id': 'task-id'})
+    def test_completed_file_is_reused(self, delay):
+        response = self.client.post(reverse('download-create'), {
+            'source_url': 'https://youtu.be/dQw4w9WgXcQ',
+            'requested_quality': 'best',
+            'download_audio_only': False
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertEqual(response.data['title'], 'Never Gonna Give You Up')
+        delay.assert_not_called()
+        self.assertEqual(StoredFile.objects.get(path=self.relative_path).ref_count, 2)
+
+    @mock.patch('downloader.views.download_video_task.delay', **{'return_value.id': 'task-id'})
+    def test_other_format_is_downloaded(self, delay):
+        response = self.client.post(reverse('download-create'), {
+            'source_url': 'https://youtu.be/dQw4w9WgXcQ',
+            'requested_quality': 'best',
+            'download_audio_only': True
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], 'pending')
+        delay.assert_called_once()
+
+    def test_shared_file_deleted_with_last_reference(self):
+        full_path = os.path.join(self.media_root, self.relative_path)
+        self.assertTrue(acquire_file(self.source.stored_file_id))
+        copy = VideoDownload.objects.create(
+            source_url='https://youtu.be/dQw4w9WgXcQ',
+            platform=self.platform,
+            status='completed',
+            file_path=self.relative_path,
+            stored_file=self.source.stored_file,
+        )
+
+        release_file(self.source)
+        self.assertTrue(os.path.exists(full_path))
+        release_file(copy)
+        self.assertFalse(os.path.exists(full_path))
+        self.assertFalse(StoredFile.objects.filter(path=self.relative_path).exists())
+
+
+class FileServingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(
+            name='youtube', display_name='YouTube', is_active=True
+        )
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        relative_path = 'downloads/ab/cd/video.mp4'
+        os.makedirs(os.path.join(media_root.name, 'downloads/ab/cd'))
+        with open(os.path.join(media_root.name, relative_path), 'wb') as f:
+            f.write(bytes(range(100)))
+        self.download = VideoDownload.objects.create(
+            source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            platform=self.platform,
+            status='completed',
+            file_path=relative_path,
+            file_size=100,
+            stored_file=register_file(relative_path, 100),
+        )
+        self.url = reverse('download-file', args=[self.download.id])
+
+    def test_full_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(100)))
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_range_request(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(95, 100)))
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=200-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_accel_redirect(self):
+        with override_settings(DOWNLOADER_SENDFILE_BACKEND='nginx', DOWNLOADER_ACCEL_REDIRECT_PREFIX='/protected/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/downloads/ab/cd/video.mp4')
+        self.assertEqual(response.content, b'')
+
+    def test_pending_download_not_served(self):
+        VideoDownload.objects.filter(pk=self.download.pk).update(status='processing')
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class ProgressiveStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(
+            name='youtube', display_name='YouTube', is_active=True
+        )
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, DOWNLOADER_STREAM_POLL_INTERVAL=0.01)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_download(self, **kwargs):
+        return VideoDownload.objects.create(
+            source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            platform=self.platform,
+            status='processing',
+            **kwargs
+        )
+
+    def test_merged_format_is_rejected(self):
+        download = self.create_download(requested_quality='137+140')
+        response = self.client.get(reverse('download-stream', args=[download.id]))
+        self.assertEqual(response.status_code, 409)
+
+    def test_completed_download_redirects_to_file(self):
+        download = self.create_download()
+        VideoDownload.objects.filter(pk=download.pk).update(status='completed')
+        response = self.client.get(reverse('download-stream', args=[download.id]))
+        self.assertRedirects(response, reverse('download-file', args=[download.id]), fetch_redirect_response=False)
+
+    def test_tail_follows_growing_file_until_completion(self):
+        download = self.create_download()
+        part_path = os.path.join(self.media_root, 'video.mp4.part')
+        final_path = os.path.join(self.media_root, 'video.mp4')
+        with open(part_path, 'wb') as f:
+            f.write(b'a' * 10)
+        cache.set(partial_file_key(download.id), {'tmpfilename': 'video.mp4.part', 'filename': 'video.mp4'})
+
+        statuses = iter(['processing', 'completed'])
+
+        async def snapshot(key):
+            # Le worker écrit la suite puis renomme le fichier avant de terminer
+            status = next(statuses)
+            if status == 'processing':
+                with open(part_path, 'ab') as f:
+                    f.write(b'b' * 5)
+            else:
+                os.rename(part_path, final_path)
+            return json.dumps({'status': status})
+
+        client = mock.Mock(get=snapshot, aclose=mock.AsyncMock())
+
+        async def collect():
+            return b''.join([chunk async for chunk in tail_download(download.id, chunk_size=4)])
+
+        with mock.patch('downloader.serving.get_async_redis', return_value=client) as get_async_redis, \
+                mock.patch('downloader.events.get_async_redis') as other_clients:
+            content = async_to_sync(collect)()
+        # Un seul client Redis pour tout le flux, fermé à la fin
+        get_async_redis.assert_called_once_with()
+        other_clients.assert_not_called()
+        client.aclose.assert_awaited_once()
+        self.assertEqual(content, b'a' * 10 + b'b' * 5)
+
+
+class CancellationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(
+            name='youtube', display_name='YouTube', is_active=True
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.download = VideoDownload.objects.create(
+            source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            platform=self.platform,
+            status='processing',
+            celery_task_id='task-1'
+        )
+
+    @mock.patch('downloader.cancellation.current_app')
+    def test_cancel_revokes_task_and_sets_flag(self, app):
+        response = self.client.post(reverse('cancel-download', args=[self.download.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        app.control.revoke.assert_called_once_with(['task-1'])
+        self.assertTrue(cache.get(cancel_key(self.download.id)))
+        self.download.refresh_from_db()
+        self.assertEqual(self.download.status, 'cancelled')
+
+    @mock.patch('downloader.cancellation.current_app')
+    def test_leader_keeps_running_for_followers(self, app):
+        follower = VideoDownload.objects.create(
+            source_url='https://youtu.be/dQw4w9WgXcQ',
+            platform=self.platform,
+            status='processing',
+            coalesced_with=self.download
+        )
+        self.client.post(reverse('cancel-download', args=[self.download.id]))
+        self.assertIsNone(cache.get(cancel_key(self.download.id)))
+
+        # Le dernier téléchargement rattaché annulé arrête le transfert
+        self.client.post(reverse('cancel-download', args=[follower.id]))
+        self.assertTrue(cache.get(cancel_key(self.download.id)))
+        app.control.revoke.assert_called_once_with(['task-1'])
+
+
+class BulkDownloadTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(
+            name='youtube', display_name='YouTube', is_active=True
+        )
+
+    def setUp(self):
+        cache.clear()
+        group_patch = mock.patch('downloader.bulk.group')
+        self.group = group_patch.start()
+        self.addCleanup(group_patch.stop)
+
+    def post(self, urls, **extra):
+        return self.client.post(reverse('bulk-download'), {'urls': urls}, format='json', **extra)
+
+    def test_results_per_url(self):
+        response = self.post([
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            'not a url',
+            'https://youtu.be/dQw4w9WgXcQ',
+            'https://vimeo.com/12345',
+            'https://www.youtube.com/watch?v=Zi_XLOBDo_Y',
+        ])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], ['pending', 'invalid', 'pending', 'invalid', 'pending'])
+        # Même vidéo : la seconde URL suit la première au lieu d'être téléchargée deux fois
+        self.assertEqual(results[2]['coalesced_with'], results[0]['id'])
+        self.assertEqual(VideoDownload.objects.count(), 3)
+
+        signatures = list(self.group.call_args.args[0])
+        self.assertEqual(len(signatures), 2)
+        self.group.return_value.apply_async.assert_called_once()
+        leader = VideoDownload.objects.get(id=results[0]['id'])
+        self.assertEqual(leader.celery_task_id, signatures[0].options['task_id'])
+
+    def test_queries_do_not_grow_with_batch_size(self):
+        def count_queries(n):
+            urls = [f'https://www.youtube.com/watch?v=batch{n:02d}{i:04d}' for i in range(n)]
+            with CaptureQueriesContext(connection) as queries:
+                self.post(urls)
+            return len(queries)
+        self.assertEqual(count_queries(5), count_queries(30))
+
+    def test_ndjson_stream(self):
+        response = self.post(
+            ['https://www.youtube.com/watch?v=dQw4w9WgXcQ', 'not a url'],
+            HTTP_ACCEPT='application/x-ndjson'
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        # Lot créé avant l'envoi de la première ligne (client déconnecté : rien n'est perdu)
+        self.assertEqual(VideoDownload.objects.count(), 1)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['status'] for line in lines], ['pending', 'invalid'])
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=100, DOWNLOADER_BULK_MAX_BODY_SIZE=1000)
+    def test_body_size_limit_is_specific_to_this_view(self):
+        urls = [f'https://www.youtube.com/watch?v=size{i:07d}' for i in range(10)]
+        self.assertEqual(self.post(urls).status_code, status.HTTP_201_CREATED)
+        response = self.post(urls * 3)
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+
+class PlaylistExpansionTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(
+            name='youtube', display_name='YouTube', is_active=True
+        )
+
+    def setUp(self):
+        cache.clear()
+        group_patch = mock.patch('downloader.bulk.group')
+        self.group = group_patch.start()
+        self.addCleanup(group_patch.stop)
+        self.playlist = VideoDownload.objects.create(
+            source_url='https://www.youtube.com/playlist?list=PL123abc',
+            platform=self.platform,
+            is_playlist=True
+        )
+
+    def child(self, status, index=0):
+        return VideoDownload.objects.create(
+            source_url=f'https://www.youtube.com/watch?v=child{index:05d}',
+            platform=self.platform,
+            parent=self.playlist,
+            status=status
+        )
+
+    @mock.patch('downloader.views.download_video_task.delay')
+    @mock.patch('downloader.views.expand_playlist_task.delay', **{'return_value.id': 'task-id'})
+    def test_playlist_url_is_expanded(self, expand, download):
+        response = self.client.post(reverse('download-create'), {
+            'source_url': 'https://www.youtube.com/playlist?list=PLother',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data['is_playlist'])
+        expand.assert_called_once_with(response.data['id'])
+        download.assert_not_called()
+
+    @override_settings(DOWNLOADER_PLAYLIST_BATCH_SIZE=2)
+    def test_children_enqueued_page_by_page(self):
+        pages_seen = []
+
+        def entries():
+            for i in range(5):
+                # Page suivante demandée seulement après le lancement du lot précédent
+                pages_seen.append(self.group.return_value.apply_async.call_count)
+                yield {'_type': 'url', 'url': f'https://www.youtube.com/watch?v=entry{i:05d}'}
+
+        ydl = mock.MagicMock()
+        ydl.__enter__.return_value.extract_info.return_value = {
+            '_type': 'playlist', 'title': 'Ma playlist', 'entries': entries()
+        }
+        with mock.patch('downloader.tasks.yt_dlp.YoutubeDL', return_value=ydl):
+            expand_playlist_task(str(self.playlist.id))
+
+        self.assertEqual(pages_seen, [0, 0, 1, 1, 2])
+        self.assertEqual(self.group.return_value.apply_async.call_count, 3)
+        self.playlist.refresh_from_db()
+        self.assertEqual(self.playlist.title, 'Ma playlist')
+        self.assertEqual(self.playlist.entry_count, 5)
+        self.assertIsNotNone(self.playlist.expanded_at)
+        self.assertEqual(self.playlist.status, 'processing')
+        self.assertEqual(self.playlist.children.count(), 5)
+
+    def test_parent_counts_finished_children(self):
+        VideoDownload.objects.filter(pk=self.playlist.pk).update(expanded_at=timezone.now(), entry_count=4)
+        children = [self.child('completed', 1), self.child('failed', 2), self.child('pending', 3),
+                    self.child('completed', 4)]
+
+        # Progression tirée des compteurs, sans agrégation sur les enfants
+        with mock.patch('downloader.playlists.count_children') as count_children:
+            children_finished([child.id for child in children])
+        count_children.assert_not_called()
+        self.playlist.refresh_from_db()
+        self.assertEqual((self.playlist.finished_count, self.playlist.completed_count), (3, 2))
+        self.assertEqual(self.playlist.progress_percentage, 75)
+
+        pending = children[2]
+        pending.status = 'completed'
+        pending.save()
+        children_finished([pending.id])
+        self.playlist.refresh_from_db()
+        self.assertEqual(self.playlist.status, 'completed')
+        self.assertEqual(self.playlist.progress_percentage, 100)
+
+    def test_stalled_playlist_counts_repaired(self):
+        VideoDownload.objects.filter(pk=self.playlist.pk).update(
+            expanded_at=timezone.now(), entry_count=2, updated_at=timezone.now() - timedelta(hours=1)
+        )
+        # Fins de vidéos jamais comptées (worker arrêté entre deux écritures)
+        self.child('completed', 1)
+        self.child('failed', 2)
+        self.assertEqual(repair_stalled_playlists(600, 10), 1)
+        self.playlist.refresh_from_db()
+        self.assertEqual((self.playlist.finished_count, self.playlist.completed_count), (2, 1))
+        self.assertEqual(self.playlist.status, 'completed')
+
+    @mock.patch('downloader.tasks.finish_cancelled_downloads.delay')
+    @mock.patch('downloader.cancellation.current_app')
+    def test_cancel_playlist_cancels_children(self, app, finish):
+        running = [self.child('processing', i) for i in range(1, 21)]
+        VideoDownload.objects.filter(parent=self.playlist).update(celery_task_id=F('source_url'))
+        done = self.child('completed', 99)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('cancel-download', args=[self.playlist.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Nombre de requêtes indépendant du nombre d'entrées, un seul revoke
+        self.assertLess(len(queries), 20)
+        app.control.revoke.assert_called_once()
+        self.assertEqual(len(app.control.revoke.call_args.args[0]), 20)
+        self.assertEqual(VideoDownload.objects.filter(parent=self.playlist, status='cancelled').count(), 20)
+        done.refresh_from_db()
+        self.assertEqual(done.status, 'completed')
+
+        # Agrégats et événements traités par la tâche de maintenance
+        ids = finish.call_args.args[0]
+        self.assertEqual(sorted(ids), sorted(str(child.id) for child in running))
+        self.assertFalse(DownloadRollup.objects.exists())
+        finish_cancelled_downloads(ids)
+        self.assertEqual(DownloadRollup.objects.get().count, 20)
+
+
+class PlatformDetectionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.youtube = Platform.objects.create(name='youtube', display_name='YouTube', is_active=True)
+        cls.twitter = Platform.objects.create(name='twitter', display_name='Twitter', is_active=True)
+
+    def test_host_suffix_matching(self):
+        self.assertEqual(detect_platform('https://m.youtube.com/watch?v=dQw4w9WgXcQ'), self.youtube)
+        self.assertEqual(detect_platform('https://t.co/abc'), self.twitter)
+        # Les motifs non ancrés reconnaissaient ces domaines
+        self.assertIsNone(detect_platform('https://great.com/video'))
+        self.assertIsNone(detect_platform('https://notyoutube.com/watch'))
+
+    def test_detection_without_queries(self):
+        detect_platform('https://youtu.be/dQw4w9WgXcQ')
+        with self.assertNumQueries(0):
+            self.assertEqual(detect_platform('https://youtu.be/dQw4w9WgXcQ'), self.youtube)
+
+    def test_cache_invalidated_on_save(self):
+        self.assertIn('twitter', active_platforms())
+        self.twitter.is_active = False
+        self.twitter.save()
+        self.assertNotIn('twitter', active_platforms())
+
+
+class StatsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.youtube = Platform.objects.create(name='youtube', display_name='YouTube', is_active=True)
+        cls.vimeo = Platform.objects.create(name='vimeo', display_name='Vimeo', is_active=True)
+        for status_, size in [('completed', 2 * 1024 ** 2), ('completed', 4 * 1024 ** 2), ('failed', None)]:
+            VideoDownload.objects.create(
+                source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+                platform=cls.youtube, status=status_, file_size=size, completed_at=timezone.now()
+            )
+        VideoDownload.objects.create(source_url='https://vimeo.com/12345', platform=cls.vimeo, status='pending')
+        rebuild_rollups()
+
+    def setUp(self):
+        cache.clear()
+        active_platforms()
+
+    def test_download_stats_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('download-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_downloads'], 4)
+        self.assertEqual(response.data['successful_downloads'], 2)
+        self.assertEqual(response.data['failed_downloads'], 1)
+        self.assertEqual(response.data['success_rate'], 50.0)
+        self.assertEqual(response.data['avg_file_size_mb'], 3.0)
+        self.assertEqual(response.data['most_popular_platform'], 'YouTube')
+        self.assertEqual(response.data['downloads_last_24h'], 4)
+
+        # Servies depuis le cache jusqu'à expiration
+        with self.assertNumQueries(0):
+            self.client.get(reverse('download-stats'))
+
+    def test_stale_stats_served_during_recompute(self):
+        self.client.get(reverse('download-stats'))
+        entry = cache.get(DOWNLOAD_STATS_KEY)
+        entry['fresh_until'] = time.time() - 1
+        entry['value']['total_downloads'] = 99
+        cache.set(DOWNLOAD_STATS_KEY, entry)
+        # Un autre client tient le verrou de recalcul
+        cache.add(recompute_lock_key(DOWNLOAD_STATS_KEY), 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('download-stats'))
+        self.assertEqual(response.data['total_downloads'], 99)
+
+    def test_cold_cache_waits_for_recompute(self):
+        # Un autre client tient le verrou et écrit la valeur pendant l'attente
+        cache.add(recompute_lock_key(DOWNLOAD_STATS_KEY), 1)
+        value = dict(compute_download_stats(), total_downloads=7)
+
+        def finish_recompute(seconds):
+            cache.set(DOWNLOAD_STATS_KEY, {'value': value, 'fresh_until': time.time() + 10})
+
+        with mock.patch('downloader.stats.time.sleep', side_effect=finish_recompute), self.assertNumQueries(0):
+            response = self.client.get(reverse('download-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_downloads'], 7)
+
+    @override_settings(DOWNLOADER_STATS_WAIT=0.1)
+    def test_cold_cache_pending_when_recompute_too_long(self):
+        cache.add(recompute_lock_key(DOWNLOAD_STATS_KEY), 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('download-stats'))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+
+        # Le détenteur a libéré le verrou sans écrire : ce client prend le relais
+        cache.delete(recompute_lock_key(DOWNLOAD_STATS_KEY))
+        response = self.client.get(reverse('download-stats'))
+        self.assertEqual(response.data['total_downloads'], 4)
+
+    def test_platform_stats_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('platform-stats'))
+        by_name = {row['platform_name']: row for row in response.data}
+        self.assertEqual(by_name['YouTube']['total_downloads'], 3)
+        self.assertEqual(by_name['Vimeo']['success_rate'], 0)
+
+
+class RollupTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(name='youtube', display_name='YouTube', is_active=True)
+
+    def setUp(self):
+        cache.clear()
+        self.finished_at = timezone.now().replace(minute=30, second=0, microsecond=0)
+
+    def finish(self, status_, size=None, duration=None):
+        download = VideoDownload.objects.create(
+            source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ', platform=self.platform,
+            status=status_, file_size=size, duration=duration,
+            started_at=self.finished_at - timedelta(seconds=20), completed_at=self.finished_at
+        )
+        record_finished([download.id])
+        return download
+
+    def rollup_values(self):
+        return list(DownloadRollup.objects.order_by('status').values_list(
+            'hour', 'status', 'count', 'total_bytes', 'total_duration', 'processing_seconds'
+        ))
+
+    def test_rollup_updated_incrementally(self):
+        self.finish('completed', size=100, duration=60)
+        self.finish('completed', size=50, duration=30)
+        self.finish('failed')
+        hour = self.finished_at.replace(minute=0)
+        self.assertEqual(self.rollup_values(), [
+            (hour, 'completed', 2, 150, 90, 40.0),
+            (hour, 'failed', 1, 0, 0, 20.0),
+        ])
+
+    @mock.patch('downloader.cancellation.current_app')
+    def test_cancelled_download_recorded(self, app):
+        download = VideoDownload.objects.create(
+            source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ', platform=self.platform, status='pending'
+        )
+        cancel(download)
+        self.assertEqual(DownloadRollup.objects.get().status, 'cancelled')
+
+    def test_rebuild_matches_incremental(self):
+        self.finish('completed', size=100, duration=60)
+        self.finish('failed')
+        incremental = self.rollup_values()
+        out = StringIO()
+        call_command('rebuild_rollups', stdout=out)
+        self.assertIn('2 agrégat(s)', out.getvalue())
+        self.assertEqual(self.rollup_values(), incremental)
+
+    def test_timeseries_reads_rollups(self):
+        self.finish('completed', size=100)
+        self.finish('failed')
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('stats-timeseries'), {'interval': 'day'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        [row] = response.data['results']
+        self.assertEqual((row['total_downloads'], row['successful_downloads'], row['failed_downloads']), (2, 1, 1))
+
+        response = self.client.get(reverse('stats-timeseries'), {'interval': 'hour', 'since': '2020-01-01T00:00:00'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FakeMetricsRedis:
+    """Hash Redis en mémoire (hincrbyfloat/hgetall), pipeline compris"""
+
+    def __init__(self):
+        self.values = {}
+
+    def hincrbyfloat(self, key, field, amount):
+        self.values[field] = float(self.values.get(field, 0)) + amount
+
+    def hgetall(self, key):
+        return {field: str(value) for field, value in self.values.items()}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(name='youtube', display_name='YouTube', is_active=True)
+        VideoDownload.objects.create(
+            source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ', platform=cls.platform, status='processing'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.redis = FakeMetricsRedis()
+        redis_patch = mock.patch('downloader.metrics.get_redis', return_value=self.redis)
+        redis_patch.start()
+        self.addCleanup(redis_patch.stop)
+
+    def test_histograms_and_counters_are_exposed(self):
+        for seconds in (0.2, 3, 45):
+            metrics.observe('downloader_extraction_duration_seconds', seconds, platform='youtube')
+        metrics.inc('downloader_retries_total', error='DownloadError')
+        metrics.inc('downloader_retries_total', error='DownloadError')
+
+        with mock.patch('downloader.metrics.queue_depths', return_value={'transfer': 4}):
+            lines = metrics.render().splitlines()
+        self.assertIn('# TYPE downloader_extraction_duration_seconds histogram', lines)
+        self.assertIn('downloader_extraction_duration_seconds_bucket{le="0.5",platform="youtube"} 1', lines)
+        self.assertIn('downloader_extraction_duration_seconds_bucket{le="5",platform="youtube"} 2', lines)
+        self.assertIn('downloader_extraction_duration_seconds_bucket{le="+Inf",platform="youtube"} 3', lines)
+        self.assertIn('downloader_extraction_duration_seconds_count{platform="youtube"} 3', lines)
+        self.assertIn('downloader_retries_total{error="DownloadError"} 2', lines)
+        self.assertIn('downloader_queue_depth{queue="transfer"} 4', lines)
+        self.assertIn('downloader_jobs{status="processing"} 1', lines)
+        # Seuils dans l'ordre croissant
+        buckets = [line for line in lines if line.startswith('downloader_extraction_duration_seconds_bucket')]
+        self.assertTrue(buckets[-1].startswith('downloader_extraction_duration_seconds_bucket{le="+Inf"'))
+
+    def test_endpoint_survives_unavailable_redis(self):
+        with mock.patch('downloader.metrics.get_redis', side_effect=ConnectionError('down')), \
+                mock.patch('downloader.metrics.get_broker_redis', side_effect=ConnectionError('down')):
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('downloader_storage_bytes 0', response.content.decode())
+
+
+class FakeHeartbeatRedis:
+    """Clés et ensemble trié Redis en mémoire (set/zadd/zrange...), pipeline compris"""
+
+    def __init__(self):
+        self.values = {}
+        self.scores = {}
+        self.results = []
+
+    def pipeline(self, transaction=True):
+        self.results = []
+        return self
+
+    def execute(self):
+        return self.results
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+        self.results.append(True)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+        self.results.append(1)
+
+    def zadd(self, key, mapping):
+        self.scores.update(mapping)
+        self.results.append(len(mapping))
+
+    def zrem(self, key, member):
+        self.scores.pop(member, None)
+        self.results.append(1)
+
+    def zremrangebyscore(self, key, low, high):
+        limit = float(high.lstrip('('))
+        stale = [member for member, score in self.scores.items() if score < limit]
+        for member in stale:
+            del self.scores[member]
+        self.results.append(len(stale))
+
+    def zrange(self, key, start, end):
+        self.results.append(sorted(self.scores, key=self.scores.get))
+
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+
+class HealthCheckTests(APITestCase):
+    def setUp(self):
+        views._health_cache = None
+        self.addCleanup(setattr, views, '_health_cache', None)
+        self.redis = FakeHeartbeatRedis()
+        redis_patch = mock.patch('downloader.heartbeats.get_redis', return_value=self.redis)
+        redis_patch.start()
+        self.addCleanup(redis_patch.stop)
+
+    def test_heartbeats_expire_and_unregister(self):
+        heartbeats.send_heartbeat('celery@a', ['transfer'], 4, 1)
+        heartbeats.send_heartbeat('celery@b', ['metadata'], 2, 0)
+        self.assertEqual([worker['worker'] for worker in heartbeats.live_workers()], ['celery@a', 'celery@b'])
+
+        self.redis.scores['celery@b'] -= heartbeats.heartbeat_ttl() + 1
+        heartbeats.remove_heartbeat('celery@a')
+        self.assertEqual(heartbeats.live_workers(), [])
+        self.assertEqual(self.redis.scores, {})
+
+    @mock.patch('celery.app.control.Control.inspect')
+    def test_health_reads_heartbeats_without_contacting_workers(self, inspect):
+        heartbeats.send_heartbeat('celery@a', ['transfer'], 4, 1)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('health-check'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'healthy')
+        self.assertEqual(response.data['celery'], 'connected')
+        self.assertEqual(response.data['free_slots'], 3)
+        self.assertEqual(response.data['workers'][0]['queues'], ['transfer'])
+        inspect.assert_not_called()
+
+        # Réponse suivante servie depuis le cache du processus
+        heartbeats.remove_heartbeat('celery@a')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('health-check'))
+        self.assertEqual(response.data['celery'], 'connected')
+
+    def test_unavailable_database_and_redis(self):
+        with mock.patch('downloader.heartbeats.get_redis', side_effect=ConnectionError('down')), \
+                mock.patch('downloader.views.connection.cursor', side_effect=Exception('down')):
+            response = self.client.get(reverse('health-check'))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.data['status'], 'unhealthy')
+        self.assertEqual(response.data['celery'], 'unknown')
+        self.assertEqual(response.data['workers'], [])
+
+
+class KeysetPaginationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        platform = Platform.objects.create(name='youtube', display_name='YouTube', is_active=True)
+        base = timezone.now()
+        # Dates et tailles en double, tailles manquantes
+        for i, size in enumerate([300, None, 100, 300, None, 200, 100]):
+            download = VideoDownload.objects.create(
+                source_url=f'https://www.youtube.com/watch?v=video{i}', platform=platform, file_size=size
+            )
+            VideoDownload.objects.filter(pk=download.pk).update(created_at=base - timedelta(minutes=i // 2))
+
+    def walk(self, params):
+        """Parcourt toutes les pages en suivant les liens next"""
+        ids = []
+        response = self.client.get(reverse('download-list'), dict(params, pagination='cursor', page_size=2))
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_pages_follow_ordering_without_count(self):
+        downloads = list(VideoDownload.objects.all())
+        newest = sorted(downloads, key=lambda d: (d.created_at, d.pk), reverse=True)
+        self.assertEqual(self.walk({}), [str(d.pk) for d in newest])
+
+        # Tailles manquantes en fin de liste dans les deux sens
+        sized = [d for d in downloads if d.file_size is not None]
+        unsized = [d for d in downloads if d.file_size is None]
+        for ordering, reverse_order in [('file_size', False), ('-file_size', True)]:
+            expected = sorted(sized, key=lambda d: (d.file_size, d.pk), reverse=reverse_order)
+            expected += sorted(unsized, key=lambda d: d.pk, reverse=reverse_order)
+            self.assertEqual(self.walk({'ordering': ordering}), [str(d.pk) for d in expected])
+
+    def test_deep_page_is_single_query(self):
+        first = self.client.get(reverse('download-list'), {'pagination': 'cursor', 'page_size': 3})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(first.data['next'])
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT(', queries[0]['sql'].upper())
+        self.assertNotIn('OFFSET', queries[0]['sql'].upper())
+
+    def test_cursor_pages_seek_the_index(self):
+        """Chaque requête d'une page profonde démarre dans l'index (champ, id), sans parcours complet"""
+        for ordering in ['-created_at', 'file_size', '-completed_at']:
+            first = self.client.get(reverse('download-list'), {
+                'pagination': 'cursor', 'page_size': 1, 'ordering': ordering
+            })
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(first.data['next'])
+            for query in queries:
+                sql = query['sql']
+                self.assertNotIn('NULLS LAST', sql.upper())
+                self.assertNotIn('IS NULL OR', sql.upper())
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                    plan = ' '.join(row[-1] for row in cursor.fetchall())
+                self.assertIn('SEARCH downloader_videodownload USING INDEX', plan, (ordering, plan))
+                self.assertNotIn('SCAN downloader_videodownload', plan, (ordering, plan))
+
+    def test_page_number_mode_unchanged_and_invalid_cursor(self):
+        response = self.client.get(reverse('download-list'))
+        self.assertEqual(response.data['count'], 7)
+        response = self.client.get(reverse('download-list'), {'cursor': 'invalide'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FullTextSearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(name='youtube', display_name='YouTube', is_active=True)
+        cls.concert = cls.create('Concert de jazz en été', 'https://www.youtube.com/watch?v=jazz001')
+        cls.tutorial = cls.create('Tutoriel Django', 'https://www.youtube.com/watch?v=django01')
+        cls.jazz_tutorial = cls.create('Jazz : tutoriel de jazz manouche, le jazz pour débutants',
+                                       'https://www.youtube.com/watch?v=jazz002')
+
+    @classmethod
+    def create(cls, title, url):
+        return VideoDownload.objects.create(source_url=url, title=title, platform=cls.platform)
+
+    def search(self, term, **params):
+        response = self.client.get(reverse('download-list'), dict(params, search=term))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['id'] for row in response.data['results']]
+
+    def test_ranked_prefix_search_uses_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            ids = self.search('jaz')
+        self.assertEqual(ids, [str(self.jazz_tutorial.id), str(self.concert.id)])
+        self.assertTrue(all('LIKE' not in query['sql'] for query in queries))
+        self.assertIn('MATCH', queries[-1]['sql'])
+
+        self.assertEqual(self.search('tutoriel jazz'), [str(self.jazz_tutorial.id)])
+        self.assertEqual(self.search('ete'), [str(self.concert.id)])
+        self.assertEqual(self.search('django01'), [str(self.tutorial.id)])
+        # Un tri explicite remplace le classement par pertinence
+        self.assertEqual(self.search('jazz', ordering='created_at'),
+                         [str(self.concert.id), str(self.jazz_tutorial.id)])
+
+    def test_index_follows_saves_updates_and_deletes(self):
+        self.tutorial.title = 'Tutoriel Flask'
+        self.tutorial.save()
+        self.assertEqual(self.search('django'), [str(self.tutorial.id)])  # encore dans l'URL
+        self.assertEqual(self.search('flask'), [str(self.tutorial.id)])
+
+        VideoDownload.objects.filter(pk=self.concert.pk).update(title='Récital de piano')
+        self.assertEqual(self.search('piano'), [str(self.concert.id)])
+        self.assertEqual(self.search('concert'), [])
+
+        VideoDownload.objects.filter(pk=self.jazz_tutorial.pk).delete()
+        self.assertEqual(self.search('manouche'), [])
+
+    def test_index_restored_after_table_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER downloader_videodownload_fts_insert')
+        search.ensure_index(using='default')
+        self.create('Documentaire animalier', 'https://www.youtube.com/watch?v=doc0001')
+        self.assertEqual(len(self.search('documentaire')), 1)
+        self.assertEqual(len(self.search('jazz')), 2)
+
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('4 téléchargement(s)', out.getvalue())
+
+
+class ConditionalGetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(name='youtube', display_name='YouTube', is_active=True)
+
+    def setUp(self):
+        cache.clear()
+        self.download = VideoDownload.objects.create(
+            source_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ', platform=self.platform, status='processing'
+        )
+
+    def test_unchanged_download_returns_304(self):
+        for name in ('download-detail', 'download-status'):
+            url = reverse(name, args=[self.download.id])
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag = response['ETag']
+
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+            self.assertFalse(response.content)
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=f'W/{etag}')
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_progress_update_changes_etag(self):
+        url = reverse('download-status', args=[self.download.id])
+        etag = self.client.get(url)['ETag']
+        VideoDownload.objects.filter(pk=self.download.pk).update(progress_percentage=50, updated_at=timezone.now())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['progress_percentage'], 50)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_finished_download_revalidated_from_cache(self):
+        self.download.status = 'completed'
+        self.download.save()
+        url = reverse('download-detail', args=[self.download.id])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Un enregistrement invalide le jeton en cache
+        with self.captureOnCommitCallbacks(execute=True):
+            self.download.title = 'Nouveau titre'
+            self.download.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['title'], 'Nouveau titre')
+
+
+class AvailableFormatsTests(TestCase):
+    INFO = {'formats': [
+        {'format_id': '18', 'ext': 'mp4', 'height': 360, 'vcodec': 'avc1', 'acodec': 'mp4a'},
+        {'format_id': '137', 'ext': 'mp4', 'height': 1080, 'vcodec': 'avc1', 'acodec': 'none'},
+        {'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a', 'tbr': 128},
+    ]}
+
+    def post(self, url):
+        return self.client.post(reverse('available-formats'), {'url': url}, content_type='application/json')
+
+    @mock.patch('downloader.discovery.get_video_info')
+    def test_formats_listed(self, get_info):
+        get_info.return_value = self.INFO
+        response = self.post('https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        formats = response.json()['formats']
+        self.assertEqual([f['yt_dlp_format'] for f in formats], ['137+140', '18', '140'])
+        self.assertEqual(self.client.post(reverse('available-formats'), {}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(DOWNLOADER_FORMATS_TIMEOUT=0.2)
+    def test_slow_extraction_times_out(self):
+        released = threading.Event()
+        with mock.patch('downloader.discovery.get_video_info', side_effect=lambda *a: released.wait(5) or self.INFO):
+            started = time.monotonic()
+            response = self.post('https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+            released.set()
+        self.assertEqual(response.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        self.assertLess(time.monotonic() - started, 2)
+
+    @override_settings(DOWNLOADER_FORMATS_PER_HOST=1)
+    def test_per_host_limit_and_abandoned_requests(self):
+        running, peak = {}, {}
+        lock = threading.Lock()
+
+        def slow_info(url, options=None):
+            host = discovery.url_host(url)
+            with lock:
+                running[host] = running.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), running[host])
+            time.sleep(0.05)
+            with lock:
+                running[host] -= 1
+            return self.INFO
+
+        async def scenario():
+            urls = [f'https://www.youtube.com/watch?v={i}' for i in range(3)] + ['https://vimeo.com/1']
+            await asyncio.gather(*(discovery.discover_formats(url) for url in urls))
+
+        with mock.patch('downloader.discovery.get_video_info', side_effect=slow_info) as get_info:
+            asyncio.run(scenario())
+            self.assertEqual(get_info.call_count, 4)
+            self.assertEqual(peak, {'youtube.com': 1, 'vimeo.com': 1})
+
+            # Extraction abandonnée avant son lancement : jamais exécutée
+            cancelled = threading.Event()
+            cancelled.set()
+            self.assertIsNone(discovery.extract('https://vimeo.com/2', cancelled))
+            self.assertEqual(get_info.call_count, 4)
+
+    @override_settings(DOWNLOADER_FORMATS_TIMEOUT=0.1, DOWNLOADER_FORMATS_PER_HOST=1, DOWNLOADER_FORMATS_WORKERS=2)
+    def test_abandoned_extraction_keeps_its_slots(self):
+        released = threading.Event()
+        calls = []
+
+        def blocked_info(url, options=None):
+            calls.append(url)
+            released.wait(5)
+            return self.INFO
+
+        async def scenario():
+            with self.assertRaises(discovery.FormatsTimeout):
+                await discovery.discover_formats('https://www.youtube.com/watch?v=1')
+            # L'hôte reste occupé tant que l'extraction abandonnée tourne
+            with self.assertRaises(discovery.FormatsTimeout):
+                await discovery.discover_formats('https://www.youtube.com/watch?v=2')
+            self.assertEqual(calls, ['https://www.youtube.com/watch?v=1'])
+
+            # Pool plein : refus immédiat plutôt qu'une attente derrière des extractions abandonnées
+            with self.assertRaises(discovery.FormatsTimeout):
+                await discovery.discover_formats('https://vimeo.com/1')
+            started = time.monotonic()
+            with self.assertRaises(discovery.FormatsBusy):
+                await discovery.discover_formats('https://dailymotion.com/video/1')
+            self.assertLess(time.monotonic() - started, 0.05)
+
+            released.set()
+            await asyncio.sleep(0.1)
+            return await discovery.discover_formats('https://www.youtube.com/watch?v=3')
+
+        with mock.patch('downloader.discovery.get_video_info', side_effect=blocked_info):
+            self.assertEqual(asyncio.run(scenario()), self.INFO)
+        self.assertEqual(discovery._running, 0)
+
+    def test_csrf_and_drf_policy_apply(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.post(reverse('available-formats'), {'url': 'https://vimeo.com/1'},
+                               content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.post(reverse('available-formats'), '{', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with mock.patch.object(views.FormatsPolicyView, 'throttle_classes', [ScopedRateThrottle]), \
+                mock.patch.object(ScopedRateThrottle, 'THROTTLE_RATES', {'formats': '1/min'}), \
+                mock.patch('downloader.discovery.get_video_info', return_value=self.INFO):
+            self.assertEqual(self.post('https://vimeo.com/2').status_code, status.HTTP_200_OK)
+            response = self.post('https://vimeo.com/3')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+    @override_settings(DOWNLOADER_FORMATS_WORKERS=0)
+    def test_full_pool_returns_503(self):
+        response = self.post('https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '5')
+
+
+class AdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.platform = Platform.objects.create(name='youtube', display_name='YouTube', is_active=True)
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    @mock.patch('downloader.bulk.group')
+    def test_download_from_url_uses_api_enqueue_path(self, group):
+        response = self.client.post(reverse('admin:download-from-url'), {
+            'url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ', 'quality': '720', 'download': '1'
+        })
+        download = VideoDownload.objects.get()
+        self.assertRedirects(response, f'/admin/downloader/videodownload/{download.id}/change/',
+                             fetch_redirect_response=False)
+        # ID de tâche enregistré (annulation possible) et file choisie par le routage
+        signature = list(group.call_args.args[0])[0]
+        self.assertEqual(download.celery_task_id, signature.options['task_id'])
+        self.assertEqual(signature.options['queue'], queue_for('720', False))
+        self.assertEqual(cache.get(inflight_key(download.video_key, download.format_key)), str(download.id))
+
+    def test_admin_actions_update_rollups(self):
+        pending, failed = [
+            VideoDownload.objects.create(
+                source_url=f'https://www.youtube.com/watch?v={video}', platform=self.platform, status=state
+            )
+            for video, state in [('pending1', 'pending'), ('failed1', 'failed')]
+        ]
+        self.client.post(reverse('admin:downloader_videodownload_changelist'), {
+            'action': 'mark_as_completed', '_selected_action': [pending.pk, failed.pk]
+        })
+        pending.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual(pending.status, 'completed')
+        self.assertIsNotNone(pending.completed_at)
+        # Un téléchargement déjà terminé garde son statut (déjà compté)
+        self.assertEqual(failed.status, 'failed')
+        rollup = DownloadRollup.objects.get()
+        self.assertEqual((rollup.status, rollup.count), ('completed', 1))
@@ -0,0 +1,49 @@
+import logging
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Seau à jetons atomique, horloge du serveur Redis (commune à tous les workers).
+# Retourne le délai d'attente en secondes (0 si un jeton a été pris).
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+def bucket_key(platform_name):
+    """Clé Redis du seau à jetons d'une plateforme"""
+    return f'downloader:platform:{platform_name}:tokens'
+
+
+def take_token(platform):
+    """Prend un jeton dans le seau de la plateforme
+
+    Retourne 0 si la requête peut partir, sinon le nombre de secondes à
+    attendre avant qu'un jeton soit disponible. Sans limite configurée,
+    ou si Redis est indisponible, la requête est autorisée.
+    """
+    if platform is None or not platform.rate_limit_per_minute:
+        return 0
+    rate = platform.rate_limit_per_minute / 60
+    capacity = max(platform.rate_limit_burst or 1, 1)
+    try:
+        return float(get_redis().eval(TOKEN_BUCKET_SCRIPT, 1, bucket_key(platform.name), rate, capacity))
+    except Exception as e:
+        logger.warning(f"Erreur du limiteur de débit pour {platform.name}: {e}")
+        return 0
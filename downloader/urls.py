@@ -8,9 +8,15 @@ urlpatterns = [
     path('downloads/create/', views.VideoDownloadCreateView.as_view(), name='download-create'),
     path('downloads/<uuid:id>/', views.VideoDownloadDetailView.as_view(), name='download-detail'),
     path('downloads/<uuid:id>/status/', views.VideoDownloadStatusView.as_view(), name='download-status'),
+    path('downloads/<uuid:id>/file/', views.download_file, name='download-file'),
+    path('downloads/<uuid:id>/stream/', views.download_stream, name='download-stream'),
+    path('downloads/<uuid:id>/events/', views.download_events, name='download-events'),
     path('downloads/<uuid:id>/delete/', views.VideoDownloadDeleteView.as_view(), name='download-delete'),
     path('validate-url/', views.validate_url, name='validate-url'),
     path('bulk-download/', views.bulk_download, name='bulk-download'),
     path('downloads/<uuid:download_id>/cancel/', views.cancel_download, name='cancel-download'),
+    path('stats/', views.download_stats, name='download-stats'),
+    path('stats/platforms/', views.platform_stats, name='platform-stats'),
+    path('stats/timeseries/', views.stats_timeseries, name='stats-timeseries'),
     path('health/', views.health_check, name='health-check'),
 ] 
\ No newline at end of file
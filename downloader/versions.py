@@ -0,0 +1,56 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from .events import TERMINAL_STATUSES
+from .models import VideoDownload
+
+logger = logging.getLogger(__name__)
+
+
+def version_key(download_id):
+    """Clé du cache contenant le jeton de version d'un téléchargement terminé"""
+    return f'downloader:downloads:{download_id}:version'
+
+
+def make_version(updated_at):
+    """Jeton de version (ETag) dérivé de la date de dernière modification"""
+    return format(int(updated_at.timestamp() * 1_000_000), 'x')
+
+
+def remember_version(download):
+    """Met en cache le jeton d'un téléchargement terminé (il ne change presque plus)"""
+    if download.status not in TERMINAL_STATUSES:
+        return
+    try:
+        cache.set(version_key(download.pk), make_version(download.updated_at),
+                  timeout=getattr(settings, 'DOWNLOADER_VERSION_CACHE_TTL', 60))
+    except Exception as e:
+        logger.warning(f"Erreur lors de l'enregistrement de la version {download.pk}: {e}")
+
+
+def download_version(download_id):
+    """Jeton de version courant d'un téléchargement, ou None s'il n'existe pas
+
+    Lu dans le cache pour un téléchargement terminé, sinon par une
+    requête sur la seule colonne ``updated_at``.
+    """
+    try:
+        version = cache.get(version_key(download_id))
+    except Exception as e:
+        logger.warning(f"Erreur lors de la lecture de la version {download_id}: {e}")
+        version = None
+    if version:
+        return version
+    download = VideoDownload.objects.filter(pk=download_id).only('updated_at', 'status').first()
+    if download is None:
+        return None
+    remember_version(download)
+    return make_version(download.updated_at)
+
+
+def invalidate_versions(download_ids):
+    """Oublie les jetons en cache de téléchargements modifiés ou supprimés"""
+    try:
+        cache.delete_many([version_key(download_id) for download_id in download_ids])
+    except Exception as e:
+        logger.warning(f"Erreur lors de l'invalidation des versions: {e}")
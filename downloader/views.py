@@ -1,13 +1,21 @@
-from rest_framework import generics, status, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework import exceptions, generics, status, permissions
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.settings import api_settings
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Count, Sum, Avg
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.core.cache import cache
+from asgiref.sync import sync_to_async
+from django.urls import reverse
+import mimetypes
+from django.views.decorators.http import require_http_methods
+from django.db import connection
 from django.utils import timezone
-from datetime import timedelta
+from django.utils.http import parse_etags, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from .models import (
@@ -17,14 +25,42 @@ from .serializers import (
     PlatformSerializer, VideoDownloadCreateSerializer,
     VideoDownloadSerializer, VideoDownloadListSerializer,
     VideoDownloadStatusSerializer, URLValidationSerializer, BulkDownloadSerializer,
-    SupportedFormatSerializer
+    SupportedFormatSerializer, DownloadStatsAggregatedSerializer
 )
-from .tasks import download_video_task, download_bulk_videos_task
+from .tasks import download_video_task, expand_playlist_task
+from .events import download_payload, get_snapshot, publish_download, stream_events
+from .storage import release_file, touch_file
+from .bulk import create_bulk_downloads
+from .pagination import KeysetPagination
+from .renderers import NDJSONRenderer
+from .rollups import record_finished
+from .discovery import FormatsBusy, FormatsTimeout, discover_formats, list_formats
+from .search import FullTextSearchFilter
+from .versions import download_version, invalidate_versions, make_version, remember_version
+from .redis_client import get_async_redis
+from .serving import file_response, is_streamable, partial_file_key, tail_download
+from . import cancellation, heartbeats, inflight, metrics, stats
+from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta
+import json
 import logging
-import yt_dlp
+import math
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
+# Pas de temps des séries statistiques et période par défaut
+TIMESERIES_STEPS = {
+    'hour': (timedelta(hours=1), timedelta(days=1)),
+    'day': (timedelta(days=1), timedelta(days=30)),
+}
+
+# Dernière réponse de health/ : (expiration monotone, (données, statut HTTP))
+_health_cache = None
+
 
 class StandardResultsSetPagination(PageNumberPagination):
     """Pagination standard pour les listes"""
@@ -33,6 +69,28 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
+class DownloadListPagination(StandardResultsSetPagination):
+    """Pagination par numéro de page, ou par curseur sur demande (?pagination=cursor)
+
+    Le mode curseur ne compte pas les lignes et n'utilise pas OFFSET :
+    les pages profondes restent aussi rapides que la première.
+    """
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if request.query_params.get('pagination') == 'cursor' or request.query_params.get('cursor'):
+            self.keyset = self.keyset_class()
+            self.keyset.ordering_fields = view.ordering_fields
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
 class PlatformListView(generics.ListAPIView):
     """Liste des plateformes supportées"""
     queryset = Platform.objects.filter(is_active=True)
@@ -102,15 +160,40 @@ class VideoDownloadCreateView(generics.CreateAPIView):
         # Créer l'objet VideoDownload
         instance = serializer.save()
         
-        # Lancer la tâche Celery
-        try:
-            task = download_video_task.delay(str(instance.id))
-            logger.info(f"Tâche de téléchargement lancée: {task.id} pour la vidéo {instance.id}")
-        except Exception as e:
-            logger.error(f"Erreur lors du lancement de la tâche: {e}")
-            instance.status = 'failed'
-            instance.error_message = "Erreur lors du lancement du téléchargement"
-            instance.save()
+        if instance.is_playlist:
+            # Playlist ou chaîne : les entrées sont développées et lancées au fil des pages
+            try:
+                task = expand_playlist_task.delay(str(instance.id))
+                VideoDownload.objects.filter(pk=instance.pk).update(celery_task_id=task.id)
+                instance.celery_task_id = task.id
+                logger.info(f"Développement de la playlist lancé: {task.id} pour {instance.id}")
+            except Exception as e:
+                logger.error(f"Erreur lors du lancement du développement de la playlist: {e}")
+                instance.status = 'failed'
+                instance.error_message = "Erreur lors du lancement du téléchargement"
+                instance.save()
+        elif instance.status == 'completed':
+            # Fichier réutilisé d'un téléchargement identique : rien à lancer
+            logger.info(f"Fichier existant réutilisé pour la vidéo {instance.id}")
+            record_finished([instance.id])
+        elif instance.coalesced_with_id:
+            # Un téléchargement identique est déjà en cours : on suit sa progression
+            logger.info(f"Vidéo {instance.id} rattachée au téléchargement en cours {instance.coalesced_with_id}")
+        else:
+            # Lancer la tâche Celery
+            try:
+                task = download_video_task.delay(str(instance.id))
+                VideoDownload.objects.filter(pk=instance.pk).update(celery_task_id=task.id)
+                instance.celery_task_id = task.id
+                logger.info(f"Tâche de téléchargement lancée: {task.id} pour la vidéo {instance.id}")
+            except Exception as e:
+                logger.error(f"Erreur lors du lancement de la tâche: {e}")
+                instance.status = 'failed'
+                instance.error_message = "Erreur lors du lancement du téléchargement"
+                instance.completed_at = timezone.now()
+                instance.save()
+                record_finished([instance.id])
+                inflight.release(instance.video_key, instance.format_key, instance.id)
         
         # Retourner la réponse avec les détails complets
         response_serializer = VideoDownloadSerializer(instance)
@@ -122,9 +205,9 @@ class VideoDownloadListView(generics.ListAPIView):
     queryset = VideoDownload.objects.select_related('platform').order_by('-created_at')
     serializer_class = VideoDownloadListSerializer
     permission_classes = [permissions.AllowAny]
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ['status', 'platform', 'download_audio_only']
+    pagination_class = DownloadListPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter, FullTextSearchFilter]
+    filterset_fields = ['status', 'platform', 'download_audio_only', 'parent', 'is_playlist']
     search_fields = ['title', 'source_url']
     ordering_fields = ['created_at', 'completed_at', 'file_size']
     ordering = ['-created_at']
@@ -135,10 +218,14 @@ class VideoDownloadListView(generics.ListAPIView):
             openapi.Parameter('status', openapi.IN_QUERY, description="Filtrer par statut", type=openapi.TYPE_STRING, enum=['pending', 'processing', 'completed', 'failed', 'cancelled']),
             openapi.Parameter('platform', openapi.IN_QUERY, description="ID de la plateforme", type=openapi.TYPE_INTEGER),
             openapi.Parameter('download_audio_only', openapi.IN_QUERY, description="Filtrer par type de téléchargement", type=openapi.TYPE_BOOLEAN),
-            openapi.Parameter('search', openapi.IN_QUERY, description="Rechercher dans le titre ou l'URL", type=openapi.TYPE_STRING),
+            openapi.Parameter('parent', openapi.IN_QUERY, description="ID de la playlist : ses vidéos", type=openapi.TYPE_STRING),
+            openapi.Parameter('is_playlist', openapi.IN_QUERY, description="Filtrer les playlists et chaînes", type=openapi.TYPE_BOOLEAN),
+            openapi.Parameter('search', openapi.IN_QUERY, description="Rechercher dans le titre ou l'URL (index plein texte, résultats classés par pertinence sans ordering)", type=openapi.TYPE_STRING),
             openapi.Parameter('ordering', openapi.IN_QUERY, description="Trier par champ", type=openapi.TYPE_STRING, enum=['created_at', '-created_at', 'completed_at', '-completed_at', 'file_size', '-file_size']),
             openapi.Parameter('page', openapi.IN_QUERY, description="Numéro de page", type=openapi.TYPE_INTEGER),
             openapi.Parameter('page_size', openapi.IN_QUERY, description="Taille de page (max 100)", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('pagination', openapi.IN_QUERY, description="Pagination par curseur (sans total, pages profondes rapides)", type=openapi.TYPE_STRING, enum=['cursor']),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Curseur de la page suivante (lien next)", type=openapi.TYPE_STRING),
         ],
         responses={200: "Liste des téléchargements"}
     )
@@ -146,7 +233,33 @@ class VideoDownloadListView(generics.ListAPIView):
         return super().get(request, *args, **kwargs)
 
 
-class VideoDownloadDetailView(generics.RetrieveAPIView):
+class ConditionalRetrieveMixin:
+    """Réponse 304 sans sérialisation quand l'ETag envoyé (If-None-Match) est toujours valide
+
+    L'ETag dérive de ``updated_at`` ; celui d'un téléchargement terminé
+    est lu dans le cache, sans requête en base.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            version = download_version(kwargs[self.lookup_field])
+            etags = {etag.removeprefix('W/') for etag in parse_etags(if_none_match)}
+            if version and (quote_etag(version) in etags or '*' in etags):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+                response['ETag'] = quote_etag(version)
+                response['Cache-Control'] = 'no-cache'
+                return response
+
+        instance = self.get_object()
+        remember_version(instance)
+        response = Response(self.get_serializer(instance).data)
+        response['ETag'] = quote_etag(make_version(instance.updated_at))
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+class VideoDownloadDetailView(ConditionalRetrieveMixin, generics.RetrieveAPIView):
     """Détails d'un téléchargement spécifique"""
     queryset = VideoDownload.objects.select_related('platform')
     serializer_class = VideoDownloadSerializer
@@ -154,9 +267,10 @@ class VideoDownloadDetailView(generics.RetrieveAPIView):
     lookup_field = 'id'
     
     @swagger_auto_schema(
-        operation_description="Récupère les détails complets d'un téléchargement",
+        operation_description="Récupère les détails complets d'un téléchargement (ETag, If-None-Match)",
         responses={
             200: "Détails du téléchargement",
+            304: "Téléchargement inchangé depuis l'ETag envoyé",
             404: "Téléchargement non trouvé"
         }
     )
@@ -164,7 +278,7 @@ class VideoDownloadDetailView(generics.RetrieveAPIView):
         return super().get(request, *args, **kwargs)
 
 
-class VideoDownloadStatusView(generics.RetrieveAPIView):
+class VideoDownloadStatusView(ConditionalRetrieveMixin, generics.RetrieveAPIView):
     """Statut d'un téléchargement (pour polling)"""
     queryset = VideoDownload.objects.all()
     serializer_class = VideoDownloadStatusSerializer
@@ -172,9 +286,10 @@ class VideoDownloadStatusView(generics.RetrieveAPIView):
     lookup_field = 'id'
     
     @swagger_auto_schema(
-        operation_description="Récupère le statut actuel d'un téléchargement (idéal pour le polling)",
+        operation_description="Récupère le statut actuel d'un téléchargement (idéal pour le polling, ETag, If-None-Match)",
         responses={
             200: "Statut du téléchargement",
+            304: "Statut inchangé depuis l'ETag envoyé",
             404: "Téléchargement non trouvé"
         }
     )
@@ -182,6 +297,79 @@ class VideoDownloadStatusView(generics.RetrieveAPIView):
         return super().get(request, *args, **kwargs)
 
 
+async def download_events(request, id):
+    """Flux Server-Sent Events de la progression d'un téléchargement
+
+    Remplace le polling de ``downloads/<id>/status/`` : les événements
+    publiés par le worker sur Redis sont relayés au client. Nécessite
+    un serveur ASGI (voir ``VIDEO_DOWNLOADER/asgi.py``).
+    """
+    initial = None
+    # Client Redis du flux, réutilisé pour la lecture de l'état courant
+    client = get_async_redis()
+    try:
+        if await get_snapshot(id, client=client) is None:
+            # Aucun état publié : une seule lecture en base pour l'état initial
+            download = await VideoDownload.objects.filter(id=id).afirst()
+            if download is None:
+                raise Http404("Téléchargement non trouvé")
+            initial = json.dumps(download_payload(download), cls=DjangoJSONEncoder)
+    except BaseException:
+        await client.aclose()
+        raise
+    
+    response = StreamingHttpResponse(
+        stream_events(id, initial=initial, client=client), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_http_methods(['GET', 'HEAD'])
+def download_file(request, id):
+    """Sert le fichier d'un téléchargement terminé
+
+    Gère les requêtes Range (lecture avec seek, reprise) et délègue le
+    transfert au proxy lorsque DOWNLOADER_SENDFILE_BACKEND est configuré.
+    """
+    download = get_object_or_404(VideoDownload, id=id, status='completed')
+    if not download.file_path or not os.path.exists(download.file_path.path):
+        raise Http404("Fichier non disponible")
+
+    touch_file(download.stored_file_id)
+    return file_response(request, download.file_path.name, download.get_filename())
+
+
+async def download_stream(request, id):
+    """Diffuse le fichier pendant son téléchargement par le worker
+
+    Réservé aux formats à fichier unique (``merge`` à False dans
+    ``formats/``) ; un téléchargement terminé est redirigé vers
+    ``downloads/<id>/file/``. Nécessite un serveur ASGI.
+    """
+    download = await VideoDownload.objects.filter(id=id).afirst()
+    if download is None:
+        raise Http404("Téléchargement non trouvé")
+    if download.status == 'completed':
+        return HttpResponseRedirect(reverse('download-file', args=[id]))
+    if download.status in ['failed', 'cancelled']:
+        return JsonResponse({'error': "Le téléchargement a échoué ou a été annulé", 'status': download.status}, status=409)
+    if not is_streamable(download):
+        return JsonResponse(
+            {'error': "Ce format est fusionné ou converti : attendez la fin du téléchargement"}, status=409
+        )
+
+    # Un téléchargement rattaché lit le fichier du téléchargement leader
+    source_id = download.coalesced_with_id or download.id
+    paths = await cache.aget(partial_file_key(source_id)) or {}
+    content_type = mimetypes.guess_type(paths.get('filename') or '')[0] or 'application/octet-stream'
+    response = StreamingHttpResponse(tail_download(source_id), content_type=content_type)
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 class VideoDownloadDeleteView(generics.DestroyAPIView):
     """Supprimer un téléchargement"""
     queryset = VideoDownload.objects.all()
@@ -201,15 +389,16 @@ class VideoDownloadDeleteView(generics.DestroyAPIView):
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         
-        # Supprimer le fichier physique si il existe
+        # Supprimer le fichier physique s'il n'est plus référencé
         if instance.file_path:
             try:
-                instance.file_path.delete()
+                release_file(instance)
             except Exception as e:
                 logger.warning(f"Erreur lors de la suppression du fichier: {e}")
         
         # Supprimer l'objet de la base de données
         self.perform_destroy(instance)
+        invalidate_versions([instance.pk])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -257,12 +446,12 @@ def validate_url(request):
     request_body=BulkDownloadSerializer,
     responses={
         201: openapi.Response(
-            description="Téléchargements créés",
+            description="Téléchargements créés (un résultat par URL ; une ligne par URL avec Accept: application/x-ndjson)",
             schema=openapi.Schema(
                 type=openapi.TYPE_OBJECT,
                 properties={
                     'message': openapi.Schema(type=openapi.TYPE_STRING),
-                    'downloads': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT))
+                    'results': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT))
                 }
             )
         ),
@@ -285,119 +474,82 @@ def validate_url(request):
 )
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@renderer_classes(api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer])
 def bulk_download(request):
-    """Téléchargement en lot"""
+    """Téléchargement en lot
+
+    Les URLs sont validées en mémoire puis insérées et lancées par lots.
+    Avec ``Accept: application/x-ndjson``, les résultats sont envoyés
+    une ligne JSON par URL, une fois tous les téléchargements créés (une
+    déconnexion du client n'interrompt pas le lot). Le corps peut
+    dépasser DATA_UPLOAD_MAX_MEMORY_SIZE, jusqu'à
+    DOWNLOADER_BULK_MAX_BODY_SIZE.
+    """
+    max_size = getattr(settings, 'DOWNLOADER_BULK_MAX_BODY_SIZE', 10 * 1024 * 1024)
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > max_size:
+        return Response(
+            {'error': f'Corps de la requête trop volumineux (maximum {max_size} octets)'},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+    
     serializer = BulkDownloadSerializer(data=request.data)
-    if serializer.is_valid():
-        urls = serializer.validated_data['urls']
-        requested_quality = serializer.validated_data['requested_quality']
-        download_audio_only = serializer.validated_data['download_audio_only']
-        
-        # Créer les objets VideoDownload
-        downloads = []
-        for url in urls:
-            try:
-                create_serializer = VideoDownloadCreateSerializer(
-                    data={
-                        'source_url': url,
-                        'requested_quality': requested_quality,
-                        'download_audio_only': download_audio_only
-                    },
-                    context={'request': request}
-                )
-                if create_serializer.is_valid():
-                    download = create_serializer.save()
-                    downloads.append(download)
-            except Exception as e:
-                logger.error(f"Erreur lors de la création du téléchargement pour {url}: {e}")
-                continue
-        
-        if downloads:
-            # Lancer la tâche Celery pour le téléchargement en lot
-            download_ids = [str(d.id) for d in downloads]
-            try:
-                task = download_bulk_videos_task.delay(download_ids)
-                logger.info(f"Tâche de téléchargement en lot lancée: {task.id}")
-            except Exception as e:
-                logger.error(f"Erreur lors du lancement de la tâche en lot: {e}")
-            
-            # Retourner les détails des téléchargements créés
-            response_serializer = VideoDownloadListSerializer(downloads, many=True)
-            return Response({
-                'message': f'{len(downloads)} téléchargements créés',
-                'downloads': response_serializer.data
-            }, status=status.HTTP_201_CREATED)
-        else:
-            return Response({
-                'error': 'Aucun téléchargement valide créé'
-            }, status=status.HTTP_400_BAD_REQUEST)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    # Tout le lot est créé et lancé avant la réponse, même en NDJSON
+    results = list(create_bulk_downloads(
+        serializer.validated_data['urls'],
+        requested_quality=serializer.validated_data['requested_quality'],
+        download_audio_only=serializer.validated_data['download_audio_only'],
+        ip_address=VideoDownloadCreateSerializer().get_client_ip(request),
+        user_agent=request.META.get('HTTP_USER_AGENT', ''),
+    ))
+    
+    if request.accepted_renderer.format == 'ndjson':
+        lines = (json.dumps(result, cls=DjangoJSONEncoder) + '\n' for result in results)
+        return StreamingHttpResponse(lines, status=status.HTTP_201_CREATED, content_type='application/x-ndjson')
+    
+    created = sum(1 for result in results if result['status'] not in ['invalid', 'failed'])
+    if not created:
+        return Response({
+            'error': 'Aucun téléchargement valide créé',
+            'results': results
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'message': f'{created} téléchargements créés',
+        'results': results
+    }, status=status.HTTP_201_CREATED)
+
+
+def stats_pending_response():
+    """Réponse 503 quand le premier calcul d'une statistique n'est pas terminé"""
+    response = Response({'error': "Statistiques en cours de calcul, réessayez plus tard"},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = '1'
+    return response
 
 
 @swagger_auto_schema(
     method='get',
     operation_description="Récupère les statistiques agrégées de téléchargement",
     responses={
-        200: "Statistiques agrégées de téléchargement"
+        200: "Statistiques agrégées de téléchargement",
+        503: "Statistiques en cours de calcul"
     }
 )
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def download_stats(request):
-    """Statistiques agrégées de téléchargement"""
-    # Calculs des statistiques
-    total_downloads = VideoDownload.objects.count()
-    successful_downloads = VideoDownload.objects.filter(status='completed').count()
-    failed_downloads = VideoDownload.objects.filter(status='failed').count()
-    
-    success_rate = (successful_downloads / total_downloads * 100) if total_downloads > 0 else 0
-    
-    # Taille totale en GB
-    total_size_bytes = VideoDownload.objects.filter(
-        status='completed'
-    ).aggregate(total=Sum('file_size'))['total'] or 0
-    total_size_gb = total_size_bytes / (1024**3)
-    
-    # Plateforme la plus populaire
-    popular_platform = VideoDownload.objects.values(
-        'platform__display_name'
-    ).annotate(
-        count=Count('id')
-    ).order_by('-count').first()
-    
-    most_popular_platform = popular_platform['platform__display_name'] if popular_platform else 'Aucune'
-    
-    # Taille moyenne des fichiers
-    avg_file_size = VideoDownload.objects.filter(
-        status='completed',
-        file_size__isnull=False
-    ).aggregate(avg=Avg('file_size'))['avg'] or 0
-    avg_file_size_mb = avg_file_size / (1024**2)
-    
-    # Téléchargements des dernières 24h et 7 jours
-    now = timezone.now()
-    downloads_last_24h = VideoDownload.objects.filter(
-        created_at__gte=now - timedelta(days=1)
-    ).count()
-    
-    downloads_last_week = VideoDownload.objects.filter(
-        created_at__gte=now - timedelta(days=7)
-    ).count()
-    
-    stats = {
-        'total_downloads': total_downloads,
-        'successful_downloads': successful_downloads,
-        'failed_downloads': failed_downloads,
-        'success_rate': round(success_rate, 2),
-        'total_size_gb': round(total_size_gb, 2),
-        'most_popular_platform': most_popular_platform,
-        'avg_file_size_mb': round(avg_file_size_mb, 2),
-        'downloads_last_24h': downloads_last_24h,
-        'downloads_last_week': downloads_last_week,
-    }
-    
-    serializer = DownloadStatsAggregatedSerializer(stats)
+    """Statistiques agrégées de téléchargement (une requête, servies depuis le cache)"""
+    try:
+        serializer = DownloadStatsAggregatedSerializer(stats.download_stats())
+    except stats.StatsPending:
+        return stats_pending_response()
     return Response(serializer.data)
 
 
@@ -419,36 +571,64 @@ def download_stats(request):
                     }
                 )
             )
-        )
+        ),
+        503: "Statistiques en cours de calcul"
     }
 )
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def platform_stats(request):
-    """Statistiques par plateforme"""
-    platforms = Platform.objects.all()
-    stats = []
+    """Statistiques par plateforme (agrégats horaires, servies depuis le cache)"""
+    try:
+        return Response(stats.platform_stats())
+    except stats.StatsPending:
+        return stats_pending_response()
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="Téléchargements terminés par heure ou par jour (agrégats horaires)",
+    manual_parameters=[
+        openapi.Parameter('interval', openapi.IN_QUERY, description="Pas de temps", type=openapi.TYPE_STRING, enum=['hour', 'day']),
+        openapi.Parameter('since', openapi.IN_QUERY, description="Début (ISO 8601), par défaut 24 heures ou 30 jours avant la fin", type=openapi.TYPE_STRING),
+        openapi.Parameter('until', openapi.IN_QUERY, description="Fin (ISO 8601), par défaut maintenant", type=openapi.TYPE_STRING),
+        openapi.Parameter('platform', openapi.IN_QUERY, description="Nom de la plateforme", type=openapi.TYPE_STRING),
+    ],
+    responses={200: "Séries temporelles", 400: "Paramètres invalides"}
+)
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def stats_timeseries(request):
+    """Séries temporelles des téléchargements terminés"""
+    interval = request.query_params.get('interval', 'hour')
+    if interval not in TIMESERIES_STEPS:
+        return Response({'error': "interval doit valoir 'hour' ou 'day'"}, status=status.HTTP_400_BAD_REQUEST)
     
-    for platform in platforms:
-        downloads = VideoDownload.objects.filter(platform=platform)
-        total = downloads.count()
-        successful = downloads.filter(status='completed').count()
-        success_rate = (successful / total * 100) if total > 0 else 0
-        
-        avg_file_size = downloads.filter(
-            status='completed',
-            file_size__isnull=False
-        ).aggregate(avg=Avg('file_size'))['avg'] or 0
-        avg_file_size_mb = avg_file_size / (1024**2)
-        
-        stats.append({
-            'platform_name': platform.display_name,
-            'total_downloads': total,
-            'success_rate': round(success_rate, 2),
-            'avg_file_size_mb': round(avg_file_size_mb, 2)
-        })
+    bounds = {}
+    for name in ('since', 'until'):
+        value = request.query_params.get(name)
+        if value is None:
+            continue
+        parsed = parse_datetime(value)
+        if parsed is None:
+            return Response({'error': f"Date invalide pour {name}"}, status=status.HTTP_400_BAD_REQUEST)
+        bounds[name] = timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
     
-    return Response(stats)
+    step, default_span = TIMESERIES_STEPS[interval]
+    until = bounds.get('until') or timezone.now()
+    since = bounds.get('since') or until - default_span
+    max_points = getattr(settings, 'DOWNLOADER_TIMESERIES_MAX_POINTS', 1000)
+    if since >= until or (until - since) / step > max_points:
+        return Response(
+            {'error': f"Période invalide (au plus {max_points} points)"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    return Response({
+        'interval': interval,
+        'since': since,
+        'until': until,
+        'results': stats.timeseries(since, until, interval, request.query_params.get('platform')),
+    })
 
 
 @swagger_auto_schema(
@@ -466,13 +646,9 @@ def cancel_download(request, download_id):
     try:
         download = VideoDownload.objects.get(id=download_id)
         
-        if download.status in ['pending', 'processing']:
-            download.status = 'cancelled'
-            download.save()
-            
-            # TODO: Implémenter la logique pour arrêter la tâche Celery
-            # Cela nécessiterait de stocker l'ID de la tâche Celery
-            
+        # Arrête aussi la tâche Celery (revoke + drapeau lu par le worker)
+        if cancellation.cancel(download):
+            publish_download(download)
             return Response({'message': 'Téléchargement annulé'})
         else:
             return Response(
@@ -499,123 +675,132 @@ def cancel_download(request, download_id):
                     'status': openapi.Schema(type=openapi.TYPE_STRING),
                     'timestamp': openapi.Schema(type=openapi.TYPE_STRING),
                     'database': openapi.Schema(type=openapi.TYPE_STRING),
-                    'celery': openapi.Schema(type=openapi.TYPE_STRING)
+                    'celery': openapi.Schema(type=openapi.TYPE_STRING),
+                    'workers': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        properties={
+                            'worker': openapi.Schema(type=openapi.TYPE_STRING),
+                            'queues': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
+                            'concurrency': openapi.Schema(type=openapi.TYPE_INTEGER),
+                            'active': openapi.Schema(type=openapi.TYPE_INTEGER),
+                            'free_slots': openapi.Schema(type=openapi.TYPE_INTEGER),
+                            'timestamp': openapi.Schema(type=openapi.TYPE_NUMBER),
+                        }
+                    )),
+                    'free_slots': openapi.Schema(type=openapi.TYPE_INTEGER),
                 }
             )
-        )
+        ),
+        503: "Base de données indisponible"
     }
 )
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def health_check(request):
-    """Vérification de l'état de santé de l'API"""
+    """Vérification de l'état de santé de l'API
+
+    Ne contacte pas les workers : leur état est lu dans les battements
+    qu'ils publient dans Redis. La réponse est mise en cache quelques
+    secondes (DOWNLOADER_HEALTH_CACHE_TTL) dans chaque processus.
+    """
+    global _health_cache
+    now = time.monotonic()
+    if _health_cache and _health_cache[0] > now:
+        health_data, http_status = _health_cache[1]
+        return Response(health_data, status=http_status)
+
     # Vérifier la base de données
     try:
-        VideoDownload.objects.count()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
         db_status = 'connected'
-    except:
+    except Exception as e:
+        logger.error(f"Base de données indisponible: {e}")
         db_status = 'disconnected'
-    
-    # Vérifier Celery (optionnel)
+
+    # Vérifier les workers Celery (battements)
     try:
-        from celery import current_app
-        active_tasks = current_app.control.inspect().active()
-        celery_status = 'connected' if active_tasks is not None else 'disconnected'
-    except:
-        celery_status = 'disconnected'
-    
+        workers = [
+            {key: worker.get(key) for key in ('worker', 'queues', 'concurrency', 'active', 'free_slots', 'timestamp')}
+            for worker in heartbeats.live_workers()
+        ]
+        celery_status = 'connected' if workers else 'disconnected'
+    except Exception as e:
+        logger.warning(f"Battements des workers indisponibles: {e}")
+        workers = []
+        celery_status = 'unknown'
+
     health_data = {
-        'status': 'healthy',
+        'status': 'healthy' if db_status == 'connected' else 'unhealthy',
         'timestamp': timezone.now().isoformat(),
         'database': db_status,
-        'celery': celery_status
+        'celery': celery_status,
+        'workers': workers,
+        'free_slots': sum(worker['free_slots'] or 0 for worker in workers),
     }
-    
-    return Response(health_data)
+    http_status = status.HTTP_200_OK if db_status == 'connected' else status.HTTP_503_SERVICE_UNAVAILABLE
+    _health_cache = (now + getattr(settings, 'DOWNLOADER_HEALTH_CACHE_TTL', 2), (health_data, http_status))
+    return Response(health_data, status=http_status)
 
 
-@api_view(['POST'])
-def available_formats(request):
-    url = request.data.get('url')
+class FormatsPolicyView(APIView):
+    """Politique DRF (authentification, permissions, limites de débit, parseurs) de ``formats/``
+
+    ``available_formats`` est une vue asynchrone et ne peut pas être une
+    vue DRF : elle passe par cette vue pour appliquer les mêmes réglages
+    que le reste de l'API. Limite de débit propre possible via la portée
+    ``formats`` (ScopedRateThrottle).
+    """
+    throttle_scope = 'formats'
+
+
+def formats_request_data(request):
+    """Données de la requête, après les vérifications DRF (lève APIException)"""
+    view = FormatsPolicyView()
+    view.args, view.kwargs = (), {}
+    view.headers = {}
+    drf_request = view.initialize_request(request)
+    view.request = drf_request
+    view.initial(drf_request)
+    return drf_request.data
+
+
+@require_http_methods(['POST'])
+async def available_formats(request):
+    """Formats disponibles pour une URL (vidéo+audio, audio seul)
+
+    Vue asynchrone : l'extraction yt-dlp s'exécute dans un pool de
+    threads borné, avec un délai maximal et une limite par hôte (voir
+    ``discovery.discover_formats``), sans occuper de worker du serveur.
+    Nécessite un serveur ASGI pour ne pas bloquer. La protection CSRF de
+    Django s'applique ; authentification, permissions et limites de débit
+    suivent les réglages DRF (voir ``FormatsPolicyView``).
+    """
+    try:
+        data = await sync_to_async(formats_request_data)(request)
+    except exceptions.APIException as exc:
+        response = JsonResponse({'error': str(exc.detail)}, status=exc.status_code)
+        if isinstance(exc, exceptions.Throttled) and exc.wait is not None:
+            response['Retry-After'] = str(math.ceil(exc.wait))
+        return response
+    url = data.get('url') if hasattr(data, 'get') else None
     if not url:
-        return Response({'error': 'URL manquante'}, status=400)
+        return JsonResponse({'error': 'URL manquante'}, status=400)
     try:
-        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-            info = ydl.extract_info(url, download=False)
-            formats = info.get('formats', [])
-            # On cherche tous les formats vidéo (vcodec != 'none')
-            video_formats = [f for f in formats if f.get('vcodec') and f['vcodec'] != 'none']
-            audio_formats = [f for f in formats if f.get('acodec') and f['acodec'] != 'none' and (not f.get('vcodec') or f['vcodec'] == 'none')]
-            result = []
-            for vf in video_formats:
-                # Format combiné (déjà vidéo+audio)
-                if vf.get('acodec') and vf['acodec'] != 'none':
-                    result.append({
-                        'format_id': vf.get('format_id'),
-                        'ext': vf.get('ext'),
-                        'height': vf.get('height'),
-                        'width': vf.get('width'),
-                        'acodec': vf.get('acodec'),
-                        'vcodec': vf.get('vcodec'),
-                        'format_note': vf.get('format_note'),
-                        'filesize': vf.get('filesize'),
-                        'tbr': vf.get('tbr'),
-                        'fps': vf.get('fps'),
-                        'audio_only': False,
-                        'video_only': False,
-                        'format': vf.get('format'),
-                        'url': vf.get('url', vf.get('manifest_url')),
-                        'merge': False,
-                        'yt_dlp_format': vf.get('format_id'),
-                    })
-                # Format vidéo seul, on fusionne avec le meilleur audio
-                else:
-                    best_audio = None
-                    if audio_formats:
-                        # On prend le meilleur audio (par tbr ou filesize)
-                        best_audio = max(audio_formats, key=lambda af: af.get('tbr') or 0)
-                    if best_audio:
-                        yt_dlp_format = f"{vf.get('format_id')}+{best_audio.get('format_id')}"
-                        result.append({
-                            'format_id': f"{vf.get('format_id')}+{best_audio.get('format_id')}",
-                            'ext': vf.get('ext'),
-                            'height': vf.get('height'),
-                            'width': vf.get('width'),
-                            'acodec': best_audio.get('acodec'),
-                            'vcodec': vf.get('vcodec'),
-                            'format_note': vf.get('format_note'),
-                            'filesize': vf.get('filesize'),
-                            'tbr': vf.get('tbr'),
-                            'fps': vf.get('fps'),
-                            'audio_only': False,
-                            'video_only': False,
-                            'format': vf.get('format'),
-                            'url': None,
-                            'merge': True,
-                            'yt_dlp_format': yt_dlp_format,
-                        })
-            # Ajout des formats audio seuls
-            for af in audio_formats:
-                result.append({
-                    'format_id': af.get('format_id'),
-                    'ext': af.get('ext'),
-                    'height': None,
-                    'width': None,
-                    'acodec': af.get('acodec'),
-                    'vcodec': af.get('vcodec'),
-                    'format_note': af.get('format_note'),
-                    'filesize': af.get('filesize'),
-                    'tbr': af.get('tbr'),
-                    'fps': None,
-                    'audio_only': True,
-                    'video_only': False,
-                    'format': af.get('format'),
-                    'url': af.get('url', af.get('manifest_url')),
-                    'merge': False,
-                    'yt_dlp_format': af.get('format_id'),
-                })
-            # On trie par hauteur décroissante (résolution la plus haute en premier, puis audio_only à la fin)
-            result = sorted(result, key=lambda x: (x['audio_only'], -(x['height'] or 0) if x['height'] else 0))
-            return Response({'formats': result})
+        info = await discover_formats(url)
+    except FormatsBusy:
+        response = JsonResponse({'error': "Trop de récupérations de formats en cours, réessayez plus tard"}, status=503)
+        response['Retry-After'] = '5'
+        return response
+    except FormatsTimeout:
+        logger.warning(f"Délai dépassé lors de la récupération des formats: {url}")
+        return JsonResponse({'error': "La plateforme met trop de temps à répondre, réessayez plus tard"}, status=504)
     except Exception as e:
-        return Response({'error': str(e)}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({'formats': list_formats(info)})
+
+
+@require_http_methods(['GET'])
+def prometheus_metrics(request):
+    """Métriques du pipeline de téléchargement au format texte Prometheus (agrégées entre processus via Redis)"""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,3 +1,4 @@
+import json
 import requests
 import time
 
@@ -51,23 +52,38 @@ except Exception:
 if not download_id:
     exit(1)
 
-# 6. Vérifier le statut du téléchargement
-status_url = f'{BASE_URL}/downloads/{download_id}/status/'
-for i in range(10):
-    resp = requests.get(status_url)
-    try:
-        print(f'Statut tentative {i+1}:', resp.status_code, resp.json())
-        status = resp.json().get('status')
-        error_message = resp.json().get('error_message')
-    except Exception:
-        print(f'Statut tentative {i+1}:', resp.status_code, resp.text)
-        status = None
-        error_message = None
-    if status == 'completed':
-        break
-    if status == 'failed' and error_message and 'Requested format is not available' in error_message:
-        break
-    time.sleep(5)
+# 6. Suivre la progression via le flux SSE (repli sur le polling si indisponible)
+events_url = f'{BASE_URL}/downloads/{download_id}/events/'
+status = None
+try:
+    with requests.get(events_url, stream=True, timeout=(5, 60)) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data: '):
+                continue
+            event = json.loads(line[len('data: '):])
+            print('Progression:', event.get('status'), event.get('progress_percentage'))
+            status = event.get('status')
+            if status in ('completed', 'failed', 'cancelled'):
+                break
+except Exception as e:
+    print('Flux SSE indisponible, polling du statut:', e)
+    status_url = f'{BASE_URL}/downloads/{download_id}/status/'
+    for i in range(10):
+        resp = requests.get(status_url)
+        try:
+            print(f'Statut tentative {i+1}:', resp.status_code, resp.json())
+            status = resp.json().get('status')
+            error_message = resp.json().get('error_message')
+        except Exception:
+            print(f'Statut tentative {i+1}:', resp.status_code, resp.text)
+            status = None
+            error_message = None
+        if status == 'completed':
+            break
+        if status == 'failed' and error_message and 'Requested format is not available' in error_message:
+            break
+        time.sleep(5)
 
 # 7. Récupérer les infos du téléchargement (lien de téléchargement)
 detail_url = f'{BASE_URL}/downloads/{download_id}/'